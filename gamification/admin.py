@@ -1,8 +1,11 @@
 from django.contrib import admin
+from django.utils import timezone
+from . import inbox, ledger, seasons, settlement
 from .models import (
     Task, Prize, UserProfile, Battle, BattleType, BattleResult,
     PerformanceData, Notification, Purchase, TaskCompletion,
-    Group, Level, UserProgress
+    Group, Level, UserProgress, StarTransaction, StarBalanceSnapshot, ActivityRollup,
+    Season, SeasonStanding,
 )
 
 
@@ -19,6 +22,18 @@ class UserProfileAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'user__first_name', 'user__last_name')
     list_filter = ('group',)
 
+    def save_model(self, request, obj, form, change):
+        # Ручное изменение звёзд проводим через журнал как корректировку,
+        # остальные поля сохраняем, не перезаписывая текущий баланс
+        delta = obj.stars - (form.initial.get('stars') or 0)
+        if change:
+            obj.save(update_fields=[name for name in form.changed_data if name != 'stars'])
+        else:
+            obj.stars = 0
+            obj.save()
+        if delta:
+            ledger.apply(obj.user_id, delta, 'adjustment', note=f'Изменено в админке: {request.user}')
+
 
 @admin.register(Level)
 class LevelAdmin(admin.ModelAdmin):
@@ -43,7 +58,7 @@ class TaskAdmin(admin.ModelAdmin):
 
 @admin.register(Prize)
 class PrizeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'cost_in_stars', 'created_at')
+    list_display = ('name', 'cost_in_stars', 'stock', 'created_at')
     search_fields = ('name',)
 
 
@@ -55,10 +70,30 @@ class BattleTypeAdmin(admin.ModelAdmin):
 
 @admin.register(Battle)
 class BattleAdmin(admin.ModelAdmin):
-    list_display = ('name', 'battle_type', 'start_time', 'end_time', 'active')
-    list_filter = ('active', 'battle_type')
+    list_display = ('name', 'battle_type', 'start_time', 'end_time', 'active', 'settled_at')
+    list_filter = ('active', 'battle_type', ('settled_at', admin.EmptyFieldListFilter))
     filter_horizontal = ('participants',)
     date_hierarchy = 'start_time'
+    readonly_fields = ('settled_at',)
+    actions = ['settle_battles', 'announce_battles']
+
+    @admin.action(description="Подвести итоги выбранных батлов")
+    def settle_battles(self, request, queryset):
+        settled = [settlement.settle(battle_id) for battle_id in queryset.values_list('id', flat=True)]
+        count = sum(1 for result in settled if result is not None)
+        self.message_user(request, f"Подведено итогов: {count}")
+
+    @admin.action(description="Анонсировать выбранные батлы всем")
+    def announce_battles(self, request, queryset):
+        battles = list(queryset)
+        for battle in battles:
+            inbox.broadcast(
+                f"⚔️ Батл {battle.name}",
+                f"Начало {timezone.localtime(battle.start_time):%d.%m.%Y %H:%M}. Присоединяйтесь в разделе «Батлы»!",
+                battle=battle,
+                author=request.user,
+            )
+        self.message_user(request, f"Анонсировано батлов: {len(battles)}")
 
 
 @admin.register(BattleResult)
@@ -70,17 +105,29 @@ class BattleResultAdmin(admin.ModelAdmin):
 
 @admin.register(PerformanceData)
 class PerformanceDataAdmin(admin.ModelAdmin):
-    list_display = ('date_uploaded', 'processed')
-    list_filter = ('processed',)
+    list_display = (
+        'date_uploaded', 'kind', 'status', 'processed', 'rows_processed',
+        'attempts', 'duration', 'started_at', 'worker',
+    )
+    list_filter = ('status', 'kind', 'processed')
     date_hierarchy = 'date_uploaded'
+    readonly_fields = ('attempts', 'worker', 'rows_processed', 'started_at', 'heartbeat_at', 'finished_at', 'duration')
+    actions = ['retry_jobs']
+
+    @admin.action(description="Повторить выбранные задачи")
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status=PerformanceData.STATUS_RUNNING).update(
+            status=PerformanceData.STATUS_QUEUED, attempts=0, run_after=timezone.now()
+        )
+        self.message_user(request, f"Поставлено в очередь: {updated}")
 
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('title', 'created_at', 'is_active', 'battle')
-    list_filter = ('is_active',)
+    list_display = ('title', 'created_at', 'is_active', 'recipient', 'battle')
+    list_filter = ('is_active', ('recipient', admin.EmptyFieldListFilter))
     search_fields = ('title', 'message')
-    raw_id_fields = ('battle',)
+    raw_id_fields = ('battle', 'recipient')
 
 
 @admin.register(Purchase)
@@ -92,6 +139,65 @@ class PurchaseAdmin(admin.ModelAdmin):
 
 @admin.register(TaskCompletion)
 class TaskCompletionAdmin(admin.ModelAdmin):
-    list_display = ('task', 'user', 'completed_at', 'stars_awarded')
+    list_display = ('task', 'user', 'completed_at', 'period_key', 'stars_awarded')
     search_fields = ('user__username', 'task__title')
-    date_hierarchy = 'completed_at'
\ No newline at end of file
+    date_hierarchy = 'completed_at'
+
+
+@admin.register(StarTransaction)
+class StarTransactionAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'user', 'amount', 'source', 'note')
+    list_filter = ('source',)
+    search_fields = ('user__username', 'note')
+    date_hierarchy = 'created_at'
+    raw_id_fields = ('user',)
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StarBalanceSnapshot)
+class StarBalanceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('user', 'balance', 'last_transaction_id', 'taken_at')
+    search_fields = ('user__username',)
+    readonly_fields = ('user', 'balance', 'last_transaction_id', 'taken_at')
+
+
+@admin.register(ActivityRollup)
+class ActivityRollupAdmin(admin.ModelAdmin):
+    list_display = ('user', 'group', 'period', 'period_start', 'completions', 'stars_earned', 'stars_spent')
+    list_filter = ('period', 'group')
+    search_fields = ('user__username',)
+    date_hierarchy = 'period_start'
+    raw_id_fields = ('user',)
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Season)
+class SeasonAdmin(admin.ModelAdmin):
+    list_display = ('name', 'start_date', 'end_date', 'frozen_at')
+    list_filter = (('frozen_at', admin.EmptyFieldListFilter),)
+    readonly_fields = ('frozen_at',)
+    actions = ['freeze_seasons']
+
+    @admin.action(description="Зафиксировать места выбранных сезонов")
+    def freeze_seasons(self, request, queryset):
+        frozen = [seasons.freeze(season_id) for season_id in queryset.values_list('id', flat=True)]
+        count = sum(1 for result in frozen if result is not None)
+        self.message_user(request, f"Зафиксировано сезонов: {count}")
+
+
+@admin.register(SeasonStanding)
+class SeasonStandingAdmin(admin.ModelAdmin):
+    list_display = ('season', 'rank', 'user', 'group', 'stars')
+    list_filter = ('season', 'group')
+    search_fields = ('user__username',)
+    raw_id_fields = ('user',)
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -6,4 +6,5 @@ class GamificationConfig(AppConfig):
     name = 'gamification'
 
     def ready(self):
+        import gamification.checks
         import gamification.signals
\ No newline at end of file
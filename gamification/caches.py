@@ -0,0 +1,71 @@
+"""
+Файловый кеш версий для запуска без Redis.
+
+Версии кешей (см. ``caching.py``) должны меняться атомарно: два воркера,
+одновременно поднявшие одну версию, не должны записать одно и то же значение,
+а вытесненная версия сбрасывает все закешированные по ней данные. Обычный
+``FileBasedCache`` не годится: ``add`` и ``incr`` в нём — чтение и запись без
+блокировки, а при ``MAX_ENTRIES`` записи вытесняются случайно. Здесь все
+изменения идут под ``flock`` на файл блокировки каталога (процессы одной
+машины), а вытеснения нет: версий немного — по одной на справочник и на
+пользователя, — и каждая занимает один маленький файл.
+"""
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+LOCK_NAME = 'versions.lock'
+
+
+class VersionFileCache(FileBasedCache):
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._held = threading.local()
+
+    @contextmanager
+    def _exclusive(self):
+        """Блокировка каталога между процессами; повторный вход в потоке не блокирует"""
+        depth = getattr(self._held, 'depth', 0)
+        if depth:
+            self._held.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._held.depth -= 1
+            return
+        self._createdir()
+        with open(os.path.join(self._dir, LOCK_NAME), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._held.depth = 1
+            try:
+                yield
+            finally:
+                self._held.depth = 0
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _cull(self):
+        """Версии не вытесняются"""
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._exclusive():
+            return super().add(key, value, timeout, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._exclusive():
+            super().set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._exclusive():
+            return super().set_many(data, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._exclusive():
+            return super().incr(key, delta, version)
+
+    def delete(self, key, version=None):
+        with self._exclusive():
+            return super().delete(key, version)
@@ -0,0 +1,97 @@
+"""
+Версии кешей и кеширование страниц.
+
+Версия — счётчик в кеше Django, входящий в ключи закешированных данных:
+увеличив её, мы сбрасываем все такие ключи сразу во всех процессах,
+работающих с общим кешем. Версии хранятся в псевдониме ``versions`` (если он
+задан): там ``add`` и ``incr`` атомарны между процессами и нет вытеснения, так
+что одновременные изменения не теряются, а данные не сбрасываются без причины. Кроме общих версий есть версия каждого
+пользователя: её поднимают изменения звёзд, профиля и уведомлений, и она
+входит в ключи фрагментов шаблонов, зависящих от пользователя.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache, caches
+
+VERSIONS_ALIAS = 'versions'
+
+
+def store():
+    """Кеш версий; без псевдонима ``versions`` — общий кеш"""
+    return caches[VERSIONS_ALIAS] if VERSIONS_ALIAS in settings.CACHES else cache
+
+
+def get_version(key):
+    """
+    Текущая версия; пропавшая (удалена или вытеснена) начинается заново
+    с уникального значения, чтобы не вернуть ключи, закешированные при
+    какой-то из прежних версий.
+    """
+    versions = store()
+    version = versions.get(key)
+    if version is None:
+        initial = time.time_ns()
+        version = initial if versions.add(key, initial, None) else versions.get(key, initial)
+    return version
+
+
+def bump_version(key):
+    try:
+        return store().incr(key)
+    except ValueError:
+        return get_version(key)
+
+
+def get_versions(keys):
+    """Значения нескольких версий одним обращением к кешу"""
+    found = store().get_many(keys)
+    return tuple(found[key] if key in found else get_version(key) for key in keys)
+
+
+def bump_versions(keys):
+    """Сбрасывает сразу много версий (одна запись в кеш); значения не монотонны"""
+    if keys:
+        store().set_many(dict.fromkeys(keys, time.time_ns()), None)
+
+
+def user_version_key(user_id):
+    return f'user:{user_id}:version'
+
+
+def bump_user_versions(user_ids):
+    bump_versions([user_version_key(user_id) for user_id in set(user_ids)])
+
+
+def cached_view(timeout, versions=()):
+    """
+    Кеширует ответы анонимным посетителям.
+
+    Ключ — полный путь с параметрами и текущие значения версий ``versions``.
+    Ответы с cookie (сессия, CSRF, сообщения) и не-200 не кешируются, а
+    посетитель с непоказанными сообщениями получает свежую страницу.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (
+                request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated
+                or len(messages.get_messages(request))
+            ):
+                return view(request, *args, **kwargs)
+
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            version = '.'.join(str(value) for value in get_versions(list(versions)))
+            key = f'view:{view.__module__}.{view.__name__}:{path}:{version}'
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming and not response.cookies:
+                    cache.set(key, response, timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,117 @@
+"""
+Кеш справочников: задания, призы, уровни, типы батлов и закрытые сезоны.
+
+Справочники меняются только через админку, а читаются на каждой странице,
+поэтому хранятся уже сериализованными (списки словарей) в двух уровнях:
+в памяти процесса и в общем для всех процессов кеше Django (Redis или файлы
+в ``CACHE_DIR``, см. ``CACHES`` в настройках).
+Ключ включает версию справочника; сохранение или удаление записи поднимает
+версию после коммита, и все процессы перечитывают данные при следующем
+обращении. В установившемся режиме чтение справочника не делает запросов
+к БД. Счётчики попаданий и промахов процесса возвращает ``stats()``.
+"""
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import get_version, bump_version
+from .models import Task, Prize, Level, BattleType, Season
+
+
+def _tasks():
+    return list(Task.objects.order_by('id').values('id', 'title', 'description', 'stars_reward', 'task_type'))
+
+
+def _prizes():
+    prizes = list(Prize.objects.order_by('id').values('id', 'name', 'description', 'cost_in_stars', 'stock'))
+    for prize in prizes:
+        prize['in_stock'] = prize['stock'] is None or prize['stock'] > 0
+    return prizes
+
+
+def _levels():
+    return list(Level.objects.values_list('id', 'group_id', 'name', 'stars_required', 'bonus_stars'))
+
+
+def _battle_types():
+    return {
+        row['id']: row
+        for row in BattleType.objects.values('id', 'name', 'description', 'stars_reward')
+    }
+
+
+def _seasons():
+    return list(
+        Season.objects.filter(frozen_at__isnull=False)
+        .order_by('-start_date')
+        .values('id', 'name', 'start_date', 'end_date')
+    )
+
+
+LOADERS = {
+    'tasks': _tasks,
+    'prizes': _prizes,
+    'levels': _levels,
+    'battle_types': _battle_types,
+    'seasons': _seasons,
+}
+MODELS = {
+    Task: 'tasks',
+    Prize: 'prizes',
+    Level: 'levels',
+    BattleType: 'battle_types',
+    Season: 'seasons',
+}
+
+_lock = threading.Lock()
+_local = {}  # name -> (version, data)
+_stats = Counter()
+
+
+def _version_key(name):
+    return f'catalog:{name}:version'
+
+
+def version(name):
+    return get_version(_version_key(name))
+
+
+def get(name):
+    """Справочник name; данные общие для всех вызывающих, изменять их нельзя"""
+    current = version(name)
+    with _lock:
+        entry = _local.get(name)
+        if entry is not None and entry[0] == current:
+            _stats[f'{name}:local_hit'] += 1
+            return entry[1]
+
+    key = f'catalog:{name}:{current}'
+    data = cache.get(key)
+    if data is None:
+        data = LOADERS[name]()
+        cache.set(key, data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 3600))
+        outcome = 'miss'
+    else:
+        outcome = 'shared_hit'
+    with _lock:
+        _local[name] = (current, data)
+        _stats[f'{name}:{outcome}'] += 1
+    return data
+
+
+def invalidate(name):
+    bump_version(_version_key(name))
+
+
+def invalidate_model(model):
+    name = MODELS.get(model)
+    if name is not None:
+        invalidate(name)
+
+
+def stats():
+    """{'tasks:local_hit': N, 'tasks:shared_hit': N, 'tasks:miss': N, ...} этого процесса"""
+    with _lock:
+        return dict(_stats)
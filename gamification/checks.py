@@ -0,0 +1,29 @@
+"""Проверки настроек, без которых кеши расходятся между процессами"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+from .caching import VERSIONS_ALIAS
+
+# Бэкенды, где add и incr атомарны для всех процессов, а записи без срока не вытесняются
+ATOMIC_VERSION_BACKENDS = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+    'gamification.caches.VersionFileCache',
+)
+
+
+@register()
+def version_cache(app_configs, **kwargs):
+    alias = VERSIONS_ALIAS if VERSIONS_ALIAS in settings.CACHES else 'default'
+    backend = settings.CACHES[alias]['BACKEND']
+    if backend in ATOMIC_VERSION_BACKENDS:
+        return []
+    return [Warning(
+        f'Версии кешей хранятся в {backend} (псевдоним {alias!r})',
+        hint=(
+            'Одновременные изменения версий могут теряться, а версии — вытесняться: '
+            f'задайте псевдоним {VERSIONS_ALIAS!r} с одним из бэкендов: {", ".join(ATOMIC_VERSION_BACKENDS)}'
+        ),
+        id='gamification.W001',
+    )]
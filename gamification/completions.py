@@ -0,0 +1,61 @@
+"""
+Выполнение заданий.
+
+Каждое выполнение относится к периоду задания: день для ежедневных,
+ISO-неделя для еженедельных и ``once`` для разовых. Уникальный индекс
+``(user, task, period_key)`` не даёт засчитать задание дважды за период даже
+при параллельных запросах: вставка строки и начисление звёзд идут в одной
+транзакции, а проигравший гонку запрос получает уже существующую запись.
+Ключ запроса из формы отличает повтор той же отправки (двойной клик,
+обновление страницы) от новой попытки.
+"""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import inbox, ledger
+from .models import TaskCompletion
+
+PERIOD_MESSAGES = {
+    'daily': 'Вы уже выполнили это задание сегодня',
+    'weekly': 'Вы уже выполнили это задание на этой неделе',
+    'one_time': 'Вы уже выполнили это задание',
+}
+
+
+def period_key(task_type, day):
+    """Ключ периода задания для даты day"""
+    if task_type == 'one_time':
+        return 'once'
+    if task_type == 'weekly':
+        year, week, _ = day.isocalendar()
+        return f'{year}-W{week:02d}'
+    return day.isoformat()
+
+
+def complete(user, task, request_key='', now=None):
+    """Засчитывает задание; возвращает (выполнение, создано ли оно сейчас)"""
+    key = period_key(task.task_type, timezone.localdate(now))
+    try:
+        with transaction.atomic():
+            completion = TaskCompletion.objects.create(
+                task=task,
+                user=user,
+                period_key=key,
+                request_key=request_key[:64],
+                stars_awarded=task.stars_reward,
+            )
+            ledger.apply(user.id, task.stars_reward, 'task', note=task.title)
+    except IntegrityError:
+        return TaskCompletion.objects.get(task=task, user=user, period_key=key), False
+
+    inbox.notify(
+        user.id,
+        "✅ Задание выполнено!",
+        f"Вы получили {task.stars_reward} ⭐ за задание '{task.title}'",
+    )
+    return completion, True
+
+
+def is_replay(completion, request_key):
+    """Та же отправка формы, что создала выполнение"""
+    return bool(request_key) and completion.request_key == request_key[:64]
@@ -0,0 +1,22 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import inbox
+from .caching import get_versions, user_version_key
+from .signals import GROUPS_VERSION_KEY
+
+
+def notifications(request):
+    """
+    Данные шапки: счётчик непрочитанных и последние уведомления (из кеша).
+
+    Шапка кешируется фрагментом по ``header_version``, поэтому сводка
+    входящих считается лениво — только когда фрагмент нужно перерисовать.
+    """
+    if not request.user.is_authenticated:
+        return {}
+    user = request.user
+    versions = get_versions([user_version_key(user.id), inbox.BROADCAST_VERSION_KEY, GROUPS_VERSION_KEY])
+    return {
+        'inbox': SimpleLazyObject(lambda: inbox.summary(user)),
+        'header_version': '.'.join(str(value) for value in versions),
+    }
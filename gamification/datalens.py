@@ -0,0 +1,212 @@
+"""
+Клиент Yandex Cloud: IAM-токен сервисного аккаунта и выгрузка CSV из DataLens.
+
+IAM-токен живёт час, поэтому он кешируется в памяти процесса и в кеше Django
+и обновляется заранее, за ``IAM_TOKEN_REFRESH_MARGIN`` секунд до истечения.
+Обновление выполняет только один поток/процесс одновременно. Все запросы идут
+через общую ``requests.Session`` с пулом keep-alive соединений.
+"""
+import os
+import json
+import time
+import threading
+
+import jwt
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+
+from . import metrics
+
+IAM_TOKEN_URL = 'https://iam.api.cloud.yandex.net/iam/v1/tokens'
+DATALENS_EXPORT_URL = 'https://datalens.api.cloud.yandex.net/api/datalens/v1/dashboards/{dashboard_id}/export?format=csv'
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Общая сессия процесса; после fork создаётся заново"""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=getattr(settings, 'DATALENS_POOL_SIZE', 10),
+                max_retries=Retry(
+                    total=2,
+                    backoff_factor=0.5,
+                    status_forcelist=(502, 503, 504),
+                    allowed_methods=frozenset(['GET', 'POST']),
+                ),
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def _load_key():
+    key_json = os.getenv('YANDEX_CLOUD_SERVICE_ACCOUNT_KEY')
+    if not key_json:
+        raise Exception("YANDEX_CLOUD_SERVICE_ACCOUNT_KEY должна быть настроена в переменных окружения")
+
+    try:
+        return json.loads(key_json)
+    except json.JSONDecodeError:
+        raise Exception("Неверный формат ключа в переменной окружения")
+
+
+def _sign_jwt(key_data):
+    now = int(time.time())
+    payload = {
+        'iss': key_data['service_account_id'],
+        'aud': IAM_TOKEN_URL,
+        'iat': now,
+        'exp': now + 3600
+    }
+
+    headers = {
+        'kid': key_data['id']
+    }
+
+    return jwt.encode(payload, key_data['private_key'], algorithm='PS256', headers=headers)
+
+
+class IamTokenProvider:
+    """Кеширующий поставщик IAM-токена с обновлением до истечения"""
+    CACHE_KEY = 'datalens:iam_token'
+    LOCK_KEY = 'datalens:iam_token:lock'
+
+    def __init__(self, refresh_margin=None, lock_timeout=30):
+        self.refresh_margin = refresh_margin
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+
+    def _margin(self):
+        if self.refresh_margin is not None:
+            return self.refresh_margin
+        return getattr(settings, 'IAM_TOKEN_REFRESH_MARGIN', 300)
+
+    def _fresh(self, expires_at):
+        return expires_at - time.time() > self._margin()
+
+    def _valid(self):
+        return self._token is not None and self._expires_at > time.time()
+
+    def _store(self, token, expires_at):
+        self._token, self._expires_at = token, expires_at
+        return token
+
+    def _from_cache(self):
+        cached = cache.get(self.CACHE_KEY)
+        if cached and self._fresh(cached['expires_at']):
+            return self._store(cached['token'], cached['expires_at'])
+        return None
+
+    def _fetch(self):
+        url = getattr(settings, 'YANDEX_IAM_TOKEN_URL', IAM_TOKEN_URL)
+        started = time.perf_counter()
+        try:
+            response = get_session().post(url, json={'jwt': _sign_jwt(_load_key())}, timeout=10)
+        except requests.RequestException:
+            metrics.IAM_TOKEN_FETCH.observe(time.perf_counter() - started, status='error')
+            raise
+        metrics.IAM_TOKEN_FETCH.observe(time.perf_counter() - started, status=response.status_code)
+        if response.status_code != 200:
+            raise Exception(f'Ошибка получения IAM-токена: {response.status_code} - {response.text}')
+        data = response.json()
+        expires = parse_datetime(data.get('expiresAt') or '')
+        expires_at = expires.timestamp() if expires else time.time() + 3600
+        cache.set(
+            self.CACHE_KEY,
+            {'token': data['iamToken'], 'expires_at': expires_at},
+            timeout=max(int(expires_at - time.time()), 1),
+        )
+        return self._store(data['iamToken'], expires_at)
+
+    def get_token(self):
+        if self._token is not None and self._fresh(self._expires_at):
+            return self._token
+        with self._lock:
+            if self._token is not None and self._fresh(self._expires_at):
+                return self._token
+            token = self._from_cache()
+            if token:
+                return token
+
+            # Межпроцессная блокировка: токен обновляет только один воркер
+            if cache.add(self.LOCK_KEY, os.getpid(), self.lock_timeout):
+                try:
+                    return self._fetch()
+                finally:
+                    cache.delete(self.LOCK_KEY)
+
+            # Токен уже обновляет другой процесс; старый пока действителен
+            if self._valid():
+                return self._token
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.2)
+                token = self._from_cache()
+                if token:
+                    return token
+            return self._fetch()
+
+    def invalidate(self):
+        with self._lock:
+            self._token, self._expires_at = None, 0.0
+            cache.delete(self.CACHE_KEY)
+
+
+token_provider = IamTokenProvider()
+
+
+def get_iam_token():
+    """
+    Получение IAM-токена с использованием JSON-ключа из переменной окружения
+    """
+    return token_provider.get_token()
+
+
+def export_url():
+    dashboard_id = os.getenv('DATALENS_DASHBOARD_ID')
+    if not dashboard_id:
+        raise Exception("DATALENS_DASHBOARD_ID не установлена в переменных окружения")
+    template = getattr(settings, 'DATALENS_EXPORT_URL', DATALENS_EXPORT_URL)
+    return template.format(dashboard_id=dashboard_id)
+
+
+def open_export():
+    """Открывает потоковый ответ с CSV-выгрузкой дашборда"""
+    url = export_url()
+    for attempt in range(2):
+        headers = {
+            'Authorization': f'Bearer {get_iam_token()}',
+            'Content-Type': 'application/json'
+        }
+        response = get_session().get(url, headers=headers, timeout=30, stream=True)
+        if response.status_code == 401 and attempt == 0:
+            # Токен отозван раньше срока — получаем новый и повторяем
+            response.close()
+            token_provider.invalidate()
+            continue
+        break
+    if response.status_code != 200:
+        with response:
+            raise Exception(f'Ошибка при получении данных: {response.status_code} - {response.text}')
+    if response.encoding is None:
+        response.encoding = 'utf-8'
+    return response
+
+
+def iter_export_lines(response, chunk_size=64 * 1024):
+    """Строки CSV по мере получения, без загрузки всего ответа в память"""
+    return response.iter_lines(chunk_size=chunk_size, decode_unicode=True)
@@ -0,0 +1,146 @@
+"""
+Пакетный импорт данных эффективности из CSV DataLens.
+
+CSV читается потоково и обрабатывается чанками: пользователи чанка ищутся
+одним запросом, звёзды начисляются через ``ledger.apply_bulk``, уведомления
+создаются пачкой через ``inbox.notify_many``. Формат строки: username,completed_tasks,quality_score.
+
+Каждый чанк фиксируется своей транзакцией, поэтому упавшая задача при
+повторе читает выгрузку сначала. Операции журнала помечаются задачей
+(``job_id``): звёзды, уже начисленные ей в прошлых попытках, вычитаются из
+строк пользователя по порядку, и повтор дозачисляет только остаток.
+"""
+import csv
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Sum
+
+from . import inbox, ledger, metrics
+from .models import StarTransaction
+
+CHUNK_SIZE = 1000
+
+
+@dataclass
+class ImportSummary:
+    """
+    Итоги импорта: rows и skipped считают строки CSV, processed,
+    already_credited и unknown_users — пользователей (строки одного
+    пользователя в чанке суммируются)
+    """
+    processed: int = 0
+    skipped: int = 0         # некорректные строки
+    unknown_users: int = 0   # username не найден или у пользователя нет профиля
+    already_credited: int = 0
+    total_stars: int = 0
+    rows: int = 0
+    started: float = field(default_factory=time.monotonic)
+    duration: float = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.duration if self.duration else 0.0
+
+
+def stars_for(tasks, quality):
+    return int(tasks) + int(quality) // 2
+
+
+def _parse_chunk(rows, summary):
+    """Звёзды по username; одинаковые username в чанке суммируются"""
+    amounts = {}
+    for row in rows:
+        summary.rows += 1
+        if len(row) < 3:
+            summary.skipped += 1
+            continue
+        username, tasks, quality = row[0].strip(), row[1], row[2]
+        try:
+            stars = stars_for(tasks, quality)
+        except ValueError:
+            summary.skipped += 1
+            continue
+        amounts[username] = amounts.get(username, 0) + stars
+    return amounts
+
+
+def credited_by(job_id):
+    """{user_id: звёзды}, начисленные задачей job_id в прошлых попытках"""
+    if job_id is None:
+        return {}
+    return dict(
+        StarTransaction.objects.filter(job_id=job_id)
+        .values('user_id')
+        .annotate(total=Sum('amount'))
+        .values_list('user_id', 'total')
+    )
+
+
+def _apply_chunk(amounts, summary, credited, job_id):
+    users = {
+        username: (user_id, f'{first_name} {last_name}'.strip() or username)
+        for user_id, username, first_name, last_name in User.objects.filter(
+            username__in=amounts
+        ).values_list('id', 'username', 'first_name', 'last_name')
+    }
+    by_user, resumed = {}, 0
+    for name, stars in amounts.items():
+        if name not in users:
+            continue
+        user_id = users[name][0]
+        already = min(stars, credited.get(user_id, 0))
+        if already:
+            credited[user_id] -= already
+            if already == stars:
+                resumed += 1
+                continue
+        by_user[user_id] = stars - already
+    names = {user_id: display for user_id, display in users.values()}
+
+    with transaction.atomic():
+        changes = ledger.apply_bulk(by_user, 'import', job_id=job_id)
+        inbox.notify_many([
+            (
+                change.user_id,
+                "⭐ Звёзды начислены!",
+                f"{names[change.user_id]} получил {change.amount} ⭐ за эффективность!",
+            )
+            for change in changes
+        ])
+
+    # Пользователи без профиля не попадают в changes — они тоже неизвестны
+    summary.processed += len(changes)
+    summary.already_credited += resumed
+    summary.total_stars += sum(change.amount for change in changes)
+    summary.unknown_users += len(amounts) - len(changes) - resumed
+
+
+def import_rows(lines, chunk_size=CHUNK_SIZE, progress=None, job_id=None):
+    """Импортирует строки CSV (первая строка — заголовок), возвращает ImportSummary"""
+    summary = ImportSummary()
+    credited = credited_by(job_id)
+    reader = csv.reader(lines)
+    next(reader, None)  # пропускаем заголовок
+
+    while True:
+        rows = list(islice(reader, chunk_size))
+        if not rows:
+            break
+        amounts = _parse_chunk(rows, summary)
+        if amounts:
+            _apply_chunk(amounts, summary, credited, job_id)
+        if progress is not None:
+            progress(summary)
+
+    summary.duration = time.monotonic() - summary.started
+    metrics.IMPORT_ROWS.inc(summary.rows)
+    metrics.IMPORT_SKIPPED.inc(summary.skipped)
+    metrics.IMPORT_UNKNOWN_USERS.inc(summary.unknown_users)
+    metrics.IMPORT_USERS.inc(summary.processed)
+    metrics.IMPORT_DURATION.observe(summary.duration)
+    metrics.flush()
+    return summary
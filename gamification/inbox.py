@@ -0,0 +1,160 @@
+"""
+Входящие уведомления пользователей.
+
+Личные уведомления (``Notification.recipient``) сразу попадают во входящие
+получателя. Рассылки (``recipient is None``) хранятся один раз и разносятся
+по входящим при чтении: пачкой новых рассылок после ``InboxState``.
+Счётчик непрочитанных и последние уведомления для шапки берутся из кеша;
+ключ включает версию рассылок, поэтому новая рассылка сбрасывает его всем.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .caching import get_version, bump_version, bump_user_versions
+from .models import Notification, InboxItem, InboxState
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+BROADCAST_VERSION_KEY = 'inbox:broadcast_version'
+SUMMARY_TIMEOUT = 300
+FANOUT_BATCH = 500
+BACKFILL_DAYS = 30  # сколько дней старых рассылок получает новый пользователь
+PAGE_SIZE = 20
+RECENT_SIZE = 5
+
+
+def _summary_key(user_id):
+    return f'inbox:summary:{user_id}:{get_version(BROADCAST_VERSION_KEY)}'
+
+
+def forget(*user_ids):
+    version = get_version(BROADCAST_VERSION_KEY)
+    cache.delete_many([f'inbox:summary:{user_id}:{version}' for user_id in user_ids])
+    bump_user_versions(user_ids)
+
+
+def broadcast_changed():
+    """Сбрасывает кеш входящих у всех пользователей"""
+    bump_version(BROADCAST_VERSION_KEY)
+
+
+def notify(user_id, title, message, battle=None):
+    """Личное уведомление пользователю"""
+    return notify_many([(user_id, title, message)], battle=battle)[0]
+
+
+def notify_many(items, battle=None):
+    """Личные уведомления пачкой: items — [(user_id, title, message)]"""
+    if not items:
+        return []
+    notifications = [
+        Notification(recipient_id=user_id, title=title, message=message, battle=battle, is_active=True)
+        for user_id, title, message in items
+    ]
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Notification.objects.bulk_create(notifications, batch_size=FANOUT_BATCH)
+        else:
+            for notification in notifications:
+                notification.save()
+        InboxItem.objects.bulk_create(
+            [
+                InboxItem(user_id=n.recipient_id, notification_id=n.id, created_at=n.created_at)
+                for n in notifications
+            ],
+            batch_size=FANOUT_BATCH,
+        )
+    transaction.on_commit(lambda: forget(*{n.recipient_id for n in notifications}))
+    return notifications
+
+
+def broadcast(title, message, battle=None, author=None):
+    """Рассылка всем; по входящим разносится при чтении"""
+    return Notification.objects.create(title=title, message=message, battle=battle, author=author, is_active=True)
+
+
+def sync(user):
+    """
+    Разносит во входящие пользователя рассылки, появившиеся с прошлого раза.
+
+    Без новых рассылок ничего не пишет: иначе каждый просмотр входящих был бы
+    записью и закреплял пользователя за основной БД (``ReplicaMiddleware``).
+    """
+    last_seen = InboxState.objects.filter(user=user).values_list('last_broadcast_id', flat=True).first()
+    broadcasts = Notification.objects.filter(recipient__isnull=True, is_active=True)
+    if last_seen is None:
+        broadcasts = broadcasts.filter(created_at__gte=timezone.now() - timedelta(days=BACKFILL_DAYS))
+
+    last_id = last_seen or 0
+    while True:
+        batch = list(broadcasts.filter(id__gt=last_id).order_by('id').values_list('id', 'created_at')[:FANOUT_BATCH])
+        if not batch:
+            break
+        InboxItem.objects.bulk_create(
+            [InboxItem(user=user, notification_id=nid, created_at=created_at) for nid, created_at in batch],
+            ignore_conflicts=True,
+        )
+        last_id = batch[-1][0]
+
+    if last_id == (last_seen or 0):
+        return
+    if last_seen is None:
+        InboxState.objects.get_or_create(user=user, defaults={'last_broadcast_id': last_id})
+    InboxState.objects.filter(user=user, last_broadcast_id__lt=last_id).update(last_broadcast_id=last_id)
+
+
+def _items(user):
+    return InboxItem.objects.filter(user=user, notification__is_active=True)
+
+
+def summary(user):
+    """{'unread': N, 'recent': [...]} для шапки сайта, из кеша"""
+    key = _summary_key(user.id)
+    data = cache.get(key)
+    if data is None:
+        sync(user)
+        items = _items(user)
+        data = {
+            'unread': items.filter(is_read=False).count(),
+            'recent': list(items.values('notification__title', 'created_at')[:RECENT_SIZE]),
+        }
+        cache.set(key, data, SUMMARY_TIMEOUT)
+    return data
+
+
+def encode_cursor(item):
+    micros = (item.created_at - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}-{item.id}'
+
+
+def decode_cursor(cursor):
+    """(created_at, id) из курсора; ValueError для любого некорректного курсора"""
+    try:
+        micros, item_id = (int(part) for part in cursor.split('-'))
+        created_at = EPOCH + timedelta(microseconds=micros)
+    except (ValueError, OverflowError) as e:
+        raise ValueError(f'Некорректный курсор: {cursor!r}') from e
+    return created_at, item_id
+
+
+def page(user, cursor=None, limit=PAGE_SIZE):
+    """Страница входящих (новые сверху) и курсор следующей страницы"""
+    sync(user)
+    items = _items(user).select_related('notification', 'notification__battle')
+    if cursor:
+        created_at, item_id = decode_cursor(cursor)
+        items = items.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=item_id))
+    items = list(items[:limit + 1])
+    next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return items[:limit], next_cursor
+
+
+def mark_read(user, items):
+    unread = [item.id for item in items if not item.is_read]
+    if unread:
+        InboxItem.objects.filter(user=user, id__in=unread).update(is_read=True)
+        forget(user.id)
+    return unread
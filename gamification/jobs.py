@@ -0,0 +1,169 @@
+"""
+Фоновая очередь задач на базе ``PerformanceData``.
+
+Представление ставит задачу в очередь и сразу отвечает, а процессы
+``manage.py run_workers`` забирают задачи условным UPDATE (без внешнего
+брокера), выполняют их, пишут прогресс и результат в ``notes`` и повторяют
+упавшие задачи с экспоненциальной задержкой.
+
+Пока задача выполняется, отдельный поток воркера обновляет ``heartbeat_at``.
+В очередь возвращаются только задачи без сигнала дольше
+``JOB_HEARTBEAT_TIMEOUT``, а итог записывается условно — только если задача
+всё ещё числится за этим воркером и этой попыткой.
+"""
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from . import datalens
+from .importer import import_rows
+from .models import PerformanceData
+
+RETRY_BASE_DELAY = 30  # секунд, удваивается с каждой попыткой
+HEARTBEAT_INTERVAL = 30  # секунд между сигналами живого воркера
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def enqueue(kind, user=None):
+    return PerformanceData.objects.create(kind=kind, requested_by=user)
+
+
+def claim(worker):
+    """Забирает первую готовую задачу; конкурирующие воркеры её не получат"""
+    now = timezone.now()
+    candidates = PerformanceData.objects.filter(
+        status=PerformanceData.STATUS_QUEUED, run_after__lte=now
+    ).order_by('run_after', 'id').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        claimed = PerformanceData.objects.filter(id=job_id, status=PerformanceData.STATUS_QUEUED).update(
+            status=PerformanceData.STATUS_RUNNING,
+            worker=worker,
+            started_at=now,
+            heartbeat_at=now,
+            finished_at=None,
+            duration=None,
+            rows_processed=0,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return PerformanceData.objects.get(id=job_id)
+    return None
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи воркеров, которые перестали подавать сигнал (умерли)"""
+    timeout = getattr(settings, 'JOB_HEARTBEAT_TIMEOUT', 4 * HEARTBEAT_INTERVAL)
+    return PerformanceData.objects.filter(
+        status=PerformanceData.STATUS_RUNNING,
+        heartbeat_at__lt=timezone.now() - timedelta(seconds=timeout),
+    ).update(status=PerformanceData.STATUS_QUEUED, notes='Воркер не завершил задачу, повторный запуск')
+
+
+def _claimed(job):
+    """Задача, пока она числится за этим воркером и этой попыткой"""
+    return PerformanceData.objects.filter(
+        id=job.id, status=PerformanceData.STATUS_RUNNING, worker=job.worker, attempts=job.attempts
+    )
+
+
+class Heartbeat:
+    """Поток, обновляющий heartbeat_at задачи, пока она выполняется"""
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = interval or getattr(settings, 'JOB_HEARTBEAT_INTERVAL', HEARTBEAT_INTERVAL)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                _claimed(self.job).update(heartbeat_at=timezone.now())
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def _run_import(job):
+    def progress(summary):
+        PerformanceData.objects.filter(id=job.id).update(rows_processed=summary.rows)
+
+    with datalens.open_export() as response:
+        summary = import_rows(datalens.iter_export_lines(response), progress=progress, job_id=job.id)
+    job.rows_processed = summary.rows
+    resumed = f'Начислено в прошлых попытках: {summary.already_credited}. ' if summary.already_credited else ''
+    return (f'Обработано: {summary.processed} пользователей, '
+            f'начислено {summary.total_stars} звёзд. '
+            f'{resumed}'
+            f'Неизвестных пользователей: {summary.unknown_users}. '
+            f'Пропущено строк: {summary.skipped} из {summary.rows}. '
+            f'Скорость: {summary.rows_per_sec:.0f} строк/с')
+
+
+def _run_test(job):
+    with datalens.open_export() as response:
+        size = len(response.text)
+    return f'✅ Подключение к DataLens успешно! Получено {size} символов данных'
+
+
+HANDLERS = {
+    PerformanceData.KIND_IMPORT: _run_import,
+    PerformanceData.KIND_TEST: _run_test,
+}
+
+
+def run(job):
+    started = time.monotonic()
+    try:
+        with Heartbeat(job):
+            notes = HANDLERS[job.kind](job)
+    except Exception as e:
+        job.notes = f'Попытка {job.attempts}: {e}'
+        if job.attempts < job.max_attempts:
+            job.status = PerformanceData.STATUS_QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = PerformanceData.STATUS_FAILED
+    else:
+        job.notes = notes
+        job.status = PerformanceData.STATUS_DONE
+        job.processed = True
+    job.finished_at = timezone.now()
+    job.duration = time.monotonic() - started
+    # Задачу, возвращённую в очередь за молчание, уже ведёт другой воркер — его итог не затираем
+    _claimed(job).update(**{
+        field: getattr(job, field)
+        for field in ('notes', 'status', 'processed', 'run_after', 'finished_at', 'duration', 'rows_processed')
+    })
+    return job
+
+
+def work(poll_interval=2.0, once=False):
+    """Цикл воркера: забрать задачу, выполнить, при пустой очереди подождать"""
+    worker = worker_name()
+    while True:
+        requeue_stale()
+        job = claim(worker)
+        if job is not None:
+            run(job)
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
@@ -0,0 +1,255 @@
+"""
+Материализованная таблица лидеров.
+
+Каждый процесс держит в памяти отсортированный индекс ``(-stars, user_id)``
+для общей таблицы и для каждой группы. Индекс строится из БД одним запросом,
+а затем поддерживается инкрементально при каждом изменении звёзд, поэтому
+топ-N, «моё место» и таблицы групп отдаются бинарным поиском без сортировки
+всех профилей на каждый запрос.
+
+Индекс — список корзин не длиннее ``2 * RankIndex.LOAD`` ключей и дерево
+Фенвика над их длинами: обновление стоит O(log n + LOAD) (сдвиг внутри одной
+корзины), место — O(log n). Обновления видит только процесс, где они
+произошли; остальные перестраивают индекс из БД не реже раза в
+``LEADERBOARD_MAX_AGE`` секунд или сразу после ``invalidate()``.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from .caching import get_version, bump_version
+
+VERSION_KEY = 'leaderboard:version'
+# Меняется при любом изменении звёзд или состава: входит в ключ кеша страницы лидеров
+STANDINGS_VERSION_KEY = 'leaderboard:standings'
+
+
+@dataclass
+class LeaderboardEntry:
+    """Строка таблицы лидеров"""
+    rank: int
+    user_id: int
+    stars: int
+    user: object = None
+
+
+class _Fenwick:
+    """Префиксные суммы длин корзин"""
+
+    def __init__(self, sizes):
+        self._tree = [0] * (len(sizes) + 1)
+        for i, size in enumerate(sizes):
+            self.add(i, size)
+
+    def add(self, i, delta):
+        i += 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i):
+        """Сумма первых i длин"""
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+class RankIndex:
+    """Отсортированный индекс одной таблицы (общей или групповой)"""
+    LOAD = 500  # корзина делится пополам, когда вырастает вдвое
+
+    def __init__(self):
+        self._buckets = []  # корзины ключей (-stars, user_id) по возрастанию
+        self._maxes = []    # последний ключ каждой корзины
+        self._sizes = _Fenwick([])
+        self._stars = {}    # user_id -> stars
+
+    def __len__(self):
+        return len(self._stars)
+
+    def _reindex(self):
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+        self._sizes = _Fenwick([len(bucket) for bucket in self._buckets])
+
+    def _insert(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._reindex()
+            return
+        i = min(bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[i]
+        insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        self._sizes.add(i, 1)
+        if len(bucket) > 2 * self.LOAD:
+            self._buckets[i:i + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self._reindex()
+
+    def _remove(self, key):
+        i = bisect_left(self._maxes, key)
+        bucket = self._buckets[i]
+        del bucket[bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+            self._sizes.add(i, -1)
+        else:
+            del self._buckets[i]
+            self._reindex()
+
+    def _position(self, key):
+        """Число ключей меньше key"""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            return len(self)
+        return self._sizes.prefix(i) + bisect_left(self._buckets[i], key)
+
+    def set(self, user_id, stars):
+        old = self._stars.get(user_id)
+        if old == stars:
+            return
+        if old is not None:
+            self._remove((-old, user_id))
+        self._insert((-stars, user_id))
+        self._stars[user_id] = stars
+
+    def discard(self, user_id):
+        old = self._stars.pop(user_id, None)
+        if old is not None:
+            self._remove((-old, user_id))
+
+    def stars(self, user_id):
+        return self._stars.get(user_id)
+
+    def rank(self, user_id):
+        """Место пользователя; при равенстве звёзд места делятся (1, 1, 3)"""
+        stars = self._stars.get(user_id)
+        if stars is None:
+            return None
+        return self._position((-stars,)) + 1
+
+    def top(self, limit):
+        entries = []
+        rank = 0
+        prev = None
+        position = 0
+        for bucket in self._buckets:
+            for neg_stars, user_id in bucket:
+                if position == limit:
+                    return entries
+                position += 1
+                if neg_stars != prev:
+                    rank, prev = position, neg_stars
+                entries.append(LeaderboardEntry(rank=rank, user_id=user_id, stars=-neg_stars))
+        return entries
+
+
+class Leaderboard:
+    """Общая таблица лидеров и таблицы групп одного процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._global = RankIndex()
+        self._groups = {}       # group_id -> RankIndex
+        self._user_group = {}   # user_id -> group_id
+        self.built_at = None
+        self.version = None
+
+    def __len__(self):
+        return len(self._global)
+
+    def _index(self, group_id):
+        return self._global if group_id is None else self._groups.get(group_id)
+
+    def record(self, user_id, group_id, stars):
+        with self._lock:
+            old_group = self._user_group.get(user_id)
+            if old_group is not None and old_group != group_id:
+                self._groups[old_group].discard(user_id)
+            self._global.set(user_id, stars)
+            self._user_group[user_id] = group_id
+            if group_id is not None:
+                self._groups.setdefault(group_id, RankIndex()).set(user_id, stars)
+
+    def remove(self, user_id):
+        with self._lock:
+            group_id = self._user_group.pop(user_id, None)
+            if group_id is not None:
+                self._groups[group_id].discard(user_id)
+            self._global.discard(user_id)
+
+    def top(self, limit=10, group_id=None):
+        with self._lock:
+            index = self._index(group_id)
+            return index.top(limit) if index is not None else []
+
+    def rank(self, user_id, group_id=None):
+        """Возвращает (место, звёзды, размер таблицы) или None"""
+        with self._lock:
+            index = self._index(group_id)
+            if index is None or index.stars(user_id) is None:
+                return None
+            return index.rank(user_id), index.stars(user_id), len(index)
+
+    def load(self, rows):
+        """Полная перестройка из итератора (user_id, group_id, stars)"""
+        fresh = Leaderboard()
+        for user_id, group_id, stars in rows:
+            fresh.record(user_id, group_id, stars)
+        with self._lock:
+            self._global = fresh._global
+            self._groups = fresh._groups
+            self._user_group = fresh._user_group
+            self.built_at = time.monotonic()
+
+
+_board = Leaderboard()
+
+
+def _profile_rows():
+    from .models import UserProfile
+    return UserProfile.objects.values_list('user_id', 'group_id', 'stars').iterator(chunk_size=2000)
+
+
+def rebuild():
+    """Перестраивает индекс процесса из БД"""
+    _board.version = get_version(VERSION_KEY)
+    _board.load(_profile_rows())
+    return _board
+
+
+def invalidate():
+    """Заставляет все процессы с общим кешем перестроить индекс"""
+    bump_version(VERSION_KEY)
+    standings_changed()
+
+
+def standings_changed():
+    bump_version(STANDINGS_VERSION_KEY)
+
+
+def get_leaderboard():
+    """Индекс процесса; перестраивается при устаревании или смене версии"""
+    max_age = getattr(settings, 'LEADERBOARD_MAX_AGE', 30)
+    if (
+        _board.built_at is None
+        or time.monotonic() - _board.built_at > max_age
+        or get_version(VERSION_KEY) != _board.version
+    ):
+        rebuild()
+    return _board
+
+
+def record(user_id, group_id, stars):
+    """Инкрементальное обновление; до первой сборки индекса ничего не делает"""
+    if _board.built_at is not None:
+        _board.record(user_id, group_id, stars)
+
+
+def remove(user_id):
+    if _board.built_at is not None:
+        _board.remove(user_id)
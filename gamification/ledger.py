@@ -0,0 +1,114 @@
+"""
+Журнал звёзд.
+
+Каждое изменение баланса записывается в ``StarTransaction`` и применяется к
+``UserProfile.stars`` атомарным ``UPDATE ... SET stars = stars + x``, поэтому
+параллельные воркеры не теряют начисления. ``UserProfile.stars`` остаётся
+текущим балансом (чтение одной строки), а ``StarBalanceSnapshot`` хранит
+контрольные точки, от которых сверка суммирует только свежие операции.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.dispatch import Signal
+
+from .models import UserProfile, StarTransaction, StarBalanceSnapshot
+
+# Отправляется после коммита с аргументом changes: list[StarChange].
+# Ошибка получателя пишется в лог и не превращает уже проведённую операцию в ошибку.
+stars_changed = Signal()
+
+
+class InsufficientStars(Exception):
+    """Списание больше текущего баланса"""
+
+
+@dataclass(frozen=True)
+class StarChange:
+    user_id: int
+    group_id: int
+    stars: int
+    amount: int
+    source: str
+
+
+def apply(user_id, amount, source, note=''):
+    """Начисляет (amount > 0) или списывает (amount < 0) звёзды пользователю"""
+    with transaction.atomic():
+        profiles = UserProfile.objects.filter(user_id=user_id)
+        debit = profiles.filter(stars__gte=-amount) if amount < 0 else profiles
+        if not debit.update(stars=F('stars') + amount):
+            if amount < 0 and profiles.exists():
+                raise InsufficientStars(f'Недостаточно звёзд для списания {-amount}')
+            raise UserProfile.DoesNotExist(f'Профиль пользователя {user_id} не найден')
+        StarTransaction.objects.create(user_id=user_id, amount=amount, source=source, note=note[:255])
+        stars, group_id = profiles.values_list('stars', 'group_id').get()
+
+    change = StarChange(user_id=user_id, group_id=group_id, stars=stars, amount=amount, source=source)
+    transaction.on_commit(lambda: stars_changed.send(sender=StarTransaction, changes=[change]), robust=True)
+    return change
+
+
+def apply_bulk(amounts, source, note='', job_id=None):
+    """
+    Пакетное изменение балансов: amounts — {user_id: amount}.
+
+    Пользователи группируются по сумме, и каждая группа обновляется одним
+    ``UPDATE ... SET stars = stars + amount``; операции журнала пишутся одним
+    bulk_create. Возвращает список StarChange; пользователи без профиля
+    пропускаются. job_id помечает операции задачей импорта.
+    """
+    amounts = {user_id: amount for user_id, amount in amounts.items() if amount}
+    if not amounts:
+        return []
+    by_amount = defaultdict(list)
+    for user_id, amount in amounts.items():
+        by_amount[amount].append(user_id)
+
+    with transaction.atomic():
+        updated = {}
+        for amount, user_ids in by_amount.items():
+            profiles = UserProfile.objects.filter(user_id__in=user_ids)
+            if amount < 0:
+                profiles = profiles.filter(stars__gte=-amount)
+            updated[amount] = profiles.update(stars=F('stars') + amount)
+        rows = list(UserProfile.objects.filter(user_id__in=amounts).values_list('user_id', 'group_id', 'stars'))
+        found = {user_id for user_id, group_id, stars in rows}
+        for amount, user_ids in by_amount.items():
+            if amount < 0 and updated[amount] != len(found.intersection(user_ids)):
+                raise InsufficientStars(f'Недостаточно звёзд для списания {-amount}')
+        StarTransaction.objects.bulk_create(
+            [
+                StarTransaction(user_id=user_id, amount=amounts[user_id], source=source, note=note[:255], job_id=job_id)
+                for user_id in found
+            ],
+            batch_size=500,
+        )
+
+    changes = [
+        StarChange(user_id=user_id, group_id=group_id, stars=stars, amount=amounts[user_id], source=source)
+        for user_id, group_id, stars in rows
+    ]
+    transaction.on_commit(lambda: stars_changed.send(sender=StarTransaction, changes=changes), robust=True)
+    return changes
+
+
+def ledger_balances(user_ids, upto=None):
+    """Баланс по журналу: снимок плюс операции после него (до upto включительно)"""
+    snapshots = {s.user_id: s for s in StarBalanceSnapshot.objects.filter(user_id__in=user_ids)}
+    balances = {}
+    by_cut = defaultdict(list)
+    for user_id in user_ids:
+        snapshot = snapshots.get(user_id)
+        balances[user_id] = snapshot.balance if snapshot else 0
+        by_cut[snapshot.last_transaction_id if snapshot else 0].append(user_id)
+
+    for cut, cut_user_ids in by_cut.items():
+        rows = StarTransaction.objects.filter(user_id__in=cut_user_ids, id__gt=cut)
+        if upto is not None:
+            rows = rows.filter(id__lte=upto)
+        for row in rows.values('user_id').annotate(total=Sum('amount')).order_by():
+            balances[row['user_id']] += row['total']
+    return balances
@@ -0,0 +1,143 @@
+"""
+Движок уровней.
+
+Пороги уровней каждой группы держатся в памяти процесса отсортированными
+по ``stars_required`` и перестраиваются при смене версии справочника уровней
+(``catalog``), в том числе после изменений в других процессах. Уровень находится бинарным поиском,
+а прогресс пачки пользователей пересчитывается одним проходом: с учётом
+перескока через несколько уровней и бонусов, которые сами могут поднять
+уровень ещё выше.
+"""
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from . import catalog, inbox, ledger
+from .models import UserProfile, UserProgress
+
+
+@dataclass(frozen=True)
+class LevelInfo:
+    id: int
+    name: str
+    stars_required: int
+    bonus_stars: int
+
+
+class LevelTable:
+    """Отсортированные пороги уровней одной группы"""
+
+    def __init__(self, levels):
+        self.levels = sorted(levels, key=lambda level: (level.stars_required, level.id))
+        self.thresholds = [level.stars_required for level in self.levels]
+        self.by_id = {level.id: level for level in self.levels}
+
+    def index_for(self, stars):
+        """Индекс наивысшего достигнутого уровня или -1"""
+        return bisect_right(self.thresholds, stars) - 1
+
+    def level_for(self, stars):
+        index = self.index_for(stars)
+        return self.levels[index] if index >= 0 else None
+
+    def next_after(self, level):
+        """Следующий уровень после level (или первый, если level is None)"""
+        index = self.levels.index(level) + 1 if level is not None and level.id in self.by_id else 0
+        return self.levels[index] if index < len(self.levels) else None
+
+
+_lock = threading.Lock()
+_tables = None
+_version = None
+
+
+def _build(rows):
+    by_group = {}
+    for level_id, group_id, name, stars_required, bonus_stars in rows:
+        by_group.setdefault(group_id, []).append(LevelInfo(level_id, name, stars_required, bonus_stars))
+    return {group_id: LevelTable(levels) for group_id, levels in by_group.items()}
+
+
+def tables():
+    global _tables, _version
+    version = catalog.version('levels')
+    with _lock:
+        if _tables is None or version != _version:
+            _tables, _version = _build(catalog.get('levels')), version
+        return _tables
+
+
+def table_for(group_id):
+    return tables().get(group_id) if group_id else None
+
+
+def invalidate():
+    global _tables
+    with _lock:
+        _tables = None
+    catalog.invalidate('levels')
+
+
+def advance(table, current_level_id, stars):
+    """
+    Новый уровень и сумма бонусов для пользователя со звёздами stars.
+
+    Награждаются только уровни выше текущего; понижения нет, поэтому
+    повторно бонус за уже пройденный уровень не начисляется.
+    """
+    current = table.by_id.get(current_level_id)
+    reached = table.index_for(current.stars_required) if current else -1
+    bonus = 0
+    while True:
+        index = table.index_for(stars + bonus)
+        if index <= reached:
+            break
+        bonus += sum(level.bonus_stars for level in table.levels[reached + 1:index + 1])
+        reached = index
+    new_level = table.levels[reached] if reached >= 0 else None
+    return new_level, bonus
+
+
+def apply_changes(changes):
+    """Пересчитывает прогресс пачки пользователей после изменения звёзд"""
+    latest = {change.user_id: change for change in changes}
+    if not latest:
+        return
+
+    promoted = defaultdict(list)  # level_id -> [user_id]
+    bonuses = {}
+    level_ups = []
+    with transaction.atomic():
+        # Строки прогресса создаёт provisioning вместе с пользователем
+        current = UserProgress.objects.select_for_update().filter(user_id__in=latest).values_list('user_id', 'current_level_id')
+        for user_id, current_level_id in current:
+            change = latest[user_id]
+            table = table_for(change.group_id)
+            if table is None:
+                continue
+            new_level, bonus = advance(table, current_level_id, change.stars)
+            if new_level is not None and new_level.id != current_level_id:
+                promoted[new_level.id].append(user_id)
+                level_ups.append((user_id, new_level, bonus))
+                if bonus:
+                    bonuses[user_id] = bonus
+
+        for level_id, user_ids in promoted.items():
+            UserProgress.objects.filter(user_id__in=user_ids).update(current_level_id=level_id)
+        # Бонусы проводятся одной пачкой; их stars_changed сюда не возвращается
+        ledger.apply_bulk(bonuses, 'level_bonus')
+        UserProgress.objects.filter(user_id__in=latest).update(
+            stars_earned=Subquery(UserProfile.objects.filter(user_id=OuterRef('user_id')).values('stars')[:1])
+        )
+        inbox.notify_many([
+            (
+                user_id,
+                f"🎉 Достижение уровня {level.name}!",
+                f"Поздравляем! Вы достигли уровня '{level.name}' и получили {bonus} ⭐ бонуса!",
+            )
+            for user_id, level, bonus in level_ups
+        ])
@@ -0,0 +1,193 @@
+"""
+Живое табло батла (Server-Sent Events, нужен ASGI-сервер).
+
+Каждый процесс держит свой хаб: по каналу на батл, у которого есть
+подписчики. Изменение ``BattleResult`` только помечает канал «грязным»;
+задача канала не чаще раза в ``LIVE_COALESCE_INTERVAL`` секунд читает топ
+батла одним запросом и раздаёт один и тот же снимок всем подписчикам, поэтому
+число запросов к БД не зависит от числа зрителей. У каждого подписчика
+очередь на одно сообщение: медленный клиент получает только последний снимок.
+
+Изменения, сделанные в других процессах, сигналом сюда не приходят, поэтому
+канал дополнительно перечитывает топ раз в ``LIVE_POLL_INTERVAL`` секунд и
+рассылает его, только если он изменился.
+
+Поток включается настройкой ``LIVE_STREAMING`` и только для запросов,
+пришедших через ASGI. Иначе страница раз в ``LIVE_CLIENT_POLL_INTERVAL``
+секунд запрашивает JSON-снимок (``snapshot``), который кешируется до
+изменения результатов батлов.
+
+    LIVE_STREAMING=1 gunicorn mysite.asgi:application -k uvicorn.workers.UvicornWorker
+"""
+import asyncio
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DatabaseError
+
+from .models import BattleResult
+
+TOP_SIZE = 10
+KEEPALIVE = 15
+RETRY_MS = 3000
+SNAPSHOT_TIMEOUT = 60
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def streaming(request):
+    """Можно ли отдать запросу поток: включено настройкой и запрос пришёл через ASGI"""
+    return _setting('LIVE_STREAMING', False) and isinstance(request, ASGIRequest)
+
+
+def scoreboard(battle_id, limit=TOP_SIZE):
+    """Топ батла с местами (при равенстве счёта места делятся)"""
+    rows = (
+        BattleResult.objects.filter(battle_id=battle_id)
+        .order_by('-score', 'user_id')
+        .values_list('user_id', 'user__username', 'user__first_name', 'user__last_name', 'score')[:limit]
+    )
+    results = []
+    prev_score = None
+    for number, (user_id, username, first_name, last_name, score) in enumerate(rows, start=1):
+        if score != prev_score:
+            position, prev_score = number, score
+        results.append({
+            'user_id': user_id,
+            'user': f'{first_name} {last_name}'.strip() or username,
+            'score': score,
+            'position': position,
+        })
+    return results
+
+
+def _payload(battle_id, results):
+    return json.dumps({'battle': battle_id, 'results': results, 'ts': time.time()}, ensure_ascii=False)
+
+
+def snapshot(battle_id, version):
+    """JSON-снимок табло для опроса; version — версия результатов батлов"""
+    key = f'live:snapshot:{battle_id}:{version}'
+    payload = cache.get(key)
+    if payload is None:
+        payload = _payload(battle_id, scoreboard(battle_id))
+        cache.set(key, payload, SNAPSHOT_TIMEOUT)
+    return payload
+
+
+class Channel:
+    """Подписчики одного батла и задача, рассылающая им снимки"""
+
+    def __init__(self, battle_id):
+        self.battle_id = battle_id
+        self.subscribers = set()
+        self.dirty = asyncio.Event()
+        self.results = None
+        self.payload = None
+        self.task = None
+
+
+def _offer(queue, payload):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(payload)
+
+
+class Hub:
+    """Pub/sub процесса: публиковать можно из любого потока"""
+
+    def __init__(self):
+        self._channels = {}
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def publish(self, battle_id):
+        with self._lock:
+            loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._mark_dirty, battle_id)
+
+    def _mark_dirty(self, battle_id):
+        channel = self._channels.get(battle_id)
+        if channel is not None:
+            channel.dirty.set()
+
+    def subscribe(self, battle_id):
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+        channel = self._channels.get(battle_id)
+        if channel is None:
+            channel = self._channels[battle_id] = Channel(battle_id)
+            channel.task = asyncio.create_task(self._run(channel))
+        queue = asyncio.Queue(maxsize=1)
+        channel.subscribers.add(queue)
+        if channel.payload is not None:
+            queue.put_nowait(channel.payload)
+        return queue
+
+    def unsubscribe(self, battle_id, queue):
+        channel = self._channels.get(battle_id)
+        if channel is None:
+            return
+        channel.subscribers.discard(queue)
+        if not channel.subscribers:
+            channel.task.cancel()
+            del self._channels[battle_id]
+
+    def subscriber_count(self, battle_id=None):
+        if battle_id is not None:
+            channel = self._channels.get(battle_id)
+            return len(channel.subscribers) if channel else 0
+        return sum(len(channel.subscribers) for channel in self._channels.values())
+
+    async def _run(self, channel):
+        load = sync_to_async(scoreboard)
+        while True:
+            try:
+                results = await load(channel.battle_id)
+            except DatabaseError:
+                # Подписчики остаются на прошлом снимке до следующей попытки
+                results = channel.results
+            if results != channel.results:
+                channel.results = results
+                channel.payload = _payload(channel.battle_id, results)
+                for queue in channel.subscribers:
+                    _offer(queue, channel.payload)
+            try:
+                await asyncio.wait_for(channel.dirty.wait(), _setting('LIVE_POLL_INTERVAL', 2.0))
+            except asyncio.TimeoutError:
+                pass
+            # Изменения, пришедшие за интервал, попадут в один снимок
+            await asyncio.sleep(_setting('LIVE_COALESCE_INTERVAL', 0.5))
+            channel.dirty.clear()
+
+
+hub = Hub()
+
+
+async def stream(battle_id, timeout=None):
+    """SSE-поток снимков табло; через timeout секунд клиент переподключается"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (timeout or _setting('LIVE_STREAM_TIMEOUT', 300))
+    queue = hub.subscribe(battle_id)
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                payload = await asyncio.wait_for(queue.get(), min(KEEPALIVE, remaining))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+            else:
+                yield f'data: {payload}\n\n'
+    finally:
+        hub.unsubscribe(battle_id, queue)
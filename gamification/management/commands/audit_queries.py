@@ -0,0 +1,112 @@
+import json
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from gamification.models import Group, Level, Task, Prize, BattleType, Battle
+from gamification.urls import urlpatterns
+
+# Справочники из десятков строк: их полное чтение дешевле любого индекса
+SMALL_MODELS = (Group, Level, Task, Prize, BattleType)
+# Поток SSE не завершается, выход сбросил бы сессию для следующих страниц
+SKIPPED_VIEWS = {'battle_live', 'logout'}
+POST_VIEWS = {'complete_task', 'purchase_prize', 'join_battle', 'import_data', 'test_datalens'}
+EXPLAINED = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b', re.IGNORECASE)
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?! USING)')
+
+
+def _kwargs():
+    now = timezone.now()
+    task = Task.objects.order_by('id').first()
+    prize = Prize.objects.order_by('cost_in_stars', 'id').first()
+    upcoming = Battle.objects.filter(start_time__gt=now).order_by('start_time').first() or Battle.objects.first()
+    return {
+        'complete_task': {'task_id': task.id if task else 0},
+        'purchase_prize': {'prize_id': prize.id if prize else 0},
+        'join_battle': {'battle_id': upcoming.id if upcoming else 0},
+    }
+
+
+def _host():
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if '*' not in host]
+    return hosts[0] if hosts else 'localhost'
+
+
+def full_scans(sql):
+    """Таблицы, которые план запроса читает целиком"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            scanned = [match.group(1) for *_, detail in cursor.fetchall() if (match := SQLITE_SCAN.match(detail))]
+            # Подзапросы (например, окно для срезов в prefetch) — не таблицы
+            tables = set(connection.introspection.table_names(cursor))
+            return [name for name in scanned if name in tables]
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            nodes, tables = [plan[0]['Plan']], []
+            while nodes:
+                node = nodes.pop()
+                if node['Node Type'] == 'Seq Scan':
+                    tables.append(node['Relation Name'])
+                nodes.extend(node.get('Plans', ()))
+            return tables
+    raise CommandError(f'EXPLAIN для {connection.vendor} не поддерживается')
+
+
+class Command(BaseCommand):
+    help = (
+        'Открывает каждую страницу gamification от имени пользователя, выполняет EXPLAIN '
+        'для всех её запросов и завершается с ошибкой, если какой-то запрос читает таблицу целиком. '
+        'Запускайте на БД с данными боевого объёма (например, после seed); все изменения откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Пользователь (по умолчанию — первый сотрудник)')
+        parser.add_argument('--allow', action='append', default=[], help='Таблица, полное чтение которой допустимо')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(username=options['username']) if options['username'] else User.objects.filter(is_staff=True)
+        user = users.order_by('id').first()
+        if user is None:
+            raise CommandError('Нет пользователя для обхода страниц; задайте --username')
+        allowed = {model._meta.db_table for model in SMALL_MODELS} | set(options['allow'])
+
+        problems = 0
+        # Отдельный кеш: страницы строятся «с холода», а общий кеш не видит откатываемых данных
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'audit'}}):
+            with transaction.atomic():
+                kwargs = _kwargs()
+                client = Client(HTTP_HOST=_host())
+                client.force_login(user)
+                for pattern in urlpatterns:
+                    name = pattern.name
+                    if name in SKIPPED_VIEWS:
+                        continue
+                    url = reverse(f'gamification:{name}', kwargs=kwargs.get(name, {}))
+                    with CaptureQueriesContext(connection) as queries:
+                        (client.post if name in POST_VIEWS else client.get)(url)
+                    statements = list(dict.fromkeys(q['sql'] for q in queries.captured_queries if EXPLAINED.match(q['sql'])))
+                    flagged = [
+                        (sql, tables) for sql in statements
+                        if (tables := [table for table in full_scans(sql) if table not in allowed])
+                    ]
+                    problems += len(flagged)
+                    status = self.style.ERROR('SCAN') if flagged else self.style.SUCCESS('ok')
+                    self.stdout.write(f'{status} {name}: запросов {len(statements)}')
+                    for sql, tables in flagged:
+                        self.stdout.write(f'    {", ".join(tables)}: {sql[:300]}')
+                transaction.set_rollback(True)
+
+        if problems:
+            raise CommandError(f'Запросов с полным чтением таблиц: {problems}')
+        self.stdout.write(self.style.SUCCESS('Все запросы используют индексы'))
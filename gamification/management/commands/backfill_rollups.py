@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from gamification import leaderboard, rollups
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает агрегаты активности (день, неделя, месяц) по журналу звёзд пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=rollups.BACKFILL_CHUNK, help='Операций журнала в пачке')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(processed, upto):
+            self.stdout.write(f'Обработано операций: {processed} (до #{upto})')
+
+        processed = rollups.backfill(options['chunk_size'], progress)
+        # Лидеры за период показываются на кешируемой странице лидеров
+        leaderboard.standings_changed()
+        self.stdout.write(self.style.SUCCESS(
+            f'Агрегаты перестроены по {processed} операциям за {time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+
+from gamification import ledger, purchases
+from gamification.ledger import ledger_balances
+from gamification.models import Prize, Purchase, UserProfile
+
+PREFIX = 'bench_buyer_'
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочная проверка покупок: N покупателей одновременно покупают ограниченный приз; '
+        'проверяет, что баланс не уходит в минус и склад не продаётся сверх остатка'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=300, help='Количество одновременных покупателей')
+        parser.add_argument('--attempts', type=int, default=5, help='Попыток покупки на покупателя')
+        parser.add_argument('--affordable', type=int, default=3, help='Сколько покупок по карману каждому')
+        parser.add_argument('--stock', type=int, default=500, help='Остаток приза')
+        parser.add_argument('--cost', type=int, default=10, help='Цена приза в звёздах')
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовые данные')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'БД: {connection.vendor} ({connection.settings_dict["NAME"]})')
+        users, prize = self.setup(options)
+        try:
+            outcomes, elapsed = self.run(users, prize, options)
+            self.report(outcomes, elapsed)
+            self.verify(users, prize, options, outcomes)
+        finally:
+            if not options['keep']:
+                User.objects.filter(id__in=[user.id for user in users]).delete()
+                prize.delete()
+
+    def setup(self, options):
+        User.objects.filter(username__startswith=PREFIX).delete()
+        users = User.objects.bulk_create([User(username=f'{PREFIX}{i}') for i in range(options['buyers'])])
+        if not users[0].pk:
+            users = list(User.objects.filter(username__startswith=PREFIX).order_by('id'))
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+        budget = options['cost'] * options['affordable']
+        ledger.apply_bulk({user.id: budget for user in users}, 'adjustment', note='bench_purchases')
+        prize = Prize.objects.create(name='Бенчмарк покупок', cost_in_stars=options['cost'], stock=options['stock'])
+        return users, prize
+
+    def run(self, users, prize, options):
+        outcomes = Counter()
+        lock = threading.Lock()
+        start = threading.Barrier(len(users))
+
+        def buyer(user):
+            start.wait()
+            try:
+                for _ in range(options['attempts']):
+                    try:
+                        purchases.purchase(user, prize)
+                        outcome = 'ok'
+                    except ledger.InsufficientStars:
+                        outcome = 'insufficient'
+                    except purchases.OutOfStock:
+                        outcome = 'out_of_stock'
+                    except DatabaseError as exc:
+                        outcome = f'error: {exc}'
+                    with lock:
+                        outcomes[outcome] += 1
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(users)) as pool:
+            list(pool.map(buyer, users))
+        return outcomes, time.perf_counter() - started
+
+    def report(self, outcomes, elapsed):
+        attempts = sum(outcomes.values())
+        self.stdout.write(f'Попыток: {attempts} за {elapsed:.2f} с ({attempts / elapsed:.0f}/с)')
+        for outcome, count in sorted(outcomes.items()):
+            self.stdout.write(f'  {outcome}: {count}')
+
+    def verify(self, users, prize, options, outcomes):
+        user_ids = [user.id for user in users]
+        sold = Purchase.objects.filter(prize=prize).count()
+        stock = Prize.objects.values_list('stock', flat=True).get(id=prize.id)
+        stars = dict(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', 'stars'))
+        balances = ledger_balances(user_ids)
+        expected_sold = min(options['stock'], options['buyers'] * min(options['attempts'], options['affordable']))
+
+        problems = []
+        if sold != outcomes['ok']:
+            problems.append(f'покупок в БД {sold}, успешных ответов {outcomes["ok"]}')
+        if stock != options['stock'] - sold:
+            problems.append(f'остаток {stock}, ожидался {options["stock"] - sold}')
+        if any(value < 0 for value in stars.values()):
+            problems.append('отрицательный баланс')
+        if stars != balances:
+            problems.append('баланс профилей расходится с журналом')
+        if sum(stars.values()) != options['cost'] * options['affordable'] * len(users) - sold * options['cost']:
+            problems.append('сумма списаний не равна стоимости покупок')
+        if not any(outcome.startswith('error') for outcome in outcomes) and sold != expected_sold:
+            problems.append(f'продано {sold}, ожидалось {expected_sold}')
+        if problems:
+            raise CommandError('; '.join(problems))
+        self.stdout.write(self.style.SUCCESS(f'Проверка пройдена: продано {sold}, остаток {stock}'))
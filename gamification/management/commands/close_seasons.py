@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from gamification import leaderboard, seasons
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт текущий сезон таблицы лидеров и фиксирует места закончившихся сезонов '
+        '(запускайте раз в сутки, например из cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('season_ids', nargs='*', type=int, help='Id сезонов (по умолчанию — все закончившиеся)')
+
+    def handle(self, *args, **options):
+        current = seasons.ensure_current()
+        self.stdout.write(f'Текущий сезон: {current.name} ({current.start_date:%d.%m.%Y}–{current.end_date:%d.%m.%Y})')
+
+        season_ids = options['season_ids'] or seasons.due()
+        if not season_ids:
+            self.stdout.write('Нет сезонов для фиксации')
+            return
+
+        started = time.perf_counter()
+        outcomes = [seasons.freeze(season_id) for season_id in season_ids]
+        frozen = [outcome for outcome in outcomes if outcome is not None]
+        # Список сезонов показывается на кешируемой странице лидеров
+        leaderboard.standings_changed()
+        self.stdout.write(self.style.SUCCESS(
+            f'Зафиксировано сезонов: {len(frozen)} из {len(season_ids)}, '
+            f'мест {sum(frozen)} за {time.perf_counter() - started:.2f} с'
+        ))
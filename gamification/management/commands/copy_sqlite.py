@@ -0,0 +1,118 @@
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+
+SOURCE = 'sqlite_source'
+# Заполняются миграциями целевой БД; копируются вместе с исходными id
+REPLACED = ('contenttypes.contenttype', 'auth.permission')
+
+
+def _models():
+    """Все таблицы проекта; родительские раньше зависимых"""
+    models = [
+        model for model in apps.get_models(include_auto_created=True)
+        if model._meta.managed and not model._meta.proxy
+    ]
+    ordered, seen = [], set()
+
+    def visit(model):
+        if model in seen:
+            return
+        seen.add(model)
+        for field in model._meta.concrete_fields:
+            if field.is_relation and field.related_model is not model and field.related_model in models:
+                visit(field.related_model)
+        ordered.append(model)
+
+    for model in models:
+        visit(model)
+    return ordered
+
+
+class Command(BaseCommand):
+    help = 'Копирует данные из db.sqlite3 в текущую БД (обычно PostgreSQL) пакетами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=str(settings.BASE_DIR / 'db.sqlite3'), help='Путь к исходному файлу SQLite')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        source = Path(options['source'])
+        if not source.exists():
+            raise CommandError(f'Файл {source} не найден')
+        target = connections[DEFAULT_DB_ALIAS]
+        if target.vendor == 'sqlite' and Path(target.settings_dict['NAME']).resolve() == source.resolve():
+            raise CommandError('Источник и целевая БД совпадают; задайте DB_ENGINE=postgresql')
+
+        connections.settings[SOURCE] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: target.settings_dict,
+            SOURCE: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(source)},
+        })[SOURCE]
+
+        for alias, hint in ((SOURCE, f'SQLITE_PATH={source} python manage.py migrate'), (DEFAULT_DB_ALIAS, 'python manage.py migrate')):
+            executor = MigrationExecutor(connections[alias])
+            if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+                raise CommandError(f'Схема {alias} не на последней миграции; выполните: {hint}')
+
+        models = _models()
+        self._check_target_empty(models)
+        started = time.perf_counter()
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            for model in reversed(models):
+                if model._meta.label_lower in REPLACED:
+                    model._base_manager.using(DEFAULT_DB_ALIAS).all().delete()
+            for model in models:
+                copied = self._copy(model, options['batch_size'])
+                if copied:
+                    self.stdout.write(f'{model._meta.label}: {copied}')
+            self._reset_sequences(target, models)
+
+        mismatches = [
+            model._meta.label for model in models
+            if model._base_manager.using(SOURCE).count() != model._base_manager.using(DEFAULT_DB_ALIAS).count()
+        ]
+        if mismatches:
+            raise CommandError(f'Число строк не совпало: {", ".join(mismatches)}')
+        self.stdout.write(self.style.SUCCESS(f'Данные скопированы за {time.perf_counter() - started:.1f} с'))
+
+    def _check_target_empty(self, models):
+        filled = [
+            model._meta.label for model in models
+            if model._meta.label_lower not in REPLACED and model._base_manager.using(DEFAULT_DB_ALIAS).exists()
+        ]
+        if filled:
+            raise CommandError(f'Целевая БД не пуста ({", ".join(filled[:5])}); нужна чистая БД после migrate')
+
+    def _copy(self, model, batch_size):
+        manager = model._base_manager
+        fields = model._meta.concrete_fields
+        batch, copied = [], 0
+        for obj in manager.using(SOURCE).order_by('pk').iterator(chunk_size=batch_size):
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                copied += self._insert(manager, fields, batch)
+                batch = []
+        if batch:
+            copied += self._insert(manager, fields, batch)
+        return copied
+
+    def _insert(self, manager, fields, objs):
+        # Пакет ограничен числом параметров запроса, которое допускает целевая БД
+        size = max(connections[DEFAULT_DB_ALIAS].ops.bulk_batch_size(fields, objs), 1)
+        for start in range(0, len(objs), size):
+            # raw=True: значения auto_now/auto_now_add переносятся как есть, а не заменяются текущим временем
+            manager.using(DEFAULT_DB_ALIAS)._insert(objs[start:start + size], fields=fields, raw=True, using=DEFAULT_DB_ALIAS)
+        return len(objs)
+
+    def _reset_sequences(self, target, models):
+        statements = target.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with target.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
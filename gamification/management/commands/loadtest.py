@@ -0,0 +1,231 @@
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from gamification.models import Task, Prize, Battle
+from gamification.seeding import USERNAME_PREFIX
+from gamification.urls import urlpatterns
+
+# Вес маршрута в смеси: примерно как распределяются запросы в рабочий день
+MIX = {
+    'home': 5,
+    'index': 10,
+    'profile': 15,
+    'complete_task': 15,
+    'shop': 8,
+    'purchase_prize': 2,
+    'battles': 10,
+    'join_battle': 5,
+    'leaderboard': 15,
+    'notifications': 10,
+}
+POST_VIEWS = {'complete_task', 'purchase_prize', 'join_battle', 'import_data', 'test_datalens'}
+
+
+class LocalClient:
+    """Запросы через обработчик Django в этом процессе, без сети"""
+
+    def __init__(self, user):
+        hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if '*' not in host]
+        self.client = Client(HTTP_HOST=hosts[0] if hosts else 'localhost')
+        self.client.force_login(user)
+
+    def request(self, method, path):
+        return getattr(self.client, method)(path).status_code
+
+
+class HttpClient:
+    """Запросы к запущенному серверу (gunicorn/uvicorn) с входом через форму"""
+
+    def __init__(self, base_url, user, password):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        login_url = self.base_url + reverse('login')
+        self.session.get(login_url, timeout=30)
+        response = self.session.post(
+            login_url,
+            data={
+                'username': user.username,
+                'password': password,
+                'csrfmiddlewaretoken': self.session.cookies.get('csrftoken', ''),
+            },
+            headers={'Referer': login_url},
+            allow_redirects=False,
+            timeout=30,
+        )
+        if response.status_code != 302:
+            raise CommandError(f'Не удалось войти как {user.username}: {response.status_code}')
+
+    def request(self, method, path):
+        url = self.base_url + path
+        headers = {'X-CSRFToken': self.session.cookies.get('csrftoken', ''), 'Referer': url}
+        return self.session.request(method.upper(), url, headers=headers, allow_redirects=False, timeout=30).status_code
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест: N одновременных пользователей (по умолчанию из seed_gamification) '
+        'ходят по взвешенной смеси маршрутов gamification; выводит пропускную способность и перцентили задержки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50, help='Одновременных пользователей (потоков)')
+        parser.add_argument('--duration', type=float, default=30.0, help='Длительность замера, с')
+        parser.add_argument('--mix', help='Веса маршрутов: profile=20,leaderboard=5 (остальные — по умолчанию, 0 — исключить)')
+        parser.add_argument('--url', help='Адрес запущенного сервера; без него запросы идут в этом процессе')
+        parser.add_argument('--password', help='Пароль пользователей для входа (обязателен с --url)')
+        parser.add_argument('--prefix', default=USERNAME_PREFIX, help='Префикс имён пользователей')
+        parser.add_argument('--report', help='Путь для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        if options['url'] and not options['password']:
+            raise CommandError('Для --url нужен --password (seed_gamification --password ...)')
+        mix = self.parse_mix(options['mix'])
+        users = list(User.objects.filter(username__startswith=options['prefix']).order_by('id')[:options['clients']])
+        if not users:
+            raise CommandError(f'Нет пользователей {options["prefix"]}N; заполните БД: manage.py seed_gamification')
+        paths = self.path_factories(mix)
+
+        def make_client(user):
+            if options['url']:
+                return HttpClient(options['url'], user, options['password'])
+            return LocalClient(user)
+
+        names, weights = list(mix), list(mix.values())
+        samples = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+        state = {}
+        barrier = threading.Barrier(
+            options['clients'],
+            action=lambda: state.update(started=time.perf_counter(), deadline=time.perf_counter() + options['duration']),
+        )
+
+        def worker(number):
+            rnd = random.Random(number)
+            local_samples, local_errors = defaultdict(list), defaultdict(int)
+            try:
+                client = make_client(users[number % len(users)])
+                barrier.wait()
+                while time.perf_counter() < state['deadline']:
+                    name = rnd.choices(names, weights)[0]
+                    method = 'post' if name in POST_VIEWS else 'get'
+                    started = time.perf_counter()
+                    try:
+                        status = client.request(method, paths[name](rnd))
+                    except Exception:
+                        status = None
+                    local_samples[name].append(time.perf_counter() - started)
+                    if status is None or status >= 500:
+                        local_errors[name] += 1
+            except threading.BrokenBarrierError:
+                return
+            except Exception as e:
+                # Один недоступный сервер или неверный пароль — остальные не ждут
+                state.setdefault('error', f'{type(e).__name__}: {e}')
+                barrier.abort()
+            finally:
+                connections.close_all()
+                with lock:
+                    for name, values in local_samples.items():
+                        samples[name].extend(values)
+                    for name, count in local_errors.items():
+                        errors[name] += count
+
+        self.stdout.write(f'Пользователей: {options["clients"]}, длительность {options["duration"]:.0f} с, '
+                          f'{"сервер " + options["url"] if options["url"] else "в процессе"}')
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(options['clients'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if 'error' in state:
+            raise CommandError(f'Клиент не смог начать работу: {state["error"]}')
+        elapsed = time.perf_counter() - state['started']
+        self.report(samples, errors, elapsed, options)
+
+    def parse_mix(self, value):
+        mix = dict(MIX)
+        known = {pattern.name for pattern in urlpatterns}
+        for item in filter(None, (value or '').split(',')):
+            name, _, weight = item.partition('=')
+            if name not in known:
+                raise CommandError(f'Неизвестный маршрут {name}; доступны: {", ".join(sorted(known))}')
+            try:
+                mix[name] = float(weight)
+            except ValueError:
+                raise CommandError(f'Некорректный вес маршрута {name}: {weight!r}')
+        mix = {name: weight for name, weight in mix.items() if weight > 0}
+        if not mix:
+            raise CommandError('Смесь маршрутов пуста')
+        return mix
+
+    def path_factories(self, names):
+        """Для каждого маршрута — функция, выдающая путь со случайными существующими id"""
+        ids = {
+            'task_id': list(Task.objects.values_list('id', flat=True)),
+            'prize_id': list(Prize.objects.values_list('id', flat=True)),
+            'battle_id': list(Battle.objects.filter(start_time__gt=timezone.now()).values_list('id', flat=True)),
+        }
+        factories = {}
+        for pattern in urlpatterns:
+            if pattern.name not in names:
+                continue
+            params = list(pattern.pattern.converters)
+            missing = [param for param in params if not ids.get(param)]
+            if missing:
+                raise CommandError(f'Нет данных для маршрута {pattern.name}: {", ".join(missing)}')
+
+            def factory(rnd, name=pattern.name, params=params):
+                return reverse(f'gamification:{name}', kwargs={param: rnd.choice(ids[param]) for param in params})
+
+            factories[pattern.name] = factory
+        return factories
+
+    def report(self, samples, errors, elapsed, options):
+        total = sum(len(values) for values in samples.values())
+        rows = {}
+        self.stdout.write(f'{"маршрут":<16}{"запросов":>10}{"ошибок":>8}{"в с":>8}{"p50 мс":>9}{"p95 мс":>9}{"p99 мс":>9}')
+        for name in sorted(samples, key=lambda name: -len(samples[name])):
+            ordered = sorted(samples[name])
+            rows[name] = {
+                'requests': len(ordered),
+                'errors': errors[name],
+                'rps': len(ordered) / elapsed,
+                'p50_ms': percentile(ordered, 0.50) * 1000,
+                'p95_ms': percentile(ordered, 0.95) * 1000,
+                'p99_ms': percentile(ordered, 0.99) * 1000,
+            }
+            row = rows[name]
+            self.stdout.write(
+                f'{name:<16}{row["requests"]:>10}{row["errors"]:>8}{row["rps"]:>8.1f}'
+                f'{row["p50_ms"]:>9.1f}{row["p95_ms"]:>9.1f}{row["p99_ms"]:>9.1f}'
+            )
+        failed = sum(errors.values())
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(style(f'Всего: {total} запросов за {elapsed:.1f} с ({total / elapsed:.1f} в с), ошибок {failed}'))
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'clients': options['clients'],
+                    'duration': elapsed,
+                    'target': options['url'] or 'local',
+                    'throughput_rps': total / elapsed,
+                    'errors': failed,
+                    'routes': rows,
+                }, f, ensure_ascii=False, indent=2, sort_keys=True)
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from gamification.live import hub
+from gamification.models import Battle, BattleResult
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест живого табло: открывает N SSE-подписок через ASGI-приложение '
+        'в этом процессе и меняет счёт участников батла'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--battle', type=int, help='Id батла (по умолчанию — первый активный с результатами)')
+        parser.add_argument('--subscribers', type=int, default=2000, help='Количество одновременных подписчиков')
+        parser.add_argument('--updates', type=int, default=100, help='Сколько раз изменить счёт')
+        parser.add_argument('--rate', type=float, default=20.0, help='Изменений счёта в секунду')
+
+    def handle(self, *args, **options):
+        battle_id = options['battle'] or self.default_battle()
+        result_ids = list(BattleResult.objects.filter(battle_id=battle_id).values_list('id', flat=True))
+        if not result_ids:
+            raise CommandError(f'У батла {battle_id} нет результатов')
+        # Нагрузочный тест проверяет именно поток, независимо от LIVE_STREAMING окружения
+        with override_settings(LIVE_STREAMING=True):
+            report = asyncio.run(self.run(battle_id, result_ids, options))
+
+        self.stdout.write(f"Подписчиков: {report['subscribers']} (подключено {report['connected']} за {report['connect_seconds']:.2f} с)")
+        self.stdout.write(f"Изменений счёта: {report['updates']}, снимков на подписчика: {report['events_per_subscriber']:.1f}")
+        self.stdout.write(f"Доставлено сообщений: {report['delivered']} ({report['delivered_per_sec']:.0f}/с)")
+        if report['latency_ms']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Задержка раздачи снимка: p50 {report['latency_ms']['p50']:.1f} мс, "
+                f"p95 {report['latency_ms']['p95']:.1f} мс, max {report['latency_ms']['max']:.1f} мс"
+            ))
+
+    def default_battle(self):
+        now = timezone.now()
+        battle = (
+            Battle.objects.filter(start_time__lte=now, end_time__gte=now, battleresult__isnull=False)
+            .order_by('id').first()
+        )
+        if battle is None:
+            raise CommandError('Нет активного батла с результатами; укажите --battle')
+        return battle.id
+
+    async def run(self, battle_id, result_ids, options):
+        app = get_asgi_application()
+        path = reverse('gamification:battle_live', kwargs={'battle_id': battle_id})
+        count = options['subscribers']
+        stop = asyncio.Event()
+        received = [0] * count
+        latencies = []
+
+        async def subscriber(number):
+            body_sent = False
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await stop.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] != 'http.response.body':
+                    return
+                for line in message.get('body', b'').decode().splitlines():
+                    if line.startswith('data: '):
+                        received[number] += 1
+                        latencies.append(time.time() - json.loads(line[6:])['ts'])
+
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': path,
+                'raw_path': path.encode(),
+                'query_string': b'',
+                'root_path': '',
+                'headers': [(b'host', b'localhost'), (b'accept', b'text/event-stream')],
+                'client': ('127.0.0.1', 10000 + number),
+                'server': ('localhost', 80),
+            }
+            await app(scope, receive, send)
+
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(subscriber(number)) for number in range(count)]
+        while hub.subscriber_count(battle_id) < count and time.perf_counter() - started < 120:
+            await asyncio.sleep(0.05)
+        connect_seconds = time.perf_counter() - started
+        connected = hub.subscriber_count(battle_id)
+        # Первый снимок приходит при подключении; считаем только снимки после изменений
+        await asyncio.sleep(1)
+        baseline = list(received)
+        del latencies[:]
+
+        @sync_to_async
+        def bump_score():
+            result = BattleResult.objects.get(id=random.choice(result_ids))
+            result.score += random.randint(1, 10)
+            result.save(update_fields=['score'])
+
+        updates_started = time.perf_counter()
+        for _ in range(options['updates']):
+            await bump_score()
+            await asyncio.sleep(1 / options['rate'])
+        # Даём хабу разослать последний снимок
+        await asyncio.sleep(2)
+        elapsed = time.perf_counter() - updates_started
+
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        events = [after - before for after, before in zip(received, baseline)]
+        delivered = sum(events)
+        latency = None
+        if latencies:
+            ordered = sorted(latencies)
+            latency = {
+                'p50': statistics.median(ordered) * 1000,
+                'p95': ordered[int(len(ordered) * 0.95) - 1 if len(ordered) > 1 else 0] * 1000,
+                'max': ordered[-1] * 1000,
+            }
+        return {
+            'subscribers': count,
+            'connected': connected,
+            'connect_seconds': connect_seconds,
+            'updates': options['updates'],
+            'events_per_subscriber': delivered / count if count else 0,
+            'delivered': delivered,
+            'delivered_per_sec': delivered / elapsed if elapsed else 0,
+            'latency_ms': latency,
+        }
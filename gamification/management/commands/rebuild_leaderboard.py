@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from gamification import leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает таблицу лидеров из БД и сбрасывает индексы во всех процессах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Сколько лидеров вывести после сборки')
+
+    def handle(self, *args, **options):
+        leaderboard.invalidate()
+        board = leaderboard.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Таблица лидеров перестроена: {len(board)} профилей'))
+        for entry in board.top(options['top']):
+            self.stdout.write(f'{entry.rank:>4}. user_id={entry.user_id} — {entry.stars} ⭐')
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from gamification.ledger import ledger_balances
+from gamification.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Сверяет UserProfile.stars со снимками и журналом звёзд'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def _mismatches(self, user_ids):
+        with transaction.atomic():
+            stars = dict(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', 'stars'))
+            balances = ledger_balances(list(stars))
+        return {user_id: (stars[user_id], balances[user_id]) for user_id in stars if stars[user_id] != balances[user_id]}
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = 0
+        mismatches = {}
+        last_id = 0
+        while True:
+            chunk = list(
+                UserProfile.objects.filter(user_id__gt=last_id).order_by('user_id').values_list('user_id', flat=True)[:batch_size]
+            )
+            if not chunk:
+                break
+            last_id = chunk[-1]
+            checked += len(chunk)
+            found = self._mismatches(chunk)
+            if found:
+                # Перепроверяем, чтобы не ловить операции, попавшие между чтениями
+                mismatches.update(self._mismatches(list(found)))
+
+        for user_id, (stars, balance) in sorted(mismatches.items()):
+            self.stdout.write(f'user_id={user_id}: профиль {stars} ⭐, журнал {balance} ⭐')
+        if mismatches:
+            raise CommandError(f'Расхождения у {len(mismatches)} из {checked} пользователей')
+        self.stdout.write(self.style.SUCCESS(f'Проверено {checked} пользователей, расхождений нет'))
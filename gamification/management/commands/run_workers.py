@@ -0,0 +1,48 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from gamification import jobs
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _worker(poll_interval, once):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    jobs.work(poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = 'Запускает пул процессов, выполняющих фоновые задачи импорта'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Количество процессов-воркеров')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Пауза при пустой очереди, секунд')
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и завершиться')
+
+    def handle(self, *args, **options):
+        # Дочерние процессы не должны разделять соединения с БД родителя
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=_worker, args=(options['poll_interval'], options['once']), daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for process in workers:
+            process.start()
+        signal.signal(signal.SIGTERM, _stop)
+        self.stdout.write(f'Запущено воркеров: {len(workers)}')
+
+        try:
+            for process in workers:
+                process.join()
+        except KeyboardInterrupt:
+            for process in workers:
+                process.terminate()
+            for process in workers:
+                process.join()
+        self.stdout.write('Воркеры остановлены')
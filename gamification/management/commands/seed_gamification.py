@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from gamification import catalog, leaderboard
+from gamification.models import UserProfile, Task, Battle
+from gamification.seeding import USERNAME_PREFIX, seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет пустую БД синтетическими данными: группы, уровни, задания, призы, '
+        'пользователи, выполнения, батлы, покупки и уведомления (масштаб 1.0 — «боевой» объём)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0, help='Доля «боевого» объёма (10k пользователей, 1M выполнений)')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора: одинаковое даёт одинаковые данные')
+        parser.add_argument('--password', help=f'Общий пароль пользователей {USERNAME_PREFIX}N (нужен для loadtest --url)')
+
+    def handle(self, *args, **options):
+        if UserProfile.objects.exists() or Task.objects.exists() or Battle.objects.exists():
+            raise CommandError('В БД уже есть данные gamification; заполнять можно только пустую БД после migrate')
+
+        self.stdout.write(f'БД: {connection.vendor} ({connection.settings_dict["NAME"]}), масштаб {options["scale"]}')
+        started = step_started = time.perf_counter()
+
+        def progress(step, count):
+            nonlocal step_started
+            now = time.perf_counter()
+            self.stdout.write(f'{step}: {count} за {now - step_started:.1f} с')
+            step_started = now
+
+        with transaction.atomic():
+            data = seed(options['scale'], options['seed'], options['password'], progress)
+
+        # bulk_create не отправляет сигналы — кеши других процессов сбрасываем сами
+        for name in catalog.LOADERS:
+            catalog.invalidate(name)
+        leaderboard.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с; пользователи '
+            f'{USERNAME_PREFIX}0..{USERNAME_PREFIX}{len(data["users"]) - 1}'
+        ))
@@ -0,0 +1,41 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from gamification import settlement
+
+
+class Command(BaseCommand):
+    help = 'Подводит итоги закончившихся батлов: места и награды звёздами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('battle_ids', nargs='*', type=int, help='Id батлов (по умолчанию — все закончившиеся)')
+        parser.add_argument('--processes', type=int, default=1, help='Количество параллельных процессов')
+        parser.add_argument('--limit', type=int, help='Максимум батлов за запуск')
+
+    def handle(self, *args, **options):
+        battle_ids = options['battle_ids'] or settlement.due()
+        if options['limit']:
+            battle_ids = battle_ids[:options['limit']]
+        if not battle_ids:
+            self.stdout.write('Нет батлов для подведения итогов')
+            return
+
+        started = time.perf_counter()
+        if options['processes'] > 1:
+            # Дочерние процессы не должны разделять соединения с БД родителя
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with context.Pool(options['processes'], initializer=connections.close_all) as pool:
+                outcomes = pool.map(settlement.settle, battle_ids, chunksize=max(1, len(battle_ids) // (options['processes'] * 4)))
+        else:
+            outcomes = [settlement.settle(battle_id) for battle_id in battle_ids]
+
+        settled = [outcome for outcome in outcomes if outcome is not None]
+        stars = sum(outcome.stars_awarded for outcome in settled)
+        self.stdout.write(self.style.SUCCESS(
+            f'Подведено батлов: {len(settled)} из {len(battle_ids)}, '
+            f'начислено {stars} ⭐ за {time.perf_counter() - started:.2f} с'
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from gamification.ledger import ledger_balances
+from gamification.models import StarTransaction, StarBalanceSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Снимает контрольные точки балансов по журналу звёзд (запускать периодически)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        cut = StarTransaction.objects.aggregate(last=Max('id'))['last']
+        if cut is None:
+            self.stdout.write('Журнал пуст')
+            return
+
+        user_ids = list(
+            StarTransaction.objects.filter(id__lte=cut).values_list('user_id', flat=True).distinct().order_by('user_id')
+        )
+        now = timezone.now()
+        for start in range(0, len(user_ids), batch_size):
+            chunk = user_ids[start:start + batch_size]
+            balances = ledger_balances(chunk, upto=cut)
+            with transaction.atomic():
+                StarBalanceSnapshot.objects.filter(user_id__in=chunk).delete()
+                StarBalanceSnapshot.objects.bulk_create(
+                    StarBalanceSnapshot(user_id=user_id, balance=balance, last_transaction_id=cut, taken_at=now)
+                    for user_id, balance in balances.items()
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'Снимки обновлены для {len(user_ids)} пользователей до операции #{cut}'))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from gamification import leaderboard, provisioning
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие профили и прогресс для пользователей, созданных в обход сигналов (пачками)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=provisioning.BATCH_SIZE, help='Пользователей в пачке')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(provisioned, last_id):
+            self.stdout.write(f'Дополнено пользователей: {provisioned} (до #{last_id})')
+
+        provisioned = provisioning.sync(options['batch_size'], progress)
+        if provisioned:
+            # bulk_create не отправляет сигналы — новые профили попадут в индекс лидеров при пересборке
+            leaderboard.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Дополнено пользователей: {provisioned} за {time.perf_counter() - started:.1f} с'
+        ))
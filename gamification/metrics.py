@@ -0,0 +1,289 @@
+"""
+Метрики для Prometheus, общие для всех воркеров gunicorn.
+
+Счётчики и гистограммы копятся в памяти процесса и не чаще раза в
+``METRICS_FLUSH_INTERVAL`` секунд сбрасываются в файл ``<pid>.json`` каталога
+``METRICS_DIR``: первое изменение после записи заводит таймер, поэтому
+последние значения попадают в файл не позже чем через интервал, даже если
+процесс больше ничего не считает. Файл заменяется атомарно (``os.replace``),
+поэтому читатель никогда не видит его наполовину записанным. ``/metrics`` суммирует файлы всех
+процессов. Файлы завершившихся процессов (как ``mark_process_dead`` в
+prometheus_client) сливаются под блокировкой в ``archive.json`` и удаляются:
+счётчики не убывают при перезапуске воркеров, а число файлов не растёт.
+"""
+import atexit
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from glob import glob
+
+from django.conf import settings
+
+ARCHIVE_NAME = 'archive.json'
+LOCK_NAME = 'metrics.lock'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+REGISTRY = {}
+
+_lock = threading.Lock()
+_pid = None
+_values = defaultdict(float)  # (имя, ((метка, значение), ...)) -> значение
+_flushed_at = 0.0
+_timer = None  # отложенная запись этого процесса
+
+
+def directory():
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'gamification-metrics')
+
+
+def _path(pid):
+    return os.path.join(directory(), f'{pid}.json')
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return [(name, tuple(map(tuple, labels)), value) for name, labels, value in json.load(f)]
+    except (OSError, ValueError):
+        return []
+
+
+def _write(path, values):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump([[name, labels, value] for (name, labels), value in values.items()], f)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _exclusive():
+    """Блокировка каталога между процессами на время слияния файлов"""
+    os.makedirs(directory(), exist_ok=True)
+    with open(os.path.join(directory(), LOCK_NAME), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _pids():
+    pids = []
+    for path in glob(os.path.join(directory(), '*.json')):
+        stem = os.path.basename(path)[:-len('.json')]
+        if stem.isdigit():
+            pids.append(int(stem))
+    return pids
+
+
+def _retire(pids):
+    """Сливает файлы завершившихся процессов pids в архив и удаляет их"""
+    with _exclusive():
+        paths = [path for path in map(_path, pids) if os.path.exists(path)]
+        if not paths:
+            return
+        archive_path = os.path.join(directory(), ARCHIVE_NAME)
+        merged = defaultdict(float)
+        for path in [archive_path] + paths:
+            for name, labels, value in _read(path):
+                merged[(name, labels)] += value
+        _write(archive_path, merged)
+        for path in paths:
+            os.remove(path)
+
+
+def _own_values():
+    """Значения этого процесса; после fork дочерний процесс начинает с нуля"""
+    global _pid, _values, _timer
+    pid = os.getpid()
+    if pid != _pid:
+        _pid = pid
+        _values = defaultdict(float)
+        _timer = None  # потоки родителя после fork не работают
+        # pid мог достаться от завершившегося воркера — его файл уходит в архив
+        _retire([pid])
+    return _values
+
+
+def _add(samples):
+    global _timer
+    with _lock:
+        values = _own_values()
+        for name, labels, amount in samples:
+            values[(name, labels)] += amount
+        if _timer is not None:
+            return
+        delay = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0) - (time.monotonic() - _flushed_at)
+        if delay > 0:
+            _timer = threading.Timer(delay, flush)
+            _timer.daemon = True
+            _timer.start()
+            return
+    flush()
+
+
+def flush():
+    """Записывает значения процесса в его файл"""
+    global _flushed_at, _timer
+    with _lock:
+        values = _own_values()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+        if not values:
+            return
+        _flushed_at = time.monotonic()
+        os.makedirs(directory(), exist_ok=True)
+        _write(_path(_pid), values)
+
+
+atexit.register(flush)
+
+
+def collect():
+    """Сумма значений всех процессов: {(имя, метки): значение}"""
+    flush()
+    dead = [pid for pid in _pids() if not _alive(pid)]
+    if dead:
+        _retire(dead)
+    merged = defaultdict(float)
+    for path in glob(os.path.join(directory(), '*.json')):
+        for name, labels, value in _read(path):
+            merged[(name, labels)] += value
+    return merged
+
+
+def _format(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample(name, labels, value):
+    if not labels:
+        return f'{name} {_format(value)}'
+    pairs = ','.join(f'{label}="{_escape(text)}"' for label, text in labels)
+    return f'{name}{{{pairs}}} {_format(value)}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+    def _labels(self, labels):
+        return tuple((label, str(labels[label])) for label in self.labelnames)
+
+    def expose(self, values):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        _add([(self.name, self._labels(labels), amount)])
+
+    def expose(self, values):
+        return [
+            _sample(name, labels, value)
+            for (name, labels), value in sorted(values.items())
+            if name == self.name
+        ]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = [_format(bound) for bound in buckets] + ['+Inf']
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        samples = [
+            (f'{self.name}_bucket', labels + (('le', bound),), 1)
+            for bound, limit in zip(self.bounds, self.buckets)
+            if value <= limit
+        ]
+        samples.append((f'{self.name}_sum', labels, value))
+        samples.append((f'{self.name}_count', labels, 1))
+        _add(samples)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def expose(self, values):
+        lines = []
+        labelsets = sorted(labels for name, labels in values if name == f'{self.name}_count')
+        for labels in labelsets:
+            for bound in self.bounds:
+                key = (f'{self.name}_bucket', labels + (('le', bound),))
+                lines.append(_sample(key[0], key[1], values.get(key, 0)))
+            lines.append(_sample(f'{self.name}_sum', labels, values[(f'{self.name}_sum', labels)]))
+            lines.append(_sample(f'{self.name}_count', labels, values[(f'{self.name}_count', labels)]))
+        return lines
+
+
+def render():
+    """Все метрики всех процессов в текстовом формате Prometheus"""
+    values = collect()
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.expose(values))
+    return '\n'.join(lines) + '\n'
+
+
+STARS_AWARDED = Counter('gamification_stars_awarded_total', 'Начисленные звёзды по источнику', ('source',))
+STARS_SPENT = Counter('gamification_stars_spent_total', 'Списанные звёзды по источнику', ('source',))
+PURCHASES = Counter('gamification_purchases_total', 'Покупки по призам', ('prize',))
+IMPORT_ROWS = Counter('gamification_import_rows_total', 'Прочитанные строки CSV импорта')
+IMPORT_SKIPPED = Counter('gamification_import_skipped_total', 'Некорректные строки CSV импорта')
+IMPORT_UNKNOWN_USERS = Counter(
+    'gamification_import_unknown_users_total', 'Неизвестные пользователи и пользователи без профиля при импорте'
+)
+IMPORT_USERS = Counter('gamification_import_users_total', 'Пользователи, получившие звёзды при импорте')
+IMPORT_DURATION = Histogram('gamification_import_duration_seconds', 'Длительность импорта данных эффективности')
+PROFILED_REQUEST_DURATION = Histogram(
+    'gamification_profiled_request_seconds', 'Полное время профилированных запросов', ('view',)
+)
+PROFILED_SQL_QUERIES = Counter('gamification_profiled_sql_queries_total', 'SQL-запросы профилированных запросов', ('view',))
+PROFILED_SECONDS = Counter(
+    'gamification_profiled_seconds_total', 'Время SQL, отрисовки шаблонов и обработчиков сигналов', ('view', 'kind')
+)
+PROFILED_DUPLICATE_SQL = Counter(
+    'gamification_profiled_duplicate_sql_requests_total', 'Профилированные запросы с повторяющимся SQL (N+1)', ('view',)
+)
+IAM_TOKEN_FETCH = Histogram(
+    'gamification_iam_token_fetch_seconds', 'Получение IAM-токена Yandex Cloud', ('status',),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
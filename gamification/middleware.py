@@ -0,0 +1,90 @@
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import profiling
+from .routers import RoutingState, replica_configured, routing
+
+STICKY_COOKIE = 'db_primary_until'
+
+
+class ReplicaMiddleware:
+    """
+    Направляет чтение представлений из DATABASE_REPLICA_VIEWS на реплику.
+
+    После записи пользователь на REPLICA_STICKY_SECONDS закрепляется за основной
+    БД (cookie), чтобы сразу видеть свои изменения, пока реплика догоняет.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.views = frozenset(getattr(settings, 'DATABASE_REPLICA_VIEWS', ()))
+        self.sticky_seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        state = RoutingState()
+        token = routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing.reset(token)
+        if state.wrote:
+            response.set_cookie(
+                STICKY_COOKIE,
+                str(int(time.time()) + self.sticky_seconds),
+                max_age=self.sticky_seconds,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = routing.get()
+        if state is None or request.resolver_match.view_name not in self.views:
+            return None
+        try:
+            pinned = int(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        state.use_replica = not pinned
+        return None
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует случайную долю запросов (PROFILING_SAMPLE_RATE, от 0 до 1).
+
+    Стоит первым в MIDDLEWARE, чтобы в замер попали запросы сессий и
+    авторизации. При нулевой доле ничего не оборачивает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rate = float(getattr(settings, 'PROFILING_SAMPLE_RATE', 0))
+        if self.rate > 0:
+            profiling.install()
+
+    def __call__(self, request):
+        if self.rate <= 0 or random.random() >= self.rate:
+            return self.get_response(request)
+
+        sample = profiling.Sample()
+        token = profiling.current.set(sample)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profiling.execute))
+                response = self.get_response(request)
+        finally:
+            profiling.current.reset(token)
+        # Статика (WhiteNoise) и 404 до роутинга не относятся ни к одному представлению
+        if request.resolver_match is not None:
+            profiling.record(request.resolver_match.view_name, sample, time.perf_counter() - started)
+        return response
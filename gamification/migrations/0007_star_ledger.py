@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_balances(apps, schema_editor):
+    """Переносит текущие балансы профилей в журнал как начальный остаток"""
+    UserProfile = apps.get_model('gamification', 'UserProfile')
+    StarTransaction = apps.get_model('gamification', 'StarTransaction')
+    StarTransaction.objects.bulk_create(
+        (
+            StarTransaction(user_id=user_id, amount=stars, source='opening', note='Начальный остаток')
+            for user_id, stars in UserProfile.objects.filter(stars__gt=0).values_list('user_id', 'stars').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0006_alter_group_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StarBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.IntegerField(verbose_name='Баланс')),
+                ('last_transaction_id', models.BigIntegerField(verbose_name='Последняя операция')),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Снят')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Снимок баланса',
+                'verbose_name_plural': 'Снимки балансов',
+            },
+        ),
+        migrations.CreateModel(
+            name='StarTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Изменение')),
+                ('source', models.CharField(choices=[('opening', 'Начальный остаток'), ('task', 'Задание'), ('purchase', 'Покупка'), ('import', 'Импорт эффективности'), ('level_bonus', 'Бонус за уровень'), ('battle', 'Батл'), ('adjustment', 'Корректировка')], max_length=20, verbose_name='Источник')),
+                ('note', models.CharField(blank=True, max_length=255, verbose_name='Комментарий')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Операция со звёздами',
+                'verbose_name_plural': 'Журнал звёзд',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['user', 'id'], name='startx_user_id_idx')],
+            },
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def close_legacy_uploads(apps, schema_editor):
+    """Загруженные ранее файлы не являются задачами очереди"""
+    PerformanceData = apps.get_model('gamification', 'PerformanceData')
+    PerformanceData.objects.update(status='done')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0007_star_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='performancedata',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Попыток'),
+        ),
+        migrations.AddField(
+            model_name='performancedata',
+            name='duration',
+            field=models.FloatField(blank=True, null=True, verbose_name='Длительность, с'),
+        ),
+        migrations.AddField(
+            model_name='performancedata',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Окончание'),
+        ),
+        migrations.AddField(
+            model_name='performancedata',
+            name='kind',
+            field=models.CharField(choices=[('datalens_import', 'Импорт из DataLens'), ('datalens_test', 'Проверка подключения к DataLens')], default='datalens_import', max_length=20, verbose_name='Тип задачи'),
+        ),
+        migrations.AddField(
+            model_name='performancedata',
+            name='max_attempts',
+            field=models.PositiveSmallIntegerField(default=3, verbose_name='Максимум попыток'),
+        ),
+        migrations.AddField(
+            model_name='performancedata',
+            name='requested_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Запустил'),
+        ),
+        migrations.AddField(
+            model_name='performancedata',
+            name='rows_processed',
+            field=models.PositiveIntegerField(default=0, verbose_name='Обработано строк'),
+        ),
+        migrations.AddField(
+            model_name='performancedata',
+            name='run_after',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Запустить после'),
+        ),
+        migrations.AddField(
+            model_name='performancedata',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Начало'),
+        ),
+        migrations.AddField(
+            model_name='performancedata',
+            name='status',
+            field=models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('done', 'Выполнено'), ('failed', 'Ошибка')], default='queued', max_length=10, verbose_name='Статус'),
+        ),
+        migrations.AddField(
+            model_name='performancedata',
+            name='worker',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Воркер'),
+        ),
+        migrations.AlterField(
+            model_name='performancedata',
+            name='file',
+            field=models.FileField(blank=True, upload_to='performance_data/'),
+        ),
+        migrations.AddIndex(
+            model_name='performancedata',
+            index=models.Index(fields=['status', 'run_after'], name='perfdata_queue_idx'),
+        ),
+        migrations.RunPython(close_legacy_uploads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0008_performancedata_job_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_read', models.BooleanField(default=False, verbose_name='Прочитано')),
+                ('created_at', models.DateTimeField(verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Входящее уведомление',
+                'verbose_name_plural': 'Входящие уведомления',
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='InboxState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_broadcast_id', models.BigIntegerField(default=0, verbose_name='Последняя рассылка')),
+            ],
+            options={
+                'verbose_name': 'Состояние входящих',
+                'verbose_name_plural': 'Состояния входящих',
+            },
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='recipient',
+            field=models.ForeignKey(blank=True, help_text='Пусто — рассылка всем пользователям', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='personal_notifications', to=settings.AUTH_USER_MODEL, verbose_name='Получатель'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'id'], name='notification_recipient_idx'),
+        ),
+        migrations.AddField(
+            model_name='inboxitem',
+            name='notification',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='gamification.notification', verbose_name='Уведомление'),
+        ),
+        migrations.AddField(
+            model_name='inboxitem',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddField(
+            model_name='inboxstate',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddIndex(
+            model_name='inboxitem',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='inbox_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inboxitem',
+            index=models.Index(fields=['user', 'is_read'], name='inbox_user_unread_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='inboxitem',
+            constraint=models.UniqueConstraint(fields=('user', 'notification'), name='inbox_unique_notification'),
+        ),
+    ]
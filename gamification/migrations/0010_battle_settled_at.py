@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:47
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def close_finished_battles(apps, schema_editor):
+    """Батлы, завершённые до появления движка итогов, задним числом не награждаются"""
+    Battle = apps.get_model('gamification', 'Battle')
+    Battle.objects.filter(active=False).update(settled_at=F('end_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0009_notification_inbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='battle',
+            name='settled_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Итоги подведены'),
+        ),
+        migrations.AddIndex(
+            model_name='battle',
+            index=models.Index(fields=['settled_at', 'end_time'], name='gamificatio_settled_5d076c_idx'),
+        ),
+        migrations.RunPython(close_finished_battles, migrations.RunPython.noop),
+    ]
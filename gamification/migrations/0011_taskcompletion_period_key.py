@@ -0,0 +1,73 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+BATCH_SIZE = 2000
+
+
+def period_key(task_type, day):
+    if task_type == 'one_time':
+        return 'once'
+    if task_type == 'weekly':
+        year, week, _ = day.isocalendar()
+        return f'{year}-W{week:02d}'
+    return day.isoformat()
+
+
+def fill_period_keys(apps, schema_editor):
+    """
+    Период для уже выполненных заданий.
+
+    Повторные выполнения в одном периоде (двойные клики) остаются в истории,
+    но получают ключ с суффиксом id, чтобы не нарушать уникальность.
+    """
+    TaskCompletion = apps.get_model('gamification', 'TaskCompletion')
+    rows = (
+        TaskCompletion.objects.order_by('user_id', 'task_id', 'completed_at', 'id')
+        .values_list('id', 'user_id', 'task_id', 'task__task_type', 'completed_at')
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    batch = []
+    current, seen = None, set()
+    for completion_id, user_id, task_id, task_type, completed_at in rows:
+        if (user_id, task_id) != current:
+            current, seen = (user_id, task_id), set()
+        key = period_key(task_type, timezone.localtime(completed_at).date())
+        if key in seen:
+            key = f'{key}#{completion_id}'
+        seen.add(key)
+        batch.append(TaskCompletion(id=completion_id, period_key=key))
+        if len(batch) >= BATCH_SIZE:
+            TaskCompletion.objects.bulk_update(batch, ['period_key'])
+            batch = []
+    if batch:
+        TaskCompletion.objects.bulk_update(batch, ['period_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0010_battle_settled_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskcompletion',
+            name='period_key',
+            field=models.CharField(default='', max_length=32, verbose_name='Период'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='taskcompletion',
+            name='request_key',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Ключ запроса'),
+        ),
+        migrations.RunPython(fill_period_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='taskcompletion',
+            constraint=models.UniqueConstraint(fields=('user', 'task', 'period_key'), name='unique_task_completion_per_period'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0011_taskcompletion_period_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prize',
+            name='stock',
+            field=models.PositiveIntegerField(blank=True, help_text='Пусто — без ограничений', null=True, verbose_name='Остаток'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0012_prize_stock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='battle',
+            index=models.Index(fields=['active', 'start_time', 'end_time'], name='battle_active_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='battle',
+            index=models.Index(condition=models.Q(('active', False)), fields=['-end_time'], name='battle_finished_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['user', '-purchased_at'], name='purchase_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['-stars', 'user', 'group'], name='profile_stars_idx'),
+        ),
+    ]
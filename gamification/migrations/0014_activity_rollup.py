@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0013_hot_lookup_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'День'), ('week', 'Неделя'), ('month', 'Месяц')], max_length=5, verbose_name='Период')),
+                ('period_start', models.DateField(verbose_name='Начало периода')),
+                ('completions', models.PositiveIntegerField(default=0, verbose_name='Выполнено заданий')),
+                ('stars_earned', models.PositiveIntegerField(default=0, verbose_name='Заработано звёзд')),
+                ('stars_spent', models.PositiveIntegerField(default=0, verbose_name='Потрачено звёзд')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='gamification.group', verbose_name='Группа')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Активность за период',
+                'verbose_name_plural': 'Активность по периодам',
+                'indexes': [models.Index(fields=['period', 'period_start', '-stars_earned', 'id'], name='rollup_leaders_idx'), models.Index(fields=['period', 'period_start', 'group', '-stars_earned', 'id'], name='rollup_group_leaders_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'period', 'period_start'), name='rollup_unique_user_period')],
+            },
+        ),
+    ]
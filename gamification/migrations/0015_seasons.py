@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0014_activity_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Season',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('start_date', models.DateField(verbose_name='Первый день')),
+                ('end_date', models.DateField(verbose_name='Последний день')),
+                ('frozen_at', models.DateTimeField(blank=True, null=True, verbose_name='Итоги зафиксированы')),
+            ],
+            options={
+                'verbose_name': 'Сезон',
+                'verbose_name_plural': 'Сезоны',
+                'ordering': ['-start_date'],
+                'constraints': [models.UniqueConstraint(fields=('start_date',), name='season_unique_start')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SeasonStanding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField(verbose_name='Место')),
+                ('stars', models.PositiveIntegerField(verbose_name='Звёзды за сезон')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='gamification.group', verbose_name='Группа')),
+                ('season', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='gamification.season', verbose_name='Сезон')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Место в сезоне',
+                'verbose_name_plural': 'Места в сезонах',
+                'indexes': [models.Index(fields=['season', 'rank', 'id'], name='standing_rank_idx'), models.Index(fields=['season', 'group', 'rank', 'id'], name='standing_group_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('season', 'user'), name='standing_unique_season_user')],
+            },
+        ),
+    ]
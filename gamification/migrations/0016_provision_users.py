@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def provision_users(apps, schema_editor):
+    """Профили и прогресс для пользователей, созданных до автосоздания"""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserProfile = apps.get_model('gamification', 'UserProfile')
+    UserProgress = apps.get_model('gamification', 'UserProgress')
+    user_ids = list(User.objects.values_list('id', flat=True))
+    for model in (UserProfile, UserProgress):
+        existing = set(model.objects.values_list('user_id', flat=True))
+        model.objects.bulk_create(
+            [model(user_id=user_id) for user_id in user_ids if user_id not in existing],
+            ignore_conflicts=True,
+            batch_size=BATCH_SIZE,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0015_seasons'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(provision_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def start_heartbeats(apps, schema_editor):
+    """Выполняющиеся задачи считаются подавшими сигнал в момент запуска"""
+    PerformanceData = apps.get_model('gamification', 'PerformanceData')
+    PerformanceData.objects.filter(status='running').update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gamification', '0016_provision_users'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='performancedata',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последний сигнал воркера'),
+        ),
+        migrations.AddField(
+            model_name='startransaction',
+            name='job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='gamification.performancedata', verbose_name='Задача'),
+        ),
+        migrations.RunPython(start_heartbeats, migrations.RunPython.noop),
+    ]
@@ -32,6 +32,8 @@ class UserProfile(models.Model):
         verbose_name = "Профиль пользователя"
         verbose_name_plural = "Профили пользователей"
         ordering = ['-stars']
+        # Покрывающий: индекс лидеров строится чтением одного индекса без сортировки
+        indexes = [models.Index(fields=['-stars', 'user', 'group'], name='profile_stars_idx')]
 
 
 class Level(models.Model):
@@ -93,6 +95,9 @@ class TaskCompletion(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     completed_at = models.DateTimeField(auto_now_add=True)
     stars_awarded = models.PositiveIntegerField(default=0)
+    # День (2026-10-18), ISO-неделя (2026-W42) или once, см. gamification/completions.py
+    period_key = models.CharField("Период", max_length=32)
+    request_key = models.CharField("Ключ запроса", max_length=64, blank=True, default='')
     
     def __str__(self):
         return f"{self.user} выполнил {self.task}"
@@ -100,17 +105,25 @@ class TaskCompletion(models.Model):
     class Meta:
         verbose_name = "Выполнение задания"
         verbose_name_plural = "Выполненные задания"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'task', 'period_key'], name='unique_task_completion_per_period'),
+        ]
 
 
 class Prize(models.Model):
     name = models.CharField("Название приза", max_length=200)
     cost_in_stars = models.PositiveIntegerField("Стоимость (в звёздах)")
     description = models.TextField("Описание", blank=True)
+    stock = models.PositiveIntegerField("Остаток", null=True, blank=True, help_text="Пусто — без ограничений")
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.name} ({self.cost_in_stars} ⭐)"
 
+    @property
+    def in_stock(self):
+        return self.stock is None or self.stock > 0
+
     class Meta:
         verbose_name = "Приз"
         verbose_name_plural = "Призы"
@@ -138,6 +151,16 @@ class Battle(models.Model):
     end_time = models.DateTimeField("Конец")
     participants = models.ManyToManyField(User, blank=True)
     active = models.BooleanField("Активен", default=True)
+    settled_at = models.DateTimeField("Итоги подведены", null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['settled_at', 'end_time']),
+            # Идущие и предстоящие батлы на странице батлов
+            models.Index(fields=['active', 'start_time', 'end_time'], name='battle_active_start_idx'),
+            # Последние завершённые батлы; частичный, т.к. условие NOT active не использует обычный индекс
+            models.Index(fields=['-end_time'], condition=models.Q(active=False), name='battle_finished_end_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.start_time} - {self.end_time})"
@@ -156,12 +179,43 @@ class BattleResult(models.Model):
 
 
 class PerformanceData(models.Model):
-    """Модель для загрузки данных по эффективности сотрудников"""
+    """Модель для загрузки данных по эффективности сотрудников (и задача фоновой очереди)"""
+    KIND_IMPORT = 'datalens_import'
+    KIND_TEST = 'datalens_test'
+    KIND_CHOICES = [
+        (KIND_IMPORT, 'Импорт из DataLens'),
+        (KIND_TEST, 'Проверка подключения к DataLens'),
+    ]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Выполнено'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
     date_uploaded = models.DateTimeField(auto_now_add=True)
-    file = models.FileField(upload_to='performance_data/')
+    file = models.FileField(upload_to='performance_data/', blank=True)
     processed = models.BooleanField("Обработан", default=False)
     notes = models.TextField("Примечания", blank=True)
 
+    kind = models.CharField("Тип задачи", max_length=20, choices=KIND_CHOICES, default=KIND_IMPORT)
+    status = models.CharField("Статус", max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Запустил")
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    max_attempts = models.PositiveSmallIntegerField("Максимум попыток", default=3)
+    run_after = models.DateTimeField("Запустить после", default=timezone.now)
+    worker = models.CharField("Воркер", max_length=100, blank=True)
+    rows_processed = models.PositiveIntegerField("Обработано строк", default=0)
+    started_at = models.DateTimeField("Начало", null=True, blank=True)
+    heartbeat_at = models.DateTimeField("Последний сигнал воркера", null=True, blank=True)
+    finished_at = models.DateTimeField("Окончание", null=True, blank=True)
+    duration = models.FloatField("Длительность, с", null=True, blank=True)
+
     def __str__(self):
         return f"Данные от {self.date_uploaded.strftime('%d.%m.%Y')} {'(обработано)' if self.processed else '(не обработано)'}"
 
@@ -169,6 +223,7 @@ class PerformanceData(models.Model):
         verbose_name = "Данные эффективности"
         verbose_name_plural = "Данные эффективности"
         ordering = ['-date_uploaded']
+        indexes = [models.Index(fields=['status', 'run_after'], name='perfdata_queue_idx')]
 
 
 class Notification(models.Model):
@@ -179,6 +234,10 @@ class Notification(models.Model):
     is_active = models.BooleanField("Активно", default=True)
     battle = models.ForeignKey(Battle, on_delete=models.SET_NULL, null=True, blank=True)
     author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    recipient = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name='personal_notifications',
+        verbose_name="Получатель", help_text="Пусто — рассылка всем пользователям"
+    )
 
     def __str__(self):
         return self.title
@@ -187,6 +246,38 @@ class Notification(models.Model):
         verbose_name = "Уведомление"
         verbose_name_plural = "Уведомления"
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['recipient', 'id'], name='notification_recipient_idx')]
+
+
+class InboxItem(models.Model):
+    """Уведомление во входящих конкретного пользователя"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, verbose_name="Уведомление")
+    is_read = models.BooleanField("Прочитано", default=False)
+    created_at = models.DateTimeField("Создано")
+
+    def __str__(self):
+        return f"{self.user}: {self.notification}"
+
+    class Meta:
+        verbose_name = "Входящее уведомление"
+        verbose_name_plural = "Входящие уведомления"
+        ordering = ['-created_at', '-id']
+        constraints = [models.UniqueConstraint(fields=['user', 'notification'], name='inbox_unique_notification')]
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='inbox_user_created_idx'),
+            models.Index(fields=['user', 'is_read'], name='inbox_user_unread_idx'),
+        ]
+
+
+class InboxState(models.Model):
+    """До какой рассылки разнесены входящие пользователя"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    last_broadcast_id = models.BigIntegerField("Последняя рассылка", default=0)
+
+    class Meta:
+        verbose_name = "Состояние входящих"
+        verbose_name_plural = "Состояния входящих"
 
 
 class Purchase(models.Model):
@@ -196,4 +287,130 @@ class Purchase(models.Model):
     purchased_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.user} купил {self.prize}"
\ No newline at end of file
+        return f"{self.user} купил {self.prize}"
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-purchased_at'], name='purchase_user_recent_idx')]
+
+
+class StarTransaction(models.Model):
+    """Журнал начислений и списаний звёзд (только добавление)"""
+    SOURCE_CHOICES = [
+        ('opening', 'Начальный остаток'),
+        ('task', 'Задание'),
+        ('purchase', 'Покупка'),
+        ('import', 'Импорт эффективности'),
+        ('level_bonus', 'Бонус за уровень'),
+        ('battle', 'Батл'),
+        ('adjustment', 'Корректировка'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    amount = models.IntegerField("Изменение")
+    source = models.CharField("Источник", max_length=20, choices=SOURCE_CHOICES)
+    note = models.CharField("Комментарий", max_length=255, blank=True)
+    # Задача импорта, проведшая операцию: повторная попытка не начисляет звёзды дважды
+    job = models.ForeignKey(
+        PerformanceData, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Задача"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user} {self.amount:+d} ⭐ ({self.get_source_display()})"
+
+    class Meta:
+        verbose_name = "Операция со звёздами"
+        verbose_name_plural = "Журнал звёзд"
+        ordering = ['-id']
+        indexes = [models.Index(fields=['user', 'id'], name='startx_user_id_idx')]
+
+
+class ActivityRollup(models.Model):
+    """Активность пользователя за день, неделю или месяц (см. gamification/rollups.py)"""
+    PERIOD_DAY = 'day'
+    PERIOD_WEEK = 'week'
+    PERIOD_MONTH = 'month'
+    PERIOD_CHOICES = [
+        (PERIOD_DAY, 'День'),
+        (PERIOD_WEEK, 'Неделя'),
+        (PERIOD_MONTH, 'Месяц'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    group = models.ForeignKey(Group, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Группа")
+    period = models.CharField("Период", max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField("Начало периода")
+    completions = models.PositiveIntegerField("Выполнено заданий", default=0)
+    stars_earned = models.PositiveIntegerField("Заработано звёзд", default=0)
+    stars_spent = models.PositiveIntegerField("Потрачено звёзд", default=0)
+
+    def __str__(self):
+        return f"{self.user} {self.get_period_display()} {self.period_start}: +{self.stars_earned} ⭐"
+
+    class Meta:
+        verbose_name = "Активность за период"
+        verbose_name_plural = "Активность по периодам"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period', 'period_start'], name='rollup_unique_user_period'),
+        ]
+        indexes = [
+            # Лидеры периода — первые строки индекса, без сортировки
+            models.Index(fields=['period', 'period_start', '-stars_earned', 'id'], name='rollup_leaders_idx'),
+            models.Index(fields=['period', 'period_start', 'group', '-stars_earned', 'id'], name='rollup_group_leaders_idx'),
+        ]
+
+
+class StarBalanceSnapshot(models.Model):
+    """Контрольная точка баланса: сумма журнала до last_transaction_id включительно"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    balance = models.IntegerField("Баланс")
+    last_transaction_id = models.BigIntegerField("Последняя операция")
+    taken_at = models.DateTimeField("Снят", default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user}: {self.balance} ⭐ на #{self.last_transaction_id}"
+
+    class Meta:
+        verbose_name = "Снимок баланса"
+        verbose_name_plural = "Снимки балансов"
+
+
+class Season(models.Model):
+    """Сезон таблицы лидеров; после закрытия места хранятся в SeasonStanding (см. gamification/seasons.py)"""
+    name = models.CharField("Название", max_length=100)
+    start_date = models.DateField("Первый день")
+    end_date = models.DateField("Последний день")
+    frozen_at = models.DateTimeField("Итоги зафиксированы", null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = "Сезон"
+        verbose_name_plural = "Сезоны"
+        ordering = ['-start_date']
+        constraints = [
+            models.UniqueConstraint(fields=['start_date'], name='season_unique_start'),
+        ]
+
+
+class SeasonStanding(models.Model):
+    """Место пользователя в закрытом сезоне: заработанные за сезон звёзды"""
+    season = models.ForeignKey(Season, on_delete=models.CASCADE, related_name='standings', verbose_name="Сезон")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
+    group = models.ForeignKey(Group, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Группа")
+    rank = models.PositiveIntegerField("Место")
+    stars = models.PositiveIntegerField("Звёзды за сезон")
+
+    def __str__(self):
+        return f"{self.season}: {self.rank}. {self.user} ({self.stars} ⭐)"
+
+    class Meta:
+        verbose_name = "Место в сезоне"
+        verbose_name_plural = "Места в сезонах"
+        constraints = [
+            models.UniqueConstraint(fields=['season', 'user'], name='standing_unique_season_user'),
+        ]
+        indexes = [
+            # Таблица сезона — первые строки индекса, без сортировки
+            models.Index(fields=['season', 'rank', 'id'], name='standing_rank_idx'),
+            models.Index(fields=['season', 'group', 'rank', 'id'], name='standing_group_rank_idx'),
+        ]
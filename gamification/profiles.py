@@ -0,0 +1,99 @@
+"""
+Данные личного кабинета.
+
+Страница собирается фиксированным числом запросов: профиль с группой и
+последние покупки с призами. Блок прогресса (уровень, следующий уровень,
+активность за неделю и месяц) вычисляется по строке ``UserProgress``,
+порогам уровней из ``levels`` и агрегатам ``rollups`` и кешируется по
+версии пользователя (она поднимается после любого изменения его звёзд) и
+версии справочника уровней, поэтому в установившемся режиме блок не делает
+запросов, а правка уровня в админке сразу меняет его у всех. Профили создаются
+при создании пользователя; GET ничего не записывает.
+"""
+from bisect import bisect_right
+from dataclasses import dataclass
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import catalog, levels, rollups
+from .caching import get_version, user_version_key
+from .models import UserProfile, UserProgress, Purchase
+
+PROGRESS_CACHE_TIMEOUT = 3600
+RECENT_PURCHASES = 5
+
+
+@dataclass
+class ProfilePage:
+    profile: UserProfile
+    progress: dict
+    purchases: list
+
+
+def _level(level):
+    return {'name': level.name, 'stars_required': level.stars_required} if level else None
+
+
+def _find_level(group_table, level_id):
+    if level_id is None:
+        return None
+    if group_table is not None and level_id in group_table.by_id:
+        return group_table.by_id[level_id]
+    # Уровень другой группы: пользователя перевели, а прогресс ещё прежний
+    for table in levels.tables().values():
+        if level_id in table.by_id:
+            return table.by_id[level_id]
+    return None
+
+
+def compute_progress(user_id, group_id, day=None):
+    """Блок прогресса: текущий и следующий уровни, процент и активность за неделю и месяц"""
+    row = UserProgress.objects.filter(user_id=user_id).values('current_level_id', 'stars_earned').first()
+    current_level_id, stars_earned = (row['current_level_id'], row['stars_earned']) if row else (None, 0)
+
+    table = levels.table_for(group_id)
+    current = _find_level(table, current_level_id)
+    next_level = None
+    if table is not None:
+        # Первый уровень группы выше текущего (или самый первый)
+        index = bisect_right(table.thresholds, current.stars_required if current else -1)
+        next_level = table.levels[index] if index < len(table.levels) else None
+
+    percent = 0
+    if next_level and next_level.stars_required > 0:
+        percent = min(stars_earned / next_level.stars_required * 100, 100)
+
+    activity = rollups.user_summary(user_id, day)
+    return {
+        'level': _level(current),
+        'next_level': _level(next_level),
+        'stars_earned': stars_earned,
+        'stars_left': max(next_level.stars_required - stars_earned, 0) if next_level else 0,
+        'percent': round(percent),
+        'activity': {
+            period: {'stars_earned': row.stars_earned, 'completions': row.completions} if row else None
+            for period, row in activity.items()
+        },
+    }
+
+
+def progress(user_id, group_id):
+    """Блок прогресса из кеша; ключ — версии пользователя и уровней, группа и день (смена недели и месяца)"""
+    day = timezone.localdate()
+    versions = f"{get_version(user_version_key(user_id))}.{catalog.version('levels')}"
+    key = f'profile:{user_id}:progress:{versions}:{group_id}:{day.isoformat()}'
+    block = cache.get(key)
+    if block is None:
+        block = compute_progress(user_id, group_id, day)
+        cache.set(key, block, PROGRESS_CACHE_TIMEOUT)
+    return block
+
+
+def load(user):
+    """Всё для личного кабинета user; профиля может не быть (пользователь создан до автосоздания)"""
+    profile = UserProfile.objects.select_related('group').filter(user=user).first() or UserProfile(user=user)
+    recent = list(
+        Purchase.objects.filter(user=user).select_related('prize').order_by('-purchased_at')[:RECENT_PURCHASES]
+    )
+    return ProfilePage(profile=profile, progress=progress(user.id, profile.group_id), purchases=recent)
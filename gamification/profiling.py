@@ -0,0 +1,146 @@
+"""
+Профилирование запросов.
+
+``ProfilingMiddleware`` с вероятностью ``PROFILING_SAMPLE_RATE`` включает для
+запроса сбор: полное время, число и время SQL-запросов, повторы одного и того
+же SQL (признак N+1), время отрисовки шаблонов и обработчиков сигналов. Итоги
+копятся в памяти процесса по имени представления для страницы сотрудников и
+одновременно попадают в общие для всех воркеров метрики ``metrics.py``
+(``/metrics``), чтобы Prometheus видел сумму, а не случайный процесс.
+
+Времена вложены друг в друга: SQL внутри шаблона или обработчика сигнала
+входит и в их время. Для шаблонов и сигналов считается только внешний
+вызов, поэтому {% include %} и сигналы из обработчиков не учитываются дважды.
+"""
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+
+from django.dispatch import Signal
+from django.template.base import Template
+
+from . import metrics
+
+DUPLICATE_THRESHOLD = 3  # один и тот же SQL столько раз за запрос — вероятно, N+1
+RECENT_SIZE = 50
+KINDS = ('sql', 'template', 'signal')
+
+current = ContextVar('gamification_profile', default=None)
+
+
+@dataclass
+class Sample:
+    sql_count: int = 0
+    times: dict = field(default_factory=lambda: dict.fromkeys(KINDS, 0.0))
+    statements: Counter = field(default_factory=Counter)
+    depth: Counter = field(default_factory=Counter)
+
+    def duplicates(self):
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= DUPLICATE_THRESHOLD]
+
+
+@dataclass
+class ViewStats:
+    requests: int = 0
+    wall: float = 0.0
+    wall_max: float = 0.0
+    sql_count: int = 0
+    times: dict = field(default_factory=lambda: dict.fromkeys(KINDS, 0.0))
+    duplicate_requests: int = 0  # запросов с повторяющимся SQL
+
+
+_lock = threading.Lock()
+_installed = False
+_stats = {}
+_recent = deque(maxlen=RECENT_SIZE)
+
+
+def execute(execute, sql, params, many, context):
+    """Обёртка для connection.execute_wrapper: SQL параметризован, повтор = тот же текст"""
+    sample = current.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if sample is not None:
+            sample.sql_count += 1
+            sample.times['sql'] += time.perf_counter() - started
+            sample.statements[sql] += 1
+
+
+def _timed(kind, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        sample = current.get()
+        if sample is None or sample.depth[kind]:
+            return func(*args, **kwargs)
+        sample.depth[kind] += 1
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sample.depth[kind] -= 1
+            sample.times[kind] += time.perf_counter() - started
+    return wrapper
+
+
+def install():
+    """Оборачивает отрисовку шаблонов и отправку сигналов (один раз на процесс)"""
+    global _installed
+    with _lock:
+        if _installed:
+            return
+        # Так же инструментирует шаблоны тестовый раннер Django
+        Template._render = _timed('template', Template._render)
+        Signal.send = _timed('signal', Signal.send)
+        Signal.send_robust = _timed('signal', Signal.send_robust)
+        _installed = True
+
+
+def record(view, sample, wall):
+    duplicates = sample.duplicates()
+    with _lock:
+        stats = _stats.setdefault(view, ViewStats())
+        stats.requests += 1
+        stats.wall += wall
+        stats.wall_max = max(stats.wall_max, wall)
+        stats.sql_count += sample.sql_count
+        for kind in KINDS:
+            stats.times[kind] += sample.times[kind]
+        stats.duplicate_requests += bool(duplicates)
+        _recent.append({
+            'view': view,
+            'at': time.time(),
+            'wall': wall,
+            'sql_count': sample.sql_count,
+            'times': dict(sample.times),
+            'duplicates': duplicates[:5],
+        })
+    metrics.PROFILED_REQUEST_DURATION.observe(wall, view=view)
+    metrics.PROFILED_SQL_QUERIES.inc(sample.sql_count, view=view)
+    for kind in KINDS:
+        metrics.PROFILED_SECONDS.inc(sample.times[kind], view=view, kind=kind)
+    if duplicates:
+        metrics.PROFILED_DUPLICATE_SQL.inc(view=view)
+
+
+def snapshot():
+    """({представление: ViewStats}, последние замеры — новые сверху)"""
+    with _lock:
+        stats = {
+            view: ViewStats(
+                requests=s.requests, wall=s.wall, wall_max=s.wall_max, sql_count=s.sql_count,
+                times=dict(s.times), duplicate_requests=s.duplicate_requests,
+            )
+            for view, s in _stats.items()
+        }
+        return stats, list(reversed(_recent))
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _recent.clear()
@@ -0,0 +1,53 @@
+"""
+Автосоздание профиля и прогресса пользователя.
+
+У каждого пользователя ровно одна строка ``UserProfile`` и одна
+``UserProgress``: они создаются сигналом при создании пользователя, поэтому
+страницы и журнал звёзд не проверяют их наличие. Пользователей, созданных
+в обход сигналов (``bulk_create``, SQL, внешняя синхронизация), дополняет
+``sync`` — пачками по id, через ``bulk_create(ignore_conflicts=True)``,
+так что повторный или параллельный запуск безопасен.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+
+from .models import UserProfile, UserProgress
+
+BATCH_SIZE = 2000
+
+
+def provision(user_ids):
+    """Создаёт недостающие профили и прогресс; существующие строки не меняются"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    with transaction.atomic():
+        UserProfile.objects.bulk_create(
+            [UserProfile(user_id=user_id) for user_id in user_ids], ignore_conflicts=True, batch_size=BATCH_SIZE
+        )
+        UserProgress.objects.bulk_create(
+            [UserProgress(user_id=user_id) for user_id in user_ids], ignore_conflicts=True, batch_size=BATCH_SIZE
+        )
+
+
+def missing(after=0, limit=BATCH_SIZE):
+    """Id пользователей после after, у которых нет профиля или прогресса"""
+    return list(
+        User.objects.filter(id__gt=after)
+        .filter(Q(userprofile__isnull=True) | Q(userprogress__isnull=True))
+        .order_by('id')
+        .values_list('id', flat=True)[:limit]
+    )
+
+
+def sync(batch_size=BATCH_SIZE, progress=None):
+    """Дополняет всех пользователей без профиля или прогресса; возвращает их число"""
+    last_id = provisioned = 0
+    while user_ids := missing(last_id, batch_size):
+        provision(user_ids)
+        last_id = user_ids[-1]
+        provisioned += len(user_ids)
+        if progress is not None:
+            progress(provisioned, last_id)
+    return provisioned
@@ -0,0 +1,35 @@
+"""
+Покупка призов.
+
+Звёзды списываются условным ``UPDATE ... WHERE stars >= cost`` (через
+журнал), а остаток ограниченного приза уменьшается таким же условным
+``UPDATE ... WHERE stock > 0`` в той же транзакции. Если не хватило звёзд
+или приз закончился, откатывается всё, поэтому параллельные покупки не уводят
+баланс в минус и не продают больше, чем есть на складе.
+"""
+from django.db import transaction
+from django.db.models import F, Q
+
+from . import catalog, ledger, metrics
+from .models import Prize, Purchase
+
+
+class OutOfStock(Exception):
+    """Ограниченный приз закончился"""
+
+
+def purchase(user, prize):
+    """Покупает приз; InsufficientStars или OutOfStock, если купить нельзя"""
+    with transaction.atomic():
+        ledger.apply(user.id, -prize.cost_in_stars, 'purchase', note=prize.name)
+        # NULL - 1 остаётся NULL, поэтому неограниченные призы проходят тем же запросом
+        reserved = Prize.objects.filter(Q(stock__isnull=True) | Q(stock__gt=0), id=prize.id).update(
+            stock=F('stock') - 1
+        )
+        if not reserved:
+            raise OutOfStock(f'Приз "{prize.name}" закончился')
+        if prize.stock is not None:
+            # Остаток показывается в магазине из справочника
+            transaction.on_commit(lambda: catalog.invalidate('prizes'))
+        transaction.on_commit(lambda: metrics.PURCHASES.inc(prize=prize.id))
+        return Purchase.objects.create(user=user, prize=prize)
@@ -0,0 +1,158 @@
+"""
+Агрегаты активности по дням, неделям и месяцам.
+
+``ActivityRollup`` хранит для пользователя за период число выполненных
+заданий, заработанные и потраченные звёзды. Агрегаты обновляются после каждой
+операции журнала (сигнал ``stars_changed``): недостающие строки создаются с
+нулями (``ignore_conflicts``), затем счётчики увеличиваются
+``UPDATE ... SET x = x + d``, поэтому параллельные воркеры не теряют значений.
+Лидеры недели или месяца — первые строки индекса
+``(period, period_start, -stars_earned)``: стоимость не зависит от числа
+операций. Историю из журнала переносит ``backfill`` пачками по id.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from .models import ActivityRollup, StarTransaction, UserProfile
+
+PERIODS = (ActivityRollup.PERIOD_DAY, ActivityRollup.PERIOD_WEEK, ActivityRollup.PERIOD_MONTH)
+# Начальные остатки при переходе на журнал — не активность
+EXCLUDED_SOURCES = frozenset({'opening'})
+BATCH_SIZE = 500
+BACKFILL_CHUNK = 5000
+
+
+def period_start(period, day):
+    if period == ActivityRollup.PERIOD_WEEK:
+        return day - timedelta(days=day.weekday())
+    if period == ActivityRollup.PERIOD_MONTH:
+        return day.replace(day=1)
+    return day
+
+
+def _totals(entries):
+    """entries — (user_id, group_id, день, amount, source); итоги по (user_id, период, начало)"""
+    totals = defaultdict(lambda: [0, 0, 0])
+    groups = {}
+    for user_id, group_id, day, amount, source in entries:
+        if not amount or source in EXCLUDED_SOURCES:
+            continue
+        groups[user_id] = group_id
+        for period in PERIODS:
+            row = totals[(user_id, period, period_start(period, day))]
+            row[0] += source == 'task'
+            if amount > 0:
+                row[1] += amount
+            else:
+                row[2] -= amount
+    return totals, groups
+
+
+def _apply(totals, groups):
+    if not totals:
+        return
+    with transaction.atomic():
+        ActivityRollup.objects.bulk_create(
+            [
+                ActivityRollup(user_id=user_id, group_id=groups[user_id], period=period, period_start=start)
+                for user_id, period, start in totals
+            ],
+            ignore_conflicts=True,
+            batch_size=BATCH_SIZE,
+        )
+        # Как в ledger.apply_bulk: одинаковые приращения — одним UPDATE
+        by_delta = defaultdict(list)
+        for (user_id, period, start), (completions, earned, spent) in totals.items():
+            by_delta[(period, start, groups[user_id], completions, earned, spent)].append(user_id)
+        for (period, start, group_id, completions, earned, spent), user_ids in by_delta.items():
+            for offset in range(0, len(user_ids), BATCH_SIZE):
+                ActivityRollup.objects.filter(
+                    period=period, period_start=start, user_id__in=user_ids[offset:offset + BATCH_SIZE]
+                ).update(
+                    group_id=group_id,
+                    completions=F('completions') + completions,
+                    stars_earned=F('stars_earned') + earned,
+                    stars_spent=F('stars_spent') + spent,
+                )
+
+
+def rows(entries):
+    """Несохранённые агрегаты по entries (как у ``_totals``) — для заполнения пустой таблицы"""
+    totals, groups = _totals(entries)
+    return [
+        ActivityRollup(
+            user_id=user_id, group_id=groups[user_id], period=period, period_start=start,
+            completions=completions, stars_earned=earned, stars_spent=spent,
+        )
+        for (user_id, period, start), (completions, earned, spent) in totals.items()
+    ]
+
+
+def record(changes, day=None):
+    """Добавляет операции журнала (StarChange) в агрегаты дня, недели и месяца"""
+    day = day or timezone.localdate()
+    _apply(*_totals(
+        (change.user_id, change.group_id, day, change.amount, change.source) for change in changes
+    ))
+
+
+def leaders(period, group_id=None, day=None, limit=10):
+    """Лучшие по заработанным звёздам за текущий период; места при равенстве делятся"""
+    rows = ActivityRollup.objects.filter(
+        period=period, period_start=period_start(period, day or timezone.localdate()), stars_earned__gt=0
+    )
+    if group_id is not None:
+        rows = rows.filter(group_id=group_id)
+    rows = list(rows.select_related('user').order_by('-stars_earned', 'id')[:limit])
+    prev_stars = None
+    for number, row in enumerate(rows, start=1):
+        if row.stars_earned != prev_stars:
+            rank, prev_stars = number, row.stars_earned
+        row.rank, row.stars = rank, row.stars_earned
+    return rows
+
+
+def user_summary(user_id, day=None):
+    """{'week': ActivityRollup | None, 'month': ...} текущих недели и месяца одним запросом"""
+    day = day or timezone.localdate()
+    periods = (ActivityRollup.PERIOD_WEEK, ActivityRollup.PERIOD_MONTH)
+    condition = Q()
+    for period in periods:
+        condition |= Q(period=period, period_start=period_start(period, day))
+    found = {row.period: row for row in ActivityRollup.objects.filter(condition, user_id=user_id)}
+    return {period: found.get(period) for period in periods}
+
+
+def backfill(chunk_size=BACKFILL_CHUNK, progress=None):
+    """
+    Перестраивает агрегаты по журналу звёзд пачками по id.
+
+    Операции после начала перестройки попадают в агрегаты обычным путём;
+    запускайте в спокойное время — операция, проведённая в момент удаления
+    старых агрегатов, может учесться дважды. Возвращает число операций.
+    """
+    ActivityRollup.objects.all().delete()
+    upto = StarTransaction.objects.aggregate(last=Max('id'))['last'] or 0
+    last_id = processed = 0
+    while last_id < upto:
+        batch = list(
+            StarTransaction.objects.filter(id__gt=last_id, id__lte=upto)
+            .order_by('id')
+            .values_list('id', 'user_id', 'amount', 'source', 'created_at')[:chunk_size]
+        )
+        if not batch:
+            break
+        groups = dict(UserProfile.objects.filter(user_id__in={row[1] for row in batch}).values_list('user_id', 'group_id'))
+        _apply(*_totals(
+            (user_id, groups.get(user_id), timezone.localdate(created_at), amount, source)
+            for _, user_id, amount, source, created_at in batch
+        ))
+        last_id = batch[-1][0]
+        processed += len(batch)
+        if progress is not None:
+            progress(processed, upto)
+    return processed
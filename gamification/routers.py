@@ -0,0 +1,56 @@
+"""
+Чтение с реплики.
+
+Запросы на чтение идут на алиас ``replica`` только внутри представлений из
+``DATABASE_REPLICA_VIEWS`` (решение принимает ``ReplicaMiddleware``). Всё
+остальное, любая запись и любое чтение после записи в том же запросе или
+внутри транзакции идут на основную БД. Если реплика не настроена, роутер
+ничего не меняет.
+"""
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+# Сессии меняются при каждом входе: отстающая реплика «разлогинила» бы пользователя
+PRIMARY_ONLY_APPS = frozenset({'sessions'})
+
+
+@dataclass
+class RoutingState:
+    use_replica: bool = False
+    wrote: bool = False
+
+
+routing = ContextVar('gamification_db_routing', default=None)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections.settings
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = routing.get()
+        if state is None or not state.use_replica or state.wrote:
+            return None
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return None
+        # Чтение внутри транзакции (например, select_for_update) должно видеть её данные
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приходит с основной БД через репликацию
+        return db != REPLICA_ALIAS
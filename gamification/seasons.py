@@ -0,0 +1,109 @@
+"""
+Сезоны таблицы лидеров.
+
+Сезон — несколько календарных месяцев (``SEASON_MONTHS`` в настройках,
+по умолчанию квартал). После последнего дня сезона ``freeze`` один раз
+ранжирует звёзды, заработанные за сезон (из агрегатов активности, см.
+``rollups.py``), и записывает места одной пачкой в компактную таблицу
+``SeasonStanding``. Отметка ``frozen_at`` ставится условным UPDATE, поэтому
+сезон не фиксируется дважды. Таблицы прошлых сезонов читаются только из
+``SeasonStanding`` по индексу ``(season, rank)``; список закрытых сезонов —
+справочник ``catalog.get('seasons')``.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import catalog
+from .models import ActivityRollup, Season, SeasonStanding
+
+
+def bounds(day):
+    """(первый день, последний день) сезона, в который попадает day"""
+    months = max(1, getattr(settings, 'SEASON_MONTHS', 3))
+    index = (day.year * 12 + day.month - 1) // months * months
+    start = date(index // 12, index % 12 + 1, 1)
+    index += months
+    return start, date(index // 12, index % 12 + 1, 1) - timedelta(days=1)
+
+
+def ensure_current(day=None):
+    """Сезон, идущий в day; создаётся, если его ещё нет"""
+    start, end = bounds(day or timezone.localdate())
+    if (start.year, start.month) == (end.year, end.month):
+        name = f'Сезон {start:%m.%Y}'
+    else:
+        name = f'Сезон {start:%m.%Y}–{end:%m.%Y}'
+    season, _ = Season.objects.get_or_create(start_date=start, defaults={'name': name, 'end_date': end})
+    return season
+
+
+def due(day=None):
+    """Id закончившихся и ещё не зафиксированных сезонов, от самых старых"""
+    return list(
+        Season.objects.filter(frozen_at__isnull=True, end_date__lt=day or timezone.localdate())
+        .order_by('end_date', 'id')
+        .values_list('id', flat=True)
+    )
+
+
+def _totals(season):
+    """(user_id, группа, звёзды) за сезон по убыванию; целые месяцы — из месячных агрегатов"""
+    whole_months = season.start_date.day == 1 and (season.end_date + timedelta(days=1)).day == 1
+    period = ActivityRollup.PERIOD_MONTH if whole_months else ActivityRollup.PERIOD_DAY
+    return (
+        ActivityRollup.objects.filter(period=period, period_start__range=(season.start_date, season.end_date))
+        # Группа — текущая из профиля (у пользователя он один), в том же запросе
+        .values('user_id', 'user__userprofile__group_id')
+        .annotate(total=Sum('stars_earned'))
+        .filter(total__gt=0)
+        .order_by('-total', 'user_id')
+        .values_list('user_id', 'user__userprofile__group_id', 'total')
+    )
+
+
+def rank(totals):
+    """[(user_id, место, звёзды)] для упорядоченных totals; при равенстве места делятся"""
+    ranked, prev_stars = [], None
+    for number, (user_id, stars) in enumerate(totals, start=1):
+        if stars != prev_stars:
+            place, prev_stars = number, stars
+        ranked.append((user_id, place, stars))
+    return ranked
+
+
+def freeze(season_id, now=None):
+    """Фиксирует места сезона; число мест или None, если сезон идёт или уже зафиксирован"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        claimed = Season.objects.filter(
+            id=season_id, frozen_at__isnull=True, end_date__lt=timezone.localdate(now)
+        ).update(frozen_at=now)
+        if not claimed:
+            return None
+        season = Season.objects.get(id=season_id)
+        totals = list(_totals(season))
+        groups = {user_id: group_id for user_id, group_id, _ in totals}
+        standings = SeasonStanding.objects.bulk_create([
+            SeasonStanding(season_id=season_id, user_id=user_id, group_id=groups[user_id], rank=place, stars=stars)
+            for user_id, place, stars in rank((user_id, stars) for user_id, _, stars in totals)
+        ])
+
+    # update не отправляет post_save — список закрытых сезонов сбрасываем сами
+    transaction.on_commit(lambda: catalog.invalidate('seasons'))
+    return len(standings)
+
+
+def leaders(season_id, group_id=None, limit=10):
+    """Лучшие закрытого сезона; в группе места пересчитываются среди её участников"""
+    rows = SeasonStanding.objects.filter(season_id=season_id)
+    if group_id is not None:
+        rows = rows.filter(group_id=group_id)
+    rows = list(rows.select_related('user').order_by('rank', 'id')[:limit])
+    if group_id is not None:
+        for row, (_, place, _) in zip(rows, rank((row.user_id, row.stars) for row in rows)):
+            row.rank = place
+    return rows
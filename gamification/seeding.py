@@ -0,0 +1,163 @@
+"""
+Синтетические данные для тестов бюджетов, нагрузочных тестов и планирования ёмкости.
+
+Масштаб 1.0 соответствует «боевому» объёму: 10k пользователей, 1k батлов,
+1M выполнений заданий, 50k покупок и 100k личных уведомлений. Всё создаётся
+через ``bulk_create`` пачками, без сигналов, поэтому кеши (лидеры,
+справочники) после заполнения нужно сбросить. Связанные данные сигналов
+заполняются здесь же: журнал звёзд начинается с начального остатка каждого
+пользователя (как после миграции на журнал), выполнения датируются днём своего
+периода, а агрегаты активности строятся по ним. Генератор детерминирован:
+одинаковые ``scale`` и ``random_seed`` дают одинаковые данные.
+"""
+import random
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from . import rollups
+from .completions import period_key
+from .models import (
+    Group, Level, UserProfile, UserProgress, Task, TaskCompletion, Prize, Purchase,
+    BattleType, Battle, BattleResult, Notification, InboxItem, StarTransaction, ActivityRollup,
+)
+
+USERNAME_PREFIX = 'operator'
+BATCH_SIZE = 5000
+
+
+def scaled(full, scale):
+    return max(1, int(full * scale))
+
+
+def seed(scale=1.0, random_seed=42, password=None, progress=None):
+    """
+    Заполняет пустую БД данными масштаба scale.
+
+    password — общий пароль операторов (хешируется один раз); без него вход
+    возможен только через force_login. progress(шаг, количество) вызывается
+    после каждой таблицы.
+    """
+    rnd = random.Random(random_seed)
+    now = timezone.now()
+    report = progress or (lambda step, count: None)
+
+    groups = Group.objects.bulk_create([Group(name=f'Группа {i}') for i in range(5)])
+    Level.objects.bulk_create([
+        Level(name=f'Уровень {n}', group=group, stars_required=100 * n * n, bonus_stars=10 * n)
+        for group in groups for n in range(1, 6)
+    ])
+    tasks = Task.objects.bulk_create([
+        Task(title=f'Задание {i}', stars_reward=rnd.randint(1, 20), task_type=('daily', 'weekly', 'one_time')[i % 3])
+        for i in range(20)
+    ])
+    prizes = Prize.objects.bulk_create([
+        Prize(name=f'Приз {i}', cost_in_stars=50 * (i + 1)) for i in range(10)
+    ])
+    report('справочники', len(groups) + len(tasks) + len(prizes))
+
+    password_hash = make_password(password)
+    users = User.objects.bulk_create(
+        [
+            User(username=f'{USERNAME_PREFIX}{i}', first_name='Оператор', last_name=str(i), password=password_hash)
+            for i in range(scaled(10_000, scale))
+        ],
+        batch_size=2000,
+    )
+    profiles = UserProfile.objects.bulk_create(
+        [UserProfile(user=user, stars=rnd.randint(0, 3000), group=rnd.choice(groups)) for user in users],
+        batch_size=2000,
+    )
+    UserProgress.objects.bulk_create([UserProgress(user=user) for user in users], batch_size=2000)
+    # Баланс профиля должен сходиться с журналом (reconcile_stars)
+    StarTransaction.objects.bulk_create(
+        [
+            StarTransaction(user_id=profile.user_id, amount=profile.stars, source='opening', note='Начальный остаток')
+            for profile in profiles if profile.stars
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    report('пользователи', len(users))
+
+    battle_types = BattleType.objects.bulk_create([
+        BattleType(name=f'Тип {i}', stars_reward={'1': 30, '2': 20, '3': 10}) for i in range(3)
+    ])
+    battles = []
+    for i in range(scaled(1000, scale)):
+        kind = i % 3
+        if kind == 0:    # активный
+            start, end, active = now - timedelta(hours=1), now + timedelta(hours=1 + i % 5), True
+        elif kind == 1:  # предстоящий
+            start, end, active = now + timedelta(hours=1 + i), now + timedelta(hours=2 + i), True
+        else:            # завершённый
+            start, end, active = now - timedelta(days=2 + i), now - timedelta(days=1 + i), False
+        battles.append(Battle(name=f'Батл {i}', battle_type=rnd.choice(battle_types), start_time=start, end_time=end, active=active))
+    battles = Battle.objects.bulk_create(battles)
+
+    Participant = Battle.participants.through
+    participants, results = [], []
+    for battle in battles:
+        for user in rnd.sample(users, min(len(users), 10)):
+            participants.append(Participant(battle_id=battle.id, user_id=user.id))
+            if battle.start_time <= now:
+                results.append(BattleResult(battle=battle, user=user, score=rnd.randint(0, 100)))
+    Participant.objects.bulk_create(participants, batch_size=BATCH_SIZE)
+    BattleResult.objects.bulk_create(results, batch_size=BATCH_SIZE)
+    report('батлы', len(battles))
+
+    completions, days, seen = [], [], set()
+    today = timezone.localdate()
+    while len(completions) < scaled(1_000_000, scale):
+        task, user = rnd.choice(tasks), rnd.choice(users)
+        day = today - timedelta(days=rnd.randint(0, 365))
+        key = period_key(task.task_type, day)
+        if (task.id, user.id, key) not in seen:
+            seen.add((task.id, user.id, key))
+            completions.append(TaskCompletion(task=task, user=user, period_key=key, stars_awarded=5))
+            days.append(day)
+    completions = TaskCompletion.objects.bulk_create(completions, batch_size=BATCH_SIZE)
+    # completed_at заполняется временем вставки — переносим выполнения в их дни
+    by_day = defaultdict(list)
+    for completion, day in zip(completions, days):
+        by_day[day].append(completion.id)
+    for day, ids in by_day.items():
+        completed_at = timezone.make_aware(datetime.combine(day, time(12)))
+        for offset in range(0, len(ids), BATCH_SIZE):
+            TaskCompletion.objects.filter(id__in=ids[offset:offset + BATCH_SIZE]).update(completed_at=completed_at)
+    report('выполнения заданий', len(completions))
+
+    groups_by_user = {profile.user_id: profile.group_id for profile in profiles}
+    activity = ActivityRollup.objects.bulk_create(
+        rollups.rows(
+            (completion.user_id, groups_by_user[completion.user_id], day, completion.stars_awarded, 'task')
+            for completion, day in zip(completions, days)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    report('агрегаты активности', len(activity))
+
+    purchases = Purchase.objects.bulk_create(
+        [Purchase(user=rnd.choice(users), prize=rnd.choice(prizes)) for _ in range(scaled(50_000, scale))],
+        batch_size=BATCH_SIZE,
+    )
+    report('покупки', len(purchases))
+
+    broadcasts = Notification.objects.bulk_create([
+        Notification(title=f'Новость {i}', message='Рассылка', battle=battles[i % len(battles)]) for i in range(20)
+    ])
+    personal = Notification.objects.bulk_create(
+        [
+            Notification(title='Звёзды начислены', message='+5 ⭐', recipient=users[i % len(users)])
+            for i in range(scaled(100_000, scale))
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    InboxItem.objects.bulk_create(
+        [InboxItem(user_id=n.recipient_id, notification=n, created_at=n.created_at) for n in personal],
+        batch_size=BATCH_SIZE,
+    )
+    report('уведомления', len(broadcasts) + len(personal))
+    return {'users': users, 'tasks': tasks, 'prizes': prizes, 'battles': battles, 'broadcasts': broadcasts}
@@ -0,0 +1,106 @@
+"""
+Подведение итогов батлов.
+
+Когда батл закончился, все его результаты ранжируются одним проходом по
+убыванию счёта. При равенстве места делятся (1, 1, 3), и каждый участник
+получает награду за своё место из ``BattleType.stars_reward``. Места
+записываются пакетным ``bulk_update``, звёзды начисляются через журнал одной
+пачкой, и всё это происходит в одной транзакции с отметкой ``settled_at``.
+Отметка ставится условным UPDATE, поэтому один батл не может быть подведён
+дважды, даже если его одновременно обрабатывают несколько процессов.
+"""
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import catalog, inbox, ledger
+from .caching import bump_version
+from .models import Battle, BattleResult
+from .signals import BATTLES_VERSION_KEY
+
+POSITION_BATCH = 500
+
+
+@dataclass
+class Settlement:
+    battle_id: int
+    results: int
+    winners: int
+    stars_awarded: int
+
+
+def rank(results):
+    """Проставляет position по убыванию score; при равенстве места делятся"""
+    ordered = sorted(results, key=lambda result: (-result.score, result.user_id))
+    prev_score = None
+    for number, result in enumerate(ordered, start=1):
+        if result.score != prev_score:
+            position, prev_score = number, result.score
+        result.position = position
+    return ordered
+
+
+def rewards(stars_reward):
+    """{место: звёзды} из JSON типа батла; некорректные ключи пропускаются"""
+    table = {}
+    for place, stars in (stars_reward or {}).items():
+        try:
+            place, stars = int(place), int(stars)
+        except (TypeError, ValueError):
+            continue
+        if place > 0 and stars > 0:
+            table[place] = stars
+    return table
+
+
+def due(now=None):
+    """Id закончившихся батлов без итогов, от самых старых"""
+    now = now or timezone.now()
+    return list(
+        Battle.objects.filter(settled_at__isnull=True, end_time__lte=now)
+        .order_by('end_time', 'id')
+        .values_list('id', flat=True)
+    )
+
+
+def settle(battle_id, now=None):
+    """Подводит итоги батла; None, если батл ещё идёт или уже подведён"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        claimed = Battle.objects.filter(id=battle_id, settled_at__isnull=True, end_time__lte=now).update(
+            settled_at=now, active=False
+        )
+        if not claimed:
+            return None
+        battle = Battle.objects.only('id', 'name', 'battle_type_id').get(id=battle_id)
+
+        results = rank(BattleResult.objects.filter(battle_id=battle_id).only('id', 'user_id', 'score'))
+        BattleResult.objects.bulk_update(results, ['position'], batch_size=POSITION_BATCH)
+
+        battle_type = catalog.get('battle_types').get(battle.battle_type_id)
+        table = rewards(battle_type['stars_reward'] if battle_type else None)
+        awards = {result.user_id: table[result.position] for result in results if result.position in table}
+        # Пользователей без профиля журнал пропускает — о награде сообщаем только получившим её
+        credited = {
+            change.user_id: change.amount
+            for change in ledger.apply_bulk(awards, 'battle', note=f'Батл {battle.name}')
+        }
+        inbox.notify_many([
+            (
+                result.user_id,
+                f"🏆 Итоги батла {battle.name}",
+                f"Вы заняли {result.position} место и получили {credited[result.user_id]} ⭐!",
+            )
+            for result in results
+            if result.user_id in credited
+        ], battle=battle)
+
+    # update/bulk_update не отправляют post_save — сбрасываем кеш страницы батлов сами
+    transaction.on_commit(lambda: bump_version(BATTLES_VERSION_KEY))
+    return Settlement(
+        battle_id=battle_id,
+        results=len(results),
+        winners=len(credited),
+        stars_awarded=sum(credited.values()),
+    )
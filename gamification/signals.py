@@ -1,36 +1,125 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from django.contrib.auth.models import User
-from django.utils import timezone
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import catalog, inbox, leaderboard, levels, live, metrics, provisioning, rollups
+from .ledger import stars_changed, StarChange
+from .caching import bump_version, bump_user_versions
+from .models import UserProfile, UserProgress, Group, Task, Prize, Level, BattleType, Season, Notification, Battle, BattleResult
+
+# Версия состояния батлов: входит в ключи кешированных фрагментов страницы батлов
+BATTLES_VERSION_KEY = 'battles:version'
+# Версия списка групп: название группы выводится в шапке и фильтре лидеров
+GROUPS_VERSION_KEY = 'groups:version'
+
+
+@receiver(post_save, sender=UserProfile)
+def sync_leaderboard(sender, instance, **kwargs):
+    """Инкрементальное обновление таблицы лидеров при сохранении профиля"""
+    leaderboard.record(instance.user_id, instance.group_id, instance.stars)
+    leaderboard.standings_changed()
+
+
+@receiver(stars_changed)
+def leaderboard_on_stars_changed(sender, changes, **kwargs):
+    for change in changes:
+        leaderboard.record(change.user_id, change.group_id, change.stars)
+    leaderboard.standings_changed()
 
-from .models import UserProfile, UserProgress, Level, Notification
+
+@receiver(stars_changed)
+def rollups_on_stars_changed(sender, changes, **kwargs):
+    rollups.record(changes)
+
+
+@receiver(stars_changed)
+def count_stars(sender, changes, **kwargs):
+    for change in changes:
+        if change.amount > 0:
+            metrics.STARS_AWARDED.inc(change.amount, source=change.source)
+        elif change.amount < 0:
+            metrics.STARS_SPENT.inc(-change.amount, source=change.source)
+
+
+@receiver(post_delete, sender=UserProfile)
+def drop_from_leaderboard(sender, instance, **kwargs):
+    leaderboard.remove(instance.user_id)
+    leaderboard.standings_changed()
+
+
+@receiver([post_save, post_delete], sender=Group)
+def bump_groups_version(sender, **kwargs):
+    bump_version(GROUPS_VERSION_KEY)
 
 
 @receiver(post_save, sender=UserProfile)
 def update_user_progress(sender, instance, created, **kwargs):
     """Обновление прогресса при изменении профиля"""
-    progress, created = UserProgress.objects.get_or_create(user=instance.user)
-    
-    # Обновляем общее количество звезд
-    progress.stars_earned = instance.stars
-    progress.save()
-    
-    # Проверяем, достиг ли пользователь нового уровня
-    if instance.group:
-        levels = Level.objects.filter(group=instance.group, stars_required__lte=instance.stars).order_by('-stars_required')
-        if levels.exists():
-            new_level = levels.first()
-            if progress.current_level != new_level:
-                progress.current_level = new_level
-                progress.save()
-                
-                # Начисляем бонусные звезды
-                instance.stars += new_level.bonus_stars
-                instance.save()
-                
-                # Создаем уведомление
-                Notification.objects.create(
-                    title=f"🎉 Достижение уровня {new_level.name}!",
-                    message=f"Поздравляем! Вы достигли уровня '{new_level.name}' и получили {new_level.bonus_stars} ⭐ бонуса!",
-                    is_active=True
-                )
\ No newline at end of file
+    levels.apply_changes([
+        StarChange(user_id=instance.user_id, group_id=instance.group_id, stars=instance.stars, amount=0, source='profile')
+    ])
+
+
+@receiver(stars_changed)
+def progress_on_stars_changed(sender, changes, **kwargs):
+    """Обновление прогресса после операций журнала звёзд (кроме самих бонусов)"""
+    levels.apply_changes([change for change in changes if change.source != 'level_bonus'])
+
+
+# Версии пользователей поднимаются последними, когда прогресс и агрегаты уже
+# обновлены: иначе шапка или блок прогресса могли бы закешироваться по новой
+# версии со старыми данными
+@receiver(post_save, sender=UserProfile)
+def bump_profile_version(sender, instance, **kwargs):
+    bump_user_versions([instance.user_id])
+
+
+@receiver(stars_changed)
+def bump_versions_on_stars_changed(sender, changes, **kwargs):
+    bump_user_versions(change.user_id for change in changes)
+
+
+@receiver([post_save, post_delete], sender=UserProgress)
+def bump_progress_version(sender, instance, **kwargs):
+    bump_user_versions([instance.user_id])
+
+
+@receiver(post_save, sender=User)
+def provision_user(sender, instance, created, raw=False, **kwargs):
+    """Профиль и прогресс создаются вместе с пользователем (bulk_create — без сигналов профиля)"""
+    if created and not raw:
+        provisioning.provision([instance.id])
+        leaderboard.record(instance.id, None, 0)
+        leaderboard.standings_changed()
+
+
+@receiver([post_save, post_delete], sender=Task)
+@receiver([post_save, post_delete], sender=Prize)
+@receiver([post_save, post_delete], sender=Level)
+@receiver([post_save, post_delete], sender=BattleType)
+@receiver([post_save, post_delete], sender=Season)
+def reset_catalog(sender, **kwargs):
+    """Справочники перечитываются после коммита, чтобы не закешировать старые данные"""
+    transaction.on_commit(lambda: catalog.invalidate_model(sender))
+
+
+@receiver([post_save, post_delete], sender=Notification)
+def reset_inbox_cache(sender, instance, **kwargs):
+    """Рассылки и правки уведомлений в админке сбрасывают кеш входящих"""
+    if instance.recipient_id is None:
+        inbox.broadcast_changed()
+    elif not kwargs.get('created'):
+        inbox.forget(instance.recipient_id)
+
+
+@receiver([post_save, post_delete], sender=Battle)
+@receiver([post_save, post_delete], sender=BattleResult)
+def bump_battles_version(sender, **kwargs):
+    bump_version(BATTLES_VERSION_KEY)
+
+
+@receiver([post_save, post_delete], sender=BattleResult)
+def publish_live_score(sender, instance, **kwargs):
+    battle_id = instance.battle_id
+    transaction.on_commit(lambda: live.hub.publish(battle_id))
@@ -1,3 +1,960 @@
-from django.test import TestCase
+"""
+Бюджеты запросов и задержки для всех страниц gamification.
 
-# Create your tests here.
+Набор данных (gamification/seeding.py) генерируется в объёме GAMIFICATION_BENCH_SCALE от «боевого»
+(1.0 = 10k пользователей, 1k батлов, 1M выполнений заданий; по умолчанию 0.01).
+Каждый URL из gamification/urls.py прогоняется через тестовый клиент
+GAMIFICATION_BENCH_REPEAT раз; число запросов к БД в тёплом прогоне
+сравнивается с бюджетом. p95 задержки зависит от машины, поэтому
+проверяется только при заданном GAMIFICATION_BENCH_LATENCY_FACTOR (множитель
+бюджетов). Если задан GAMIFICATION_BENCH_REPORT, туда пишется JSON-отчёт для
+сравнения между релизами.
+
+    GAMIFICATION_BENCH_SCALE=1 GAMIFICATION_BENCH_LATENCY_FACTOR=1 GAMIFICATION_BENCH_REPORT=bench.json \
+        python manage.py test gamification
+
+Ниже — поведенческие тесты движков: импорт, итоги батлов, выполнения
+заданий, покупки.
+"""
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import (
+    caching, completions, datalens, importer, inbox, jobs, leaderboard, ledger, levels, metrics, profiles, purchases,
+    rollups, routers, seasons, settlement,
+)
+from .middleware import STICKY_COOKIE, ReplicaMiddleware
+from .models import (
+    ActivityRollup, Battle, BattleResult, BattleType, Group, InboxItem, InboxState, Level, Notification,
+    PerformanceData, Prize, Purchase, Season, SeasonStanding, StarBalanceSnapshot, StarTransaction, Task,
+    TaskCompletion, UserProfile, UserProgress,
+)
+from .seeding import seed
+from .urls import urlpatterns
+
+SCALE = float(os.getenv('GAMIFICATION_BENCH_SCALE', '0.01'))
+REPEAT = int(os.getenv('GAMIFICATION_BENCH_REPEAT', '5'))
+# Без множителя задержка только попадает в отчёт: в CI она нестабильна
+LATENCY_FACTOR = float(os.getenv('GAMIFICATION_BENCH_LATENCY_FACTOR') or 0) or None
+REPORT_PATH = os.getenv('GAMIFICATION_BENCH_REPORT')
+
+# name: (метод, кто запрашивает, бюджет запросов, бюджет p95 в мс)
+# Для GET бюджет запросов — на худший тёплый прогон (первый прогревает кеши),
+# для POST — на худший из всех, включая первую запись.
+BUDGETS = {
+    'home': ('get', 'user', 2, 200),
+    'index': ('get', 'user', 2, 200),
+    'profile': ('get', 'user', 4, 300),
+    'complete_task': ('post', 'user', 15, 300),
+    'shop': ('get', 'user', 3, 200),
+    'purchase_prize': ('post', 'user', 12, 300),
+    'import_data': ('post', 'staff', 3, 200),
+    'battles': ('get', 'user', 6, 300),
+    'join_battle': ('post', 'user', 8, 300),
+    # Под тестовым клиентом (не ASGI) — JSON-снимок для опроса, закешированный до изменения результатов
+    'battle_live': ('get', 'user', 1, 200),
+    # Анонимам тёплая страница отдаётся целиком из кеша (cached_view)
+    'leaderboard': ('get', 'anon', 0, 300),
+    'notifications': ('get', 'user', 5, 300),
+    'logout': ('get', 'user', 4, 200),
+    'test_datalens': ('post', 'staff', 3, 200),
+    'profiling': ('get', 'staff', 2, 200),
+    # Prometheus с токеном METRICS_TOKEN
+    'metrics': ('get', 'scraper', 0, 200),
+}
+METRICS_TOKEN = 'test-metrics-token'
+
+
+def p95(samples):
+    if len(samples) < 2:
+        return samples[0]
+    return statistics.quantiles(samples, n=20, method='inclusive')[-1]
+
+
+@override_settings(METRICS_TOKEN=METRICS_TOKEN)
+class ViewBudgetTests(TestCase):
+    report = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        started = time.perf_counter()
+        data = seed(SCALE)
+        cls.seed_seconds = time.perf_counter() - started
+        cls.user = data['users'][0]
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+        cls.task = next(task for task in data['tasks'] if task.task_type == 'weekly')
+        cls.prize = data['prizes'][0]
+        cls.upcoming = next(b for b in data['battles'] if b.start_time > timezone.now())
+        cls.live = next(b for b in data['battles'] if b.start_time <= timezone.now() < b.end_time)
+
+    def setUp(self):
+        cache.clear()
+        levels.invalidate()
+        leaderboard.rebuild()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if REPORT_PATH:
+            with open(REPORT_PATH, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'scale': SCALE,
+                    'repeat': REPEAT,
+                    'seed_seconds': round(cls.seed_seconds, 2),
+                    'views': cls.report,
+                }, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    def url_for(self, name):
+        kwargs = {
+            'complete_task': {'task_id': self.task.id},
+            'purchase_prize': {'prize_id': self.prize.id},
+            'join_battle': {'battle_id': self.upcoming.id},
+            'battle_live': {'battle_id': self.live.id},
+        }.get(name, {})
+        return reverse(f'gamification:{name}', kwargs=kwargs)
+
+    def client_for(self, who):
+        client = Client()
+        if who == 'user':
+            client.force_login(self.user)
+        elif who == 'staff':
+            client.force_login(self.staff)
+        elif who == 'scraper':
+            client = Client(headers={'Authorization': f'Bearer {METRICS_TOKEN}'})
+        return client
+
+    def measure(self, name):
+        method, who, query_budget, latency_budget = BUDGETS[name]
+        url = self.url_for(name)
+        timings, query_counts = [], []
+        for _ in range(REPEAT):
+            client = self.client_for(who)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = getattr(client, method)(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            self.assertLess(response.status_code, 400, f'{name}: {response.status_code}')
+            query_counts.append(len(queries.captured_queries))
+
+        checked = query_counts[1:] if method == 'get' and len(query_counts) > 1 else query_counts
+        result = {
+            'url': url,
+            'queries_cold': query_counts[0],
+            'queries': max(checked),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(p95(timings), 2),
+            'budget_queries': query_budget,
+            'budget_p95_ms': latency_budget * LATENCY_FACTOR if LATENCY_FACTOR else None,
+        }
+        self.report[name] = result
+        return result
+
+    def test_every_url_has_budget(self):
+        names = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(names, set(BUDGETS))
+
+    def test_view_budgets(self):
+        for name in BUDGETS:
+            with self.subTest(view=name):
+                result = self.measure(name)
+                if result['budget_queries'] is not None:
+                    self.assertLessEqual(result['queries'], result['budget_queries'], result)
+                if result['budget_p95_ms'] is not None:
+                    self.assertLessEqual(result['p95_ms'], result['budget_p95_ms'], result)
+
+
+class ImportRetryTests(TestCase):
+    """Повтор упавшего импорта не начисляет звёзды дважды; зависшие задачи определяются по сигналу"""
+
+    def setUp(self):
+        for username in ('alpha', 'beta', 'gamma'):
+            User.objects.create_user(username)
+        PerformanceData.objects.create(kind=PerformanceData.KIND_IMPORT)
+        self.job = jobs.claim('worker-1')
+        self.lines = ['username,tasks,quality', 'alpha,10,0', 'beta,5,0', 'alpha,1,0', 'gamma,7,0']
+
+    def stars(self):
+        return dict(UserProfile.objects.values_list('user__username', 'stars'))
+
+    def test_retry_credits_only_the_remainder(self):
+        apply_bulk = importer.ledger.apply_bulk
+        calls = []
+
+        def fail_second_chunk(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('DataLens оборвал выгрузку')
+            return apply_bulk(*args, **kwargs)
+
+        with mock.patch.object(importer.ledger, 'apply_bulk', fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                importer.import_rows(self.lines, chunk_size=2, job_id=self.job.id)
+        self.assertEqual(self.stars(), {'alpha': 10, 'beta': 5, 'gamma': 0})
+
+        for _ in range(2):
+            importer.import_rows(self.lines, chunk_size=2, job_id=self.job.id)
+            self.assertEqual(self.stars(), {'alpha': 11, 'beta': 5, 'gamma': 7})
+
+    def test_summary_counts_rows_and_users_separately(self):
+        UserProfile.objects.filter(user__username='gamma').delete()
+        lines = [
+            'username,tasks,quality', 'alpha,3,0', 'ghost,2,0', 'beta,x,0', 'short', 'alpha,1,0', 'gamma,4,0',
+        ]
+        summary = importer.import_rows(lines)
+        self.assertEqual(
+            (summary.rows, summary.skipped, summary.processed, summary.unknown_users, summary.total_stars),
+            (6, 2, 1, 2, 4),
+        )
+
+    def test_requeue_only_silent_jobs(self):
+        self.assertEqual(jobs.requeue_stale(), 0)
+        PerformanceData.objects.filter(id=self.job.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+
+        taken_over = jobs.claim('worker-2')
+        self.assertFalse(jobs._claimed(self.job).exists())
+        self.assertTrue(jobs._claimed(taken_over).exists())
+
+
+class StubDataLens(BaseHTTPRequestHandler):
+    """IAM и выгрузка DataLens: считает запросы и TCP-соединения клиентов"""
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def reply(self, status, body, content_type='application/json'):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        with self.state['lock']:
+            self.state['iam'] += 1
+            token = f"token-{self.state['iam']}"
+        time.sleep(0.05)
+        self.reply(200, json.dumps({'iamToken': token, 'expiresAt': '2999-01-01T00:00:00Z'}))
+
+    def do_GET(self):
+        with self.state['lock']:
+            self.state['connections'].add(self.client_address)
+            self.state['exports'] += 1
+        if self.headers['Authorization'] in self.state['revoked']:
+            self.reply(401, 'revoked', 'text/plain')
+        else:
+            self.reply(200, 'username,tasks,quality\nalpha,1,2\n', 'text/csv')
+
+    def log_message(self, *args):
+        pass
+
+
+class DataLensClientTests(SimpleTestCase):
+    """Клиент DataLens против локальной заглушки: один запрос IAM, общий пул соединений"""
+
+    def setUp(self):
+        self.state = {'lock': threading.Lock(), 'iam': 0, 'exports': 0, 'connections': set(), 'revoked': set()}
+        handler = type('Handler', (StubDataLens,), {'state': self.state})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        base = f'http://127.0.0.1:{self.server.server_port}'
+        urls = override_settings(YANDEX_IAM_TOKEN_URL=f'{base}/iam', DATALENS_EXPORT_URL=f'{base}/export/{{dashboard_id}}')
+        urls.enable()
+        self.addCleanup(urls.disable)
+        for patch in (
+            mock.patch.dict(os.environ, {'DATALENS_DASHBOARD_ID': 'stub'}),
+            mock.patch.object(datalens, '_sign_jwt', return_value='signed'),
+            mock.patch.object(datalens, '_load_key', return_value={}),
+            mock.patch.object(datalens, 'token_provider', datalens.IamTokenProvider()),
+            mock.patch.object(datalens, '_session', None),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        cache.clear()
+
+    def test_concurrent_callers_share_one_token(self):
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(datalens.get_iam_token())) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.state['iam'], 1)
+        self.assertEqual(set(tokens), {'token-1'})
+
+    def test_exports_reuse_connection(self):
+        for _ in range(5):
+            with datalens.open_export() as response:
+                self.assertEqual(list(datalens.iter_export_lines(response))[1], 'alpha,1,2')
+        self.assertEqual(self.state['exports'], 5)
+        self.assertEqual(len(self.state['connections']), 1)
+
+    def test_revoked_token_is_refreshed_once(self):
+        self.state['revoked'].add('Bearer token-1')
+        with datalens.open_export() as response:
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.state['iam'], 2)
+
+
+class InboxCursorTests(SimpleTestCase):
+    def test_malformed_cursor_is_value_error(self):
+        for cursor in ('abc', '1-2-3', '99999999999999999999-1', '-99999999999999999999-1'):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                inbox.decode_cursor(cursor)
+
+
+class VersionTests(SimpleTestCase):
+    def test_lost_version_never_repeats(self):
+        versions = caching.store()
+        versions.clear()
+        seen = {caching.get_version('test:version')}
+        seen.add(caching.bump_version('test:version'))
+        versions.delete('test:version')
+        seen.add(caching.get_versions(['test:version'])[0])
+        versions.delete('test:version')
+        seen.add(caching.bump_version('test:version'))
+        self.assertEqual(len(seen), 4)
+
+    def test_file_versions_are_atomic_and_never_culled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = {
+                'BACKEND': 'gamification.caches.VersionFileCache',
+                'LOCATION': directory,
+                'TIMEOUT': None,
+                'OPTIONS': {'MAX_ENTRIES': 10},
+            }
+            with override_settings(CACHES={'default': backend, 'versions': backend}):
+                start = caching.get_version('test:version')
+
+                def bump():
+                    for _ in range(50):
+                        caching.bump_version('test:version')
+
+                threads = [threading.Thread(target=bump) for _ in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(caching.get_version('test:version'), start + 200)
+
+                keys = [caching.user_version_key(user_id) for user_id in range(50)]
+                caching.bump_versions(keys)
+                self.assertEqual(len(set(caching.get_versions(keys))), 1)
+                self.assertEqual(len(caching.store().get_many(keys)), 50)
+
+
+class MetricsFlushTests(SimpleTestCase):
+    def test_last_increments_reach_the_file(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            METRICS_DIR=directory, METRICS_FLUSH_INTERVAL=0.05
+        ):
+            metrics.flush()  # отложенная запись прошлых тестов
+            metrics.IMPORT_ROWS.inc(10)
+            metrics.IMPORT_SKIPPED.inc(3)
+            time.sleep(0.3)
+            written = {name: value for name, _, value in metrics._read(metrics._path(os.getpid()))}
+            for name in ('gamification_import_rows_total', 'gamification_import_skipped_total'):
+                self.assertEqual(written.get(name), metrics._values[(name, ())])
+
+    def test_dead_process_files_are_archived(self):
+        finished = subprocess.Popen(['true'])
+        finished.wait()
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            with open(os.path.join(directory, f'{finished.pid}.json'), 'w', encoding='utf-8') as f:
+                json.dump([['gamification_import_users_total', [], 7]], f)
+            metrics.IMPORT_USERS.inc()
+            metrics.flush()
+            own = metrics._values.get(('gamification_import_users_total', ()), 0)
+            for _ in range(2):
+                self.assertEqual(metrics.collect()[('gamification_import_users_total', ())], own + 7)
+            self.assertEqual(sorted(os.listdir(directory)), sorted([
+                metrics.ARCHIVE_NAME, metrics.LOCK_NAME, f'{os.getpid()}.json'
+            ]))
+
+    def test_export_requires_token(self):
+        url = reverse('gamification:metrics')
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(Client(REMOTE_ADDR='127.0.0.1').get(url).status_code, 404)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(Client().get(url).status_code, 404)
+            self.assertEqual(Client(headers={'Authorization': 'Bearer wrong'}).get(url).status_code, 404)
+            self.assertEqual(Client(headers={'Authorization': 'Bearer secret'}).get(url).status_code, 200)
+
+
+class SettlementTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        battle_type = BattleType.objects.create(name='Дуэль', stars_reward={'1': 30, '2': 20, '3': 10, 'x': 5})
+        self.battle = Battle.objects.create(
+            name='Финал', battle_type=battle_type, start_time=now - timedelta(hours=2), end_time=now - timedelta(hours=1)
+        )
+        self.users = {}
+        for username, score in (('first', 50), ('tied', 50), ('third', 40), ('last', 10)):
+            self.users[username] = User.objects.create_user(username)
+            BattleResult.objects.create(battle=self.battle, user=self.users[username], score=score)
+
+    def test_ties_share_place_and_skip_next(self):
+        settlement.settle(self.battle.id)
+        positions = dict(BattleResult.objects.values_list('user__username', 'position'))
+        self.assertEqual(positions, {'first': 1, 'tied': 1, 'third': 3, 'last': 4})
+
+    def test_rewards_credited_exactly_once(self):
+        outcome = settlement.settle(self.battle.id)
+        self.assertEqual((outcome.results, outcome.winners, outcome.stars_awarded), (4, 3, 70))
+        self.assertIsNone(settlement.settle(self.battle.id))
+
+        stars = dict(UserProfile.objects.values_list('user__username', 'stars'))
+        self.assertEqual(stars, {'first': 30, 'tied': 30, 'third': 10, 'last': 0})
+        self.assertEqual(StarTransaction.objects.filter(source='battle').count(), 3)
+        self.assertEqual(settlement.due(), [])
+
+    def test_only_credited_users_are_notified(self):
+        UserProfile.objects.filter(user=self.users['third']).delete()
+        outcome = settlement.settle(self.battle.id)
+        self.assertEqual((outcome.winners, outcome.stars_awarded), (2, 60))
+        notified = set(Notification.objects.filter(battle=self.battle).values_list('recipient__username', flat=True))
+        self.assertEqual(notified, {'first', 'tied'})
+
+    def test_running_battle_is_not_settled(self):
+        Battle.objects.filter(id=self.battle.id).update(end_time=timezone.now() + timedelta(hours=1))
+        self.assertIsNone(settlement.settle(self.battle.id))
+        self.assertFalse(StarTransaction.objects.filter(source='battle').exists())
+
+
+class CompletionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('worker')
+        self.daily = Task.objects.create(title='Ежедневное', stars_reward=3, task_type='daily')
+        self.weekly = Task.objects.create(title='Еженедельное', stars_reward=5, task_type='weekly')
+
+    def at(self, year, month, day, hour=12, minute=0):
+        return timezone.make_aware(datetime(year, month, day, hour, minute))
+
+    def stars(self):
+        return UserProfile.objects.get(user=self.user).stars
+
+    def test_period_keys(self):
+        self.assertEqual(completions.period_key('daily', date(2026, 10, 18)), '2026-10-18')
+        self.assertEqual(completions.period_key('one_time', date(2026, 10, 18)), 'once')
+        # ISO-неделя: воскресенье ещё в прошлой неделе, 30.12.2024 — уже первая неделя 2025 года
+        self.assertEqual(completions.period_key('weekly', date(2026, 10, 18)), '2026-W42')
+        self.assertEqual(completions.period_key('weekly', date(2026, 10, 19)), '2026-W43')
+        self.assertEqual(completions.period_key('weekly', date(2024, 12, 30)), '2025-W01')
+
+    def test_daily_boundary(self):
+        _, created = completions.complete(self.user, self.daily, now=self.at(2026, 10, 18, 0, 1))
+        self.assertTrue(created)
+        _, created = completions.complete(self.user, self.daily, now=self.at(2026, 10, 18, 23, 59))
+        self.assertFalse(created)
+        _, created = completions.complete(self.user, self.daily, now=self.at(2026, 10, 19, 0, 0))
+        self.assertTrue(created)
+        self.assertEqual(self.stars(), 6)
+
+    def test_weekly_boundary(self):
+        completions.complete(self.user, self.weekly, now=self.at(2026, 10, 12))
+        _, created = completions.complete(self.user, self.weekly, now=self.at(2026, 10, 18, 23, 59))
+        self.assertFalse(created)
+        _, created = completions.complete(self.user, self.weekly, now=self.at(2026, 10, 19, 0, 0))
+        self.assertTrue(created)
+        self.assertEqual(TaskCompletion.objects.filter(task=self.weekly).count(), 2)
+        self.assertEqual(self.stars(), 10)
+
+    def test_replay_of_same_submission(self):
+        completion, created = completions.complete(self.user, self.daily, 'form-1')
+        self.assertTrue(created)
+        replay, created = completions.complete(self.user, self.daily, 'form-1')
+        self.assertFalse(created)
+        self.assertEqual(replay.id, completion.id)
+        self.assertTrue(completions.is_replay(replay, 'form-1'))
+        self.assertFalse(completions.is_replay(replay, 'form-2'))
+        self.assertFalse(completions.is_replay(replay, ''))
+        self.assertEqual(self.stars(), 3)
+
+    def test_view_reports_replay_as_success(self):
+        client = Client()
+        client.force_login(self.user)
+        url = reverse('gamification:complete_task', kwargs={'task_id': self.daily.id})
+        for request_key, expected in (('form-1', 'Вы получили 3'), ('form-1', 'Вы получили 3'), ('form-2', 'сегодня')):
+            response = client.post(url, {'request_key': request_key}, follow=True)
+            self.assertIn(expected, ' '.join(str(message) for message in response.context['messages']))
+        self.assertEqual(self.stars(), 3)
+
+
+class LevelTests(TestCase):
+    def setUp(self):
+        group = Group.objects.create(name='Смена')
+        self.rookie = Level.objects.create(name='Новичок', group=group, stars_required=100, bonus_stars=100)
+        self.pro = Level.objects.create(name='Профи', group=group, stars_required=200, bonus_stars=10)
+        Level.objects.create(name='Мастер', group=group, stars_required=1000, bonus_stars=50)
+        levels.invalidate()
+        self.user = User.objects.create_user('climber')
+        UserProfile.objects.filter(user=self.user).update(group=group)
+
+    def apply(self, amount, source='adjustment'):
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.apply(self.user.id, amount, source)
+
+    def state(self):
+        stars = UserProfile.objects.get(user=self.user).stars
+        progress = UserProgress.objects.get(user=self.user)
+        bonuses = list(StarTransaction.objects.filter(user=self.user, source='level_bonus').values_list('amount', flat=True))
+        return stars, progress.current_level_id, progress.stars_earned, bonuses
+
+    def test_award_crosses_several_levels(self):
+        # 120 → «Новичок» (+100 = 220) → «Профи» (+10 = 230); до «Мастера» далеко
+        self.apply(120)
+        self.assertEqual(self.state(), (230, self.pro.id, 230, [110]))
+
+    def test_bonus_credited_once(self):
+        self.apply(120)
+        self.apply(5)
+        self.apply(50)
+        self.assertEqual(self.state(), (285, self.pro.id, 285, [110]))
+
+    def test_no_demotion_after_spending(self):
+        self.apply(120)
+        self.apply(-200, 'purchase')
+        self.assertEqual(self.state(), (30, self.pro.id, 30, [110]))
+        # Повторное прохождение порогов бонусов не даёт
+        self.apply(150)
+        self.assertEqual(self.state(), (180, self.pro.id, 180, [110]))
+
+    def test_bonus_does_not_retrigger_progress(self):
+        with mock.patch.object(levels, 'apply_changes', wraps=levels.apply_changes) as apply_changes:
+            self.apply(120)
+        batches = [call.args[0] for call in apply_changes.call_args_list if call.args[0]]
+        self.assertEqual([[change.source for change in batch] for batch in batches], [['adjustment']])
+        self.assertEqual(self.state()[3], [110])
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('holder')
+        self.other = User.objects.create_user('neighbour')
+        ledger.apply(self.user.id, 50, 'adjustment')
+        ledger.apply(self.other.id, 20, 'adjustment')
+
+    def stars(self, user):
+        return UserProfile.objects.get(user=user).stars
+
+    def test_overdraft_rejected_without_transaction(self):
+        with self.assertRaises(ledger.InsufficientStars):
+            ledger.apply(self.user.id, -60, 'purchase')
+        self.assertEqual(self.stars(self.user), 50)
+        self.assertEqual(StarTransaction.objects.filter(user=self.user).count(), 1)
+        ledger.apply(self.user.id, -50, 'purchase')
+        self.assertEqual(self.stars(self.user), 0)
+
+    def test_reconcile_reports_drift(self):
+        out = StringIO()
+        call_command('reconcile_stars', stdout=out)
+        self.assertIn('расхождений нет', out.getvalue())
+
+        UserProfile.objects.filter(user=self.other).update(stars=F('stars') + 5)
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('reconcile_stars', batch_size=1, stdout=out)
+        self.assertEqual(out.getvalue().strip(), f'user_id={self.other.id}: профиль 25 ⭐, журнал 20 ⭐')
+
+    def test_snapshot_plus_later_transactions_is_live_balance(self):
+        ledger.apply(self.user.id, -20, 'purchase')
+        call_command('snapshot_star_balances', stdout=StringIO())
+        snapshot = StarBalanceSnapshot.objects.get(user=self.user)
+        self.assertEqual(snapshot.balance, 30)
+
+        ledger.apply(self.user.id, 15, 'adjustment')
+        # Операции до снимка больше не читаются: баланс = снимок + то, что после него
+        StarTransaction.objects.filter(id__lte=snapshot.last_transaction_id).delete()
+        balances = ledger.ledger_balances([self.user.id, self.other.id])
+        self.assertEqual(balances, {self.user.id: 45, self.other.id: 20})
+        self.assertEqual(balances[self.user.id], self.stars(self.user))
+        self.assertEqual(ledger.ledger_balances([self.user.id], upto=snapshot.last_transaction_id), {self.user.id: 30})
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.group = Group.objects.create(name='Дежурные')
+        self.user = User.objects.create_user('active')
+        UserProfile.objects.filter(user=self.user).update(group=self.group)
+        self.task = Task.objects.create(title='Звонок', stars_reward=7, task_type='daily')
+        self.prize = Prize.objects.create(name='Блокнот', cost_in_stars=4)
+
+    def rows(self):
+        return {
+            (row.period, row.period_start): (row.completions, row.stars_earned, row.stars_spent, row.group_id)
+            for row in ActivityRollup.objects.filter(user=self.user)
+        }
+
+    def test_completion_and_purchase_update_every_period(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            completions.complete(self.user, self.task)
+        with self.captureOnCommitCallbacks(execute=True):
+            purchases.purchase(self.user, self.prize)
+        today = timezone.localdate()
+        expected = {
+            (period, rollups.period_start(period, today)): (1, 7, 4, self.group.id)
+            for period in rollups.PERIODS
+        }
+        self.assertEqual(self.rows(), expected)
+
+    def test_backfill_matches_live_totals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            completions.complete(self.user, self.task)
+            ledger.apply(self.user.id, 30, 'adjustment')
+        with self.captureOnCommitCallbacks(execute=True):
+            purchases.purchase(self.user, self.prize)
+        live = self.rows()
+        call_command('backfill_rollups', chunk_size=1, stdout=StringIO())
+        self.assertEqual(self.rows(), live)
+
+    def test_week_and_month_boundaries(self):
+        # Воскресенье 31 мая и понедельник 1 июня — разные недели и месяцы
+        sunday, monday = date(2026, 5, 31), date(2026, 6, 1)
+        change = ledger.StarChange(user_id=self.user.id, group_id=self.group.id, stars=0, amount=5, source='task')
+        rollups.record([change], day=sunday)
+        rollups.record([change], day=monday)
+        rollups.record([change], day=monday)
+        live = self.rows()
+        self.assertEqual(live, {
+            ('day', sunday): (1, 5, 0, self.group.id),
+            ('day', monday): (2, 10, 0, self.group.id),
+            ('week', date(2026, 5, 25)): (1, 5, 0, self.group.id),
+            ('week', monday): (2, 10, 0, self.group.id),
+            ('month', date(2026, 5, 1)): (1, 5, 0, self.group.id),
+            ('month', monday): (2, 10, 0, self.group.id),
+        })
+
+        # Перестройка по журналу раскладывает операции по тем же периодам
+        for day in (sunday, monday, monday):
+            entry = StarTransaction.objects.create(user=self.user, amount=5, source='task')
+            StarTransaction.objects.filter(id=entry.id).update(
+                created_at=timezone.make_aware(datetime(day.year, day.month, day.day, 12))
+            )
+        rollups.backfill()
+        self.assertEqual(self.rows(), live)
+
+
+class PurchaseTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer')
+        ledger.apply(self.user.id, 100, 'adjustment')
+        self.prize = Prize.objects.create(name='Кружка', cost_in_stars=60, stock=1)
+
+    def state(self):
+        self.prize.refresh_from_db()
+        stars = UserProfile.objects.get(user=self.user).stars
+        return stars, self.prize.stock, Purchase.objects.count(), StarTransaction.objects.filter(source='purchase').count()
+
+    def test_purchase_debits_and_reserves(self):
+        purchases.purchase(self.user, self.prize)
+        self.assertEqual(self.state(), (40, 0, 1, 1))
+
+    def test_insufficient_stars_changes_nothing(self):
+        expensive = Prize.objects.create(name='Ноутбук', cost_in_stars=500, stock=3)
+        with self.assertRaises(ledger.InsufficientStars):
+            purchases.purchase(self.user, expensive)
+        expensive.refresh_from_db()
+        self.assertEqual(expensive.stock, 3)
+        self.assertEqual(self.state(), (100, 1, 0, 0))
+
+    def test_out_of_stock_rolls_back_debit(self):
+        Prize.objects.filter(id=self.prize.id).update(stock=0)
+        with self.assertRaises(purchases.OutOfStock):
+            purchases.purchase(self.user, self.prize)
+        self.assertEqual(self.state(), (100, 0, 0, 0))
+
+    def test_last_item_sold_once(self):
+        other = User.objects.create_user('rival')
+        ledger.apply(other.id, 100, 'adjustment')
+        purchases.purchase(self.user, self.prize)
+        with self.assertRaises(purchases.OutOfStock):
+            purchases.purchase(other, self.prize)
+        self.assertEqual(UserProfile.objects.get(user=other).stars, 100)
+        self.assertEqual(self.state(), (40, 0, 1, 1))
+
+    def test_unlimited_prize_keeps_null_stock(self):
+        unlimited = Prize.objects.create(name='Стикер', cost_in_stars=10, stock=None)
+        purchases.purchase(self.user, unlimited)
+        purchases.purchase(self.user, unlimited)
+        unlimited.refresh_from_db()
+        self.assertIsNone(unlimited.stock)
+        self.assertEqual(UserProfile.objects.get(user=self.user).stars, 80)
+
+
+class ProvisioningTests(TestCase):
+    def test_new_user_gets_profile_and_progress(self):
+        user = User.objects.create_user('newcomer')
+        self.assertTrue(UserProfile.objects.filter(user=user).exists())
+        self.assertTrue(UserProgress.objects.filter(user=user).exists())
+
+    def test_sync_profiles_backfills_missing_rows(self):
+        users = User.objects.bulk_create([User(username=f'bulk{i}') for i in range(3)])
+        provisioned = User.objects.create_user('provisioned')
+        UserProgress.objects.filter(user=provisioned).delete()
+        call_command('sync_profiles', batch_size=2, stdout=StringIO())
+        for user in users + [provisioned]:
+            self.assertTrue(UserProfile.objects.filter(user=user).exists(), user)
+            self.assertTrue(UserProgress.objects.filter(user=user).exists(), user)
+        self.assertEqual(UserProfile.objects.count(), 4)
+
+
+class RankIndexTests(SimpleTestCase):
+    def test_matches_sorted_list(self):
+        rnd = random.Random(7)
+        with mock.patch.object(leaderboard.RankIndex, 'LOAD', 4):
+            index, expected = leaderboard.RankIndex(), {}
+            for _ in range(2000):
+                user_id = rnd.randint(1, 120)
+                if rnd.random() < 0.2:
+                    index.discard(user_id)
+                    expected.pop(user_id, None)
+                else:
+                    stars = rnd.randint(0, 30)
+                    index.set(user_id, stars)
+                    expected[user_id] = stars
+            ordered = sorted(expected.items(), key=lambda item: (-item[1], item[0]))
+            self.assertEqual(len(index), len(expected))
+            self.assertEqual([(e.user_id, e.stars) for e in index.top(len(expected) + 5)], ordered)
+            for user_id, stars in expected.items():
+                self.assertEqual(index.rank(user_id), sum(other > stars for other in expected.values()) + 1)
+
+    def test_ties_share_rank(self):
+        index = leaderboard.RankIndex()
+        for user_id, stars in ((1, 50), (2, 70), (3, 50), (4, 10)):
+            index.set(user_id, stars)
+        self.assertEqual([(e.rank, e.user_id) for e in index.top(10)], [(1, 2), (2, 1), (2, 3), (4, 4)])
+        self.assertEqual([(e.rank, e.user_id) for e in index.top(2)], [(1, 2), (2, 1)])
+        self.assertEqual(index.rank(3), 2)
+        self.assertIsNone(index.rank(99))
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.red, self.blue = Group.objects.create(name='Красные'), Group.objects.create(name='Синие')
+        self.users = {}
+        for name, group, stars in (('ann', self.red, 30), ('bob', self.blue, 50), ('cat', self.red, 30)):
+            user = User.objects.create_user(name)
+            UserProfile.objects.filter(user=user).update(group=group)
+            ledger.apply(user.id, stars, 'adjustment')
+            self.users[name] = user.id
+        leaderboard.rebuild()
+
+    def board(self, group=None):
+        return [(e.rank, e.user_id) for e in leaderboard.get_leaderboard().top(10, group and group.id)]
+
+    def test_top_rank_and_group_filter(self):
+        ann, bob, cat = self.users['ann'], self.users['bob'], self.users['cat']
+        self.assertEqual(self.board(), [(1, bob), (2, ann), (2, cat)])
+        self.assertEqual(self.board(self.red), [(1, ann), (1, cat)])
+        self.assertEqual(leaderboard.get_leaderboard().rank(cat), (2, 30, 3))
+        self.assertEqual(leaderboard.get_leaderboard().rank(cat, self.red.id), (1, 30, 2))
+        self.assertIsNone(leaderboard.get_leaderboard().rank(bob, self.red.id))
+
+    def test_live_updates_and_group_move(self):
+        ann, bob, cat = self.users['ann'], self.users['bob'], self.users['cat']
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.apply(cat, 25, 'adjustment')
+        profile = UserProfile.objects.get(user_id=bob)
+        profile.group = self.red
+        profile.save()
+        self.assertEqual(self.board(), [(1, cat), (2, bob), (3, ann)])
+        self.assertEqual(self.board(self.red), [(1, cat), (2, bob), (3, ann)])
+        self.assertEqual(self.board(self.blue), [])
+
+    def test_rebuild_after_invalidate(self):
+        ann = self.users['ann']
+        # update() минует сигналы: индекс процесса об этом не знает
+        UserProfile.objects.filter(user_id=ann).update(stars=500)
+        self.assertNotEqual(self.board()[0], (1, ann))
+        leaderboard.invalidate()
+        self.assertEqual(self.board()[0], (1, ann))
+
+
+@override_settings(REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    def call(self, path, cookie=None, write=False):
+        """Маршрут чтения внутри представления path и ответ ReplicaMiddleware"""
+        router, seen = routers.ReplicaRouter(), {}
+
+        def view(request):
+            middleware.process_view(request, None, (), {})
+            seen['before'] = router.db_for_read(UserProfile)
+            seen['session'] = router.db_for_read(Session)
+            if write:
+                router.db_for_write(UserProfile)
+                seen['after'] = router.db_for_read(UserProfile)
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(view)
+        request = RequestFactory().get(path)
+        request.resolver_match = resolve(path)
+        if cookie is not None:
+            request.COOKIES[STICKY_COOKIE] = cookie
+        with mock.patch('gamification.middleware.replica_configured', return_value=True):
+            return seen, middleware(request)
+
+    def test_listed_view_reads_from_replica(self):
+        seen, response = self.call(reverse('gamification:notifications'))
+        self.assertEqual(seen['before'], routers.REPLICA_ALIAS)
+        self.assertIsNone(seen['session'])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_other_views_read_from_primary(self):
+        seen, _ = self.call(reverse('gamification:profile'))
+        self.assertIsNone(seen['before'])
+
+    def test_write_pins_to_primary(self):
+        seen, response = self.call(reverse('gamification:notifications'), write=True)
+        self.assertIsNone(seen['after'])
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 10)
+        self.assertAlmostEqual(int(cookie.value), time.time() + 10, delta=2)
+
+    def test_sticky_cookie_expires(self):
+        path = reverse('gamification:notifications')
+        self.assertIsNone(self.call(path, cookie=str(int(time.time()) + 5))[0]['before'])
+        self.assertEqual(self.call(path, cookie=str(int(time.time()) - 1))[0]['before'], routers.REPLICA_ALIAS)
+        self.assertEqual(self.call(path, cookie='garbage')[0]['before'], routers.REPLICA_ALIAS)
+
+
+class InboxSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+
+    def sync(self):
+        """inbox.sync под роутером; True, если была запись"""
+        state = routers.RoutingState(use_replica=True)
+        token = routers.routing.set(state)
+        try:
+            inbox.sync(self.user)
+        finally:
+            routers.routing.reset(token)
+        return state.wrote
+
+    def test_read_without_new_broadcasts_does_not_write(self):
+        self.assertFalse(self.sync())
+        self.assertFalse(InboxState.objects.filter(user=self.user).exists())
+
+    def test_new_broadcast_is_fanned_out_once(self):
+        news = inbox.broadcast('Новость', 'Всем')
+        self.assertTrue(self.sync())
+        self.assertEqual(InboxState.objects.get(user=self.user).last_broadcast_id, news.id)
+        self.assertTrue(InboxItem.objects.filter(user=self.user, notification=news).exists())
+        self.assertFalse(self.sync())
+
+
+class ProfileProgressTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        group = Group.objects.create(name='Операторы')
+        self.first = Level.objects.create(name='Новичок', group=group, stars_required=100, bonus_stars=0)
+        Level.objects.create(name='Профи', group=group, stars_required=300, bonus_stars=0)
+        levels.invalidate()
+        self.user = User.objects.create_user('climber')
+        UserProfile.objects.filter(user=self.user).update(group=group)
+        self.group_id = group.id
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.apply(self.user.id, 50, 'adjustment')
+
+    def test_level_edit_refreshes_cached_block(self):
+        block = profiles.progress(self.user.id, self.group_id)
+        self.assertEqual((block['next_level']['name'], block['stars_left']), ('Новичок', 50))
+        self.assertEqual(profiles.progress(self.user.id, self.group_id), block)
+
+        self.first.name, self.first.stars_required = 'Стажёр', 80
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.save()
+        block = profiles.progress(self.user.id, self.group_id)
+        self.assertEqual((block['next_level']['name'], block['stars_left']), ('Стажёр', 30))
+
+
+class SeasonTests(TestCase):
+    def setUp(self):
+        self.red, self.blue = Group.objects.create(name='Север'), Group.objects.create(name='Юг')
+        self.season = Season.objects.create(
+            name='Сезон 04.2026–06.2026', start_date=date(2026, 4, 1), end_date=date(2026, 6, 30)
+        )
+        self.users = {}
+        changes = []
+        for name, group, stars in (('ann', self.red, 40), ('bob', self.blue, 40), ('cat', self.red, 25), ('dan', self.red, 0)):
+            user = User.objects.create_user(name)
+            UserProfile.objects.filter(user=user).update(group=group)
+            self.users[name] = user.id
+            changes.append(ledger.StarChange(user_id=user.id, group_id=group.id, stars=stars, amount=stars, source='task'))
+        rollups.record(changes, day=date(2026, 5, 15))
+        # После сезона, но до фиксации, cat переходит в другую группу
+        UserProfile.objects.filter(user_id=self.users['cat']).update(group=self.blue)
+        self.after = timezone.make_aware(datetime(2026, 7, 2, 9))
+
+    def standings(self):
+        return list(
+            SeasonStanding.objects.filter(season=self.season).order_by('rank', 'user_id')
+            .values_list('user_id', 'rank', 'stars', 'group_id')
+        )
+
+    def test_freeze_ranks_ties_with_current_groups(self):
+        ann, bob, cat = self.users['ann'], self.users['bob'], self.users['cat']
+        self.assertEqual(seasons.freeze(self.season.id, now=self.after), 3)
+        self.assertEqual(self.standings(), [
+            (ann, 1, 40, self.red.id),
+            (bob, 1, 40, self.blue.id),
+            (cat, 3, 25, self.blue.id),
+        ])
+        # В группе места пересчитываются среди её участников
+        self.assertEqual(
+            [(row.user_id, row.rank) for row in seasons.leaders(self.season.id, self.blue.id)], [(bob, 1), (cat, 2)]
+        )
+
+    def test_freeze_once_and_not_before_end(self):
+        self.assertIsNone(seasons.freeze(self.season.id, now=timezone.make_aware(datetime(2026, 6, 30, 23))))
+        self.assertEqual(seasons.freeze(self.season.id, now=self.after), 3)
+        frozen_at = Season.objects.get(id=self.season.id).frozen_at
+        self.assertIsNone(seasons.freeze(self.season.id, now=self.after + timedelta(days=1)))
+        self.assertEqual(len(self.standings()), 3)
+        self.assertEqual(Season.objects.get(id=self.season.id).frozen_at, frozen_at)
+
+    def test_leaderboard_season_period(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            seasons.freeze(self.season.id, now=self.after)
+        client = Client()
+        client.force_login(User.objects.get(id=self.users['dan']))
+        url = reverse('gamification:leaderboard')
+
+        response = client.get(url, {'period': f'season-{self.season.id}', 'group': self.blue.id})
+        self.assertEqual(response.context['season_id'], self.season.id)
+        self.assertEqual(
+            [(row.user_id, row.rank, row.stars) for row in response.context['leaders']],
+            [(self.users['bob'], 1, 40), (self.users['cat'], 2, 25)],
+        )
+        self.assertContains(response, f'value="season-{self.season.id}" selected')
+
+        # Незафиксированный или чужой сезон — общая таблица
+        response = client.get(url, {'period': f'season-{self.season.id + 1}'})
+        self.assertIsNone(response.context['season_id'])
+        self.assertIsNone(response.context['period'])
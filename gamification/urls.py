@@ -13,8 +13,11 @@ urlpatterns = [
     path('import-data/', views.import_performance_data, name='import_data'),
     path('battles/', views.battles, name='battles'),
     path('battle/join/<int:battle_id>/', views.join_battle, name='join_battle'),
+    path('battle/<int:battle_id>/live/', views.battle_live, name='battle_live'),
     path('leaderboard/', views.leaderboard, name='leaderboard'),
     path('notifications/', views.notifications, name='notifications'),
     path('logout/', views.custom_logout, name='logout'),
     path('test-datalens/', views.test_datalens_connection, name='test_datalens'),
+    path('profiling/', views.profiling_report, name='profiling'),
+    path('metrics/', views.metrics_export, name='metrics'),
 ]
\ No newline at end of file
@@ -1,101 +1,59 @@
-import os
-import csv
-import json
-import jwt
-import time
-import requests
+import hmac
+import uuid
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
 from django.contrib.auth import logout
 from django.contrib.auth.models import User
+from django.db.models import Count, Prefetch
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from . import catalog, completions, inbox, jobs, ledger, live, metrics, profiles, profiling, purchases, rollups, seasons
+from .caching import cached_view, get_version
+from .signals import BATTLES_VERSION_KEY, GROUPS_VERSION_KEY
+from .leaderboard import STANDINGS_VERSION_KEY, get_leaderboard
 from .models import (
-    Task, Prize, UserProfile, Battle, BattleResult,
-    Notification, Purchase, TaskCompletion, Level, UserProgress
+    Task, Prize, UserProfile, Battle, BattleResult, Group,
+    PerformanceData, ActivityRollup
 )
 
 
 @login_required
 def profile(request):
     """Личный кабинет"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
-    progress, created = UserProgress.objects.get_or_create(user=request.user)
-    purchased_prizes = Purchase.objects.filter(user=request.user).order_by('-purchased_at')[:5]
-    
-    # Рассчитываем прогресс до следующего уровня
-    next_level = None
-    progress_percent = 0
-    
-    if progress.current_level:
-        levels = Level.objects.filter(group=profile.group, stars_required__gt=progress.current_level.stars_required).order_by('stars_required')
-        if levels.exists():
-            next_level = levels.first()
-    else:
-        # Первый уровень
-        first_level = Level.objects.filter(group=profile.group).order_by('stars_required').first()
-        if first_level:
-            next_level = first_level
-    
-    # Рассчитываем процент прогресса
-    if next_level and next_level.stars_required > 0:
-        progress_percent = (progress.stars_earned / next_level.stars_required) * 100
-        progress_percent = min(progress_percent, 100)  # Не больше 100%
-    
+    page = profiles.load(request.user)
     return render(request, 'gamification/profile.html', {
-        'profile': profile,
-        'progress': progress,
-        'next_level': next_level,
-        'progress_percent': progress_percent,
-        'purchased_prizes': purchased_prizes
+        'profile': page.profile,
+        'progress': page.progress,
+        'purchased_prizes': page.purchases,
     })
 
 
+@cached_view(600)
 def home(request):
     """Главная страница — всегда отображается"""
-    active_notifications = Notification.objects.filter(is_active=True)[:3]
-    return render(request, 'gamification/home.html', {'notifications': active_notifications})
+    return render(request, 'gamification/home.html')
 
 
 def index(request):
     """Страница с заданиями"""
-    tasks = Task.objects.all()
-    return render(request, 'gamification/tasks.html', {'tasks': tasks})
+    tasks = catalog.get('tasks')
+    return render(request, 'gamification/tasks.html', {'tasks': tasks, 'request_key': uuid.uuid4().hex})
 
 
 @login_required
 def complete_task(request, task_id):
     task = get_object_or_404(Task, id=task_id)
-    profile = UserProfile.objects.get(user=request.user)
-    
-    # Проверяем, не выполнил ли пользователь это задание сегодня
-    today = timezone.now().date()
-    if TaskCompletion.objects.filter(
-        task=task,
-        user=request.user,
-        completed_at__date=today
-    ).exists() and task.task_type == 'daily':
-        messages.error(request, 'Вы уже выполнили это задание сегодня')
+    request_key = request.POST.get('request_key', '')
+
+    completion, created = completions.complete(request.user, task, request_key)
+    if created or completions.is_replay(completion, request_key):
+        messages.success(request, f'Вы получили {completion.stars_awarded} ⭐ за задание!')
     else:
-        # Начисляем звезды
-        profile.stars += task.stars_reward
-        profile.save()
-        
-        # Создаем запись о выполнении
-        TaskCompletion.objects.create(
-            task=task,
-            user=request.user,
-            stars_awarded=task.stars_reward
-        )
-        
-        # Уведомление
-        Notification.objects.create(
-            title=f"✅ Задание выполнено!",
-            message=f"Вы получили {task.stars_reward} ⭐ за задание '{task.title}'",
-            is_active=True
-        )
-        
-        messages.success(request, f'Вы получили {task.stars_reward} ⭐ за задание!')
+        messages.error(request, completions.PERIOD_MESSAGES.get(task.task_type, completions.PERIOD_MESSAGES['daily']))
     
     return redirect('gamification:index')
 
@@ -103,8 +61,8 @@ def complete_task(request, task_id):
 @login_required
 def shop(request):
     """Магазин призов"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
-    prizes = Prize.objects.all()
+    profile = UserProfile.objects.filter(user=request.user).first() or UserProfile(user=request.user)
+    prizes = catalog.get('prizes')
     return render(request, 'gamification/shop.html', {
         'prizes': prizes,
         'profile': profile
@@ -115,126 +73,26 @@ def shop(request):
 def purchase_prize(request, prize_id):
     """Покупка приза"""
     prize = get_object_or_404(Prize, id=prize_id)
-    profile = UserProfile.objects.get(user=request.user)
-
-    if profile.stars >= prize.cost_in_stars:
-        # Списываем звёзды
-        profile.stars -= prize.cost_in_stars
-        profile.save()
-        
-        # Создаём запись о покупке
-        Purchase.objects.create(user=request.user, prize=prize)
-        
+
+    try:
+        purchases.purchase(request.user, prize)
         messages.success(request, f'Вы успешно приобрели "{prize.name}"!')
-    else:
+    except ledger.InsufficientStars:
         messages.error(request, 'Недостаточно звёзд для покупки!')
+    except purchases.OutOfStock:
+        messages.error(request, f'Приз "{prize.name}" закончился')
 
     return redirect('gamification:shop')
 
 
-def get_iam_token():
-    """
-    Получение IAM-токена с использованием JSON-ключа из переменной окружения
-    """
-    key_json = os.getenv('YANDEX_CLOUD_SERVICE_ACCOUNT_KEY')
-    if not key_json:
-        raise Exception("YANDEX_CLOUD_SERVICE_ACCOUNT_KEY должна быть настроена в переменных окружения")
-    
-    try:
-        key_data = json.loads(key_json)
-    except json.JSONDecodeError:
-        raise Exception("Неверный формат ключа в переменной окружения")
-    
-    now = int(time.time())
-    payload = {
-        'iss': key_data['service_account_id'],
-        'aud': 'https://iam.api.cloud.yandex.net/iam/v1/tokens',  # ← пробелы удалены
-        'iat': now,
-        'exp': now + 3600
-    }
-    
-    headers = {
-        'kid': key_data['id']
-    }
-    
-    token = jwt.encode(payload, key_data['private_key'], algorithm='PS256', headers=headers)
-    
-    response = requests.post(
-        'https://iam.api.cloud.yandex.net/iam/v1/tokens',  # ← пробелы удалены
-        json={'jwt': token}
-    )
-    
-    if response.status_code == 200:
-        return response.json()['iamToken']
-    else:
-        raise Exception(f'Ошибка получения IAM-токена: {response.status_code} - {response.text}')
-
-
 @login_required
 def import_performance_data(request):
     if not request.user.is_staff:
         return redirect('gamification:home')
     
-    try:
-        iam_token = get_iam_token()
-        dashboard_id = os.getenv('DATALENS_DASHBOARD_ID')
-        if not dashboard_id:
-            raise Exception("DATALENS_DASHBOARD_ID не установлена в переменных окружения")
-        
-        headers = {
-            'Authorization': f'Bearer {iam_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        url = f'https://datalens.api.cloud.yandex.net/api/datalens/v1/dashboards/{dashboard_id}/export?format=csv'  # ← пробелы удалены
-        
-        response = requests.get(url, headers=headers, timeout=30)
-        
-        if response.status_code != 200:
-            raise Exception(f'Ошибка при получении данных: {response.status_code} - {response.text}')
-        
-        # Обработка CSV данных
-        csv_data = response.text
-        from io import StringIO
-        f = StringIO(csv_data)
-        reader = csv.reader(f)
-        next(reader)  # пропускаем заголовок
-        
-        summary = {
-            'processed': 0,
-            'total_stars': 0,
-            'skipped': 0
-        }
-        
-        for row in reader:
-            if len(row) < 3:
-                continue
-            username, tasks, quality = row[0], row[1], row[2]
-            try:
-                user = User.objects.get(username=username)
-                profile = UserProfile.objects.get(user=user)
-                stars = int(tasks) + int(quality) // 2
-                profile.stars += stars
-                profile.save()
-                summary['total_stars'] += stars
-                summary['processed'] += 1
-                Notification.objects.create(
-                    title="⭐ Звёзды начислены!",
-                    message=f"{user.get_full_name() or user.username} получил {stars} ⭐ за эффективность!",
-                    is_active=True
-                )
-            except User.DoesNotExist:
-                summary['skipped'] += 1
-                continue
-        
-        messages.success(request, f'Данные успешно обработаны! '
-                                 f'Обработано: {summary["processed"]} пользователей, '
-                                 f'начислено {summary["total_stars"]} звёзд. '
-                                 f'Пропущено: {summary["skipped"]}')
-        
-    except Exception as e:
-        messages.error(request, f'Ошибка при импорте данных: {str(e)}')
-    
+    job = jobs.enqueue(PerformanceData.KIND_IMPORT, user=request.user)
+    messages.success(request, f'Импорт поставлен в очередь (задача №{job.id}). '
+                              f'Ход выполнения — в разделе «Данные эффективности» админки.')
     return redirect('gamification:profile')
 
 
@@ -243,57 +101,56 @@ def test_datalens_connection(request):
     if not request.user.is_staff:
         return redirect('gamification:home')
     
-    try:
-        iam_token = get_iam_token()
-        dashboard_id = os.getenv('DATALENS_DASHBOARD_ID')
-        if not dashboard_id:
-            raise Exception("DATALENS_DASHBOARD_ID не установлена в переменных окружения")
-        
-        headers = {
-            'Authorization': f'Bearer {iam_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        url = f'https://datalens.api.cloud.yandex.net/api/datalens/v1/dashboards/{dashboard_id}/export?format=csv'  # ← пробелы удалены
-        
-        response = requests.get(url, headers=headers, timeout=30)
-        
-        if response.status_code == 200:
-            messages.success(request, '✅ Подключение к DataLens успешно!')
-            messages.info(request, f'Получено {len(response.text)} символов данных')
-        else:
-            messages.error(request, f'❌ Ошибка при получении данных: {response.status_code} — {response.text}')
-            
-    except Exception as e:
-        messages.error(request, f'❌ Ошибка: {str(e)}')
-    
+    job = jobs.enqueue(PerformanceData.KIND_TEST, user=request.user)
+    messages.info(request, f'Проверка подключения к DataLens поставлена в очередь (задача №{job.id})')
     return redirect('gamification:profile')
 
 
 def battles(request):
-    """Страница батлов"""
-    active_battles = Battle.objects.filter(
-        active=True, 
-        start_time__lte=timezone.now(),
-        end_time__gte=timezone.now()
-    )
-    upcoming_battles = Battle.objects.filter(
+    """Страница батлов: фиксированное число запросов при любом количестве батлов"""
+    now = timezone.now()
+    battle_list = Battle.objects.select_related('battle_type').annotate(participant_count=Count('participants'))
+    active_battles = list(battle_list.filter(
+        active=True,
+        start_time__lte=now,
+        end_time__gte=now
+    ))
+    upcoming_battles = list(battle_list.filter(
         active=True,
-        start_time__gt=timezone.now()
-    ).order_by('start_time')[:3]
+        start_time__gt=now
+    ).order_by('start_time')[:3])
+
+    # Блок завершённых батлов общий для всех и кешируется целиком: ленивый queryset
+    # выполняется, только если фрагмент приходится рисовать заново
+    state_version = get_version(BATTLES_VERSION_KEY)
     completed_battles = Battle.objects.filter(
         active=False,
-        end_time__lt=timezone.now()
-    ).order_by('-end_time')[:5]
+        end_time__lt=now
+    ).order_by('-end_time').prefetch_related(Prefetch(
+        'battleresult_set',
+        queryset=BattleResult.objects.select_related('user').order_by('-score')[:3],
+        to_attr='top_results',
+    ))[:5]
 
     if request.user.is_authenticated:
-        for battle in active_battles:
-            battle.user_result = battle.battleresult_set.filter(user=request.user).first()
+        battle_ids = [battle.id for battle in active_battles + upcoming_battles]
+        joined = set(Battle.participants.through.objects.filter(
+            user=request.user, battle_id__in=battle_ids
+        ).values_list('battle_id', flat=True))
+        scores = dict(BattleResult.objects.filter(
+            user=request.user, battle_id__in=[battle.id for battle in active_battles]
+        ).values_list('battle_id', 'score'))
+        for battle in active_battles + upcoming_battles:
+            battle.is_participant = battle.id in joined
+            battle.user_score = scores.get(battle.id)
 
     return render(request, 'gamification/battles.html', {
         'active_battles': active_battles,
         'upcoming_battles': upcoming_battles,
-        'completed_battles': completed_battles
+        'completed_battles': completed_battles,
+        'battles_version': state_version,
+        'live_stream': live.streaming(request),
+        'live_poll_ms': int(getattr(settings, 'LIVE_CLIENT_POLL_INTERVAL', 10) * 1000),
     })
 
 
@@ -303,9 +160,10 @@ def join_battle(request, battle_id):
     battle = get_object_or_404(Battle, id=battle_id)
     battle.participants.add(request.user)
     
-    Notification.objects.create(
-        title=f"Вы участвуете в батле {battle.name}",
-        message=f"Батл начнётся {battle.start_time.strftime('%d.%m в %H:%M')}",
+    inbox.notify(
+        request.user.id,
+        f"Вы участвуете в батле {battle.name}",
+        f"Батл начнётся {timezone.localtime(battle.start_time).strftime('%d.%m в %H:%M')}",
         battle=battle
     )
     
@@ -313,16 +171,129 @@ def join_battle(request, battle_id):
     return redirect('gamification:battles')
 
 
+async def battle_live(request, battle_id):
+    """Живое табло батла: поток Server-Sent Events со снимками топа или JSON-снимок для опроса"""
+    if not await Battle.objects.filter(id=battle_id).aexists():
+        raise Http404
+    if not live.streaming(request) or request.GET.get('format') == 'json':
+        version = await sync_to_async(get_version)(BATTLES_VERSION_KEY)
+        payload = await sync_to_async(live.snapshot)(battle_id, version)
+        return HttpResponse(payload, content_type='application/json')
+    response = StreamingHttpResponse(live.stream(battle_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+LEADERBOARD_PERIODS = {
+    ActivityRollup.PERIOD_WEEK: 'За неделю',
+    ActivityRollup.PERIOD_MONTH: 'За месяц',
+}
+
+
+@cached_view(30, versions=(STANDINGS_VERSION_KEY, GROUPS_VERSION_KEY))
 def leaderboard(request):
     """Таблица лидеров"""
-    leaders = UserProfile.objects.order_by('-stars')[:10]
-    return render(request, 'gamification/leaderboard.html', {'leaders': leaders})
+    groups = Group.objects.filter(is_active=True).only('id', 'name')
+    try:
+        group_id = int(request.GET['group'])
+    except (KeyError, ValueError):
+        group_id = None
+
+    period = request.GET.get('period')
+    past_seasons = catalog.get('seasons')
+    season = next((s for s in past_seasons if f"season-{s['id']}" == period), None)
+    my_rank = None
+    if season is not None:
+        # Прошлые сезоны — только из зафиксированных мест
+        leaders = seasons.leaders(season['id'], group_id)
+    elif period in LEADERBOARD_PERIODS:
+        # Лидеры недели или месяца — из агрегатов активности
+        leaders = rollups.leaders(period, group_id)
+    else:
+        period = None
+        board = get_leaderboard()
+        leaders = board.top(10, group_id)
+        users = User.objects.in_bulk([entry.user_id for entry in leaders])
+        for entry in leaders:
+            entry.user = users.get(entry.user_id)
+        leaders = [entry for entry in leaders if entry.user is not None]
+        if request.user.is_authenticated:
+            my_rank = board.rank(request.user.id, group_id)
+
+    return render(request, 'gamification/leaderboard.html', {
+        'leaders': leaders,
+        'groups': groups,
+        'group_id': group_id,
+        'period': period,
+        'periods': LEADERBOARD_PERIODS,
+        'seasons': past_seasons,
+        'season_id': season['id'] if season else None,
+        'my_rank': my_rank,
+    })
 
 
+@login_required
 def notifications(request):
-    """Уведомления"""
-    all_notifications = Notification.objects.filter(is_active=True).order_by('-created_at')
-    return render(request, 'gamification/notifications.html', {'notifications': all_notifications})
+    """Входящие уведомления с постраничной навигацией по курсору"""
+    try:
+        items, next_cursor = inbox.page(request.user, cursor=request.GET.get('cursor'))
+    except ValueError:
+        return redirect('gamification:notifications')
+    unread_ids = set(inbox.mark_read(request.user, items))
+    return render(request, 'gamification/notifications.html', {
+        'items': items,
+        'unread_ids': unread_ids,
+        'next_cursor': next_cursor,
+    })
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@login_required
+def profiling_report(request):
+    """Итоги профилирования этого процесса (только для сотрудников)"""
+    if not request.user.is_staff:
+        return redirect('gamification:home')
+
+    if request.method == 'POST':
+        profiling.reset()
+        return redirect('gamification:profiling')
+
+    stats, recent = profiling.snapshot()
+    views = sorted(
+        (
+            {
+                'name': name,
+                'requests': s.requests,
+                'wall_avg_ms': s.wall / s.requests * 1000,
+                'wall_max_ms': s.wall_max * 1000,
+                'sql_avg': s.sql_count / s.requests,
+                'sql_avg_ms': s.times['sql'] / s.requests * 1000,
+                'template_avg_ms': s.times['template'] / s.requests * 1000,
+                'signal_avg_ms': s.times['signal'] / s.requests * 1000,
+                'duplicate_requests': s.duplicate_requests,
+            }
+            for name, s in stats.items()
+        ),
+        key=lambda row: -row['wall_avg_ms'] * row['requests'],
+    )
+    return render(request, 'gamification/profiling.html', {
+        'views': views,
+        'recent': [sample for sample in recent if sample['duplicates']],
+        'sample_rate': settings.PROFILING_SAMPLE_RATE,
+        'duplicate_threshold': profiling.DUPLICATE_THRESHOLD,
+    })
+
+
+def metrics_export(request):
+    """Счётчики всех воркеров в формате Prometheus; только с токеном METRICS_TOKEN"""
+    token = settings.METRICS_TOKEN
+    given = request.headers.get('Authorization', '').encode()
+    if not token or not hmac.compare_digest(given, f'Bearer {token}'.encode()):
+        raise Http404
+    return HttpResponse(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 
 def custom_logout(request):
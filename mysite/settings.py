@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'gamification.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'gamification.middleware.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'mysite.urls'
@@ -62,6 +65,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'gamification.context_processors.notifications',
             ],
         },
     },
@@ -73,12 +77,93 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (по умолчанию, для небольших установок) или postgresql.
+# Данные из db.sqlite3 в PostgreSQL переносит команда copy_sqlite.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'gamification'),
+            'USER': os.getenv('DB_USER', 'gamification'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            # Постоянные соединения воркера с проверкой перед использованием
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
     }
-}
+    if os.getenv('DB_POOL_MAX_SIZE'):
+        # Пул psycopg внутри процесса; с пулом CONN_MAX_AGE должен быть 0
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Ждать блокировку записи, а не падать с "database is locked"
+                'timeout': float(os.getenv('SQLITE_TIMEOUT', '20')),
+                # Блокировка записи берётся в начале транзакции: без взаимных блокировок при повышении
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=134217728;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+        }
+    }
+
+# Реплика для чтения (необязательно): DB_REPLICA_HOST для PostgreSQL или
+# SQLITE_REPLICA_PATH — копия файла, которую обновляет внешний процесс
+if DB_ENGINE == 'postgresql' and os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+elif DB_ENGINE != 'postgresql' and os.getenv('SQLITE_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('SQLITE_REPLICA_PATH'),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['gamification.routers.ReplicaRouter']
+# Представления, которые читают с реплики (если она настроена)
+DATABASE_REPLICA_VIEWS = [
+    'gamification:home',
+    'gamification:index',
+    'gamification:leaderboard',
+    'gamification:notifications',
+    'gamification:battles',
+]
+# Сколько секунд после записи пользователь читает с основной БД
+REPLICA_STICKY_SECONDS = 10
+
+# Доля профилируемых запросов (0 — выключено); итоги на /profiling/
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+# Токен для /metrics (формат Prometheus): заголовок «Authorization: Bearer <токен>».
+# Адрес клиента не проверяется — за локальным nginx все запросы приходят с
+# 127.0.0.1. Без токена /metrics отвечает 404
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Каталог файлов метрик воркеров; файлы завершившихся процессов сливаются в archive.json
+METRICS_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR') or os.path.join(tempfile.gettempdir(), 'gamification-metrics')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1'))
 
 
 # Password validation
@@ -120,7 +205,7 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATIC_URL = '/static/'
 
 # Включение WhiteNoise для обслуживания статических файлов
-MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1, 'whitenoise.middleware.WhiteNoiseMiddleware')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type
@@ -133,4 +218,67 @@ LOGIN_REDIRECT_URL = 'gamification:profile'
 LOGOUT_REDIRECT_URL = 'login'
 
 YANDEX_CLOUD_SERVICE_ACCOUNT_KEY_PATH = os.path.join(BASE_DIR, 'gamification', 'keys', 'service-account-key.json')
-DATALENS_DASHBOARD_ID = 'pm0pl4fp0mq8a'
\ No newline at end of file
+DATALENS_DASHBOARD_ID = 'pm0pl4fp0mq8a'
+
+# Адреса Yandex Cloud можно переопределить, например, на локальный стаб-сервер
+YANDEX_IAM_TOKEN_URL = os.getenv('YANDEX_IAM_TOKEN_URL', 'https://iam.api.cloud.yandex.net/iam/v1/tokens')
+DATALENS_EXPORT_URL = os.getenv(
+    'DATALENS_EXPORT_URL',
+    'https://datalens.api.cloud.yandex.net/api/datalens/v1/dashboards/{dashboard_id}/export?format=csv',
+)
+# IAM-токен обновляется за столько секунд до истечения
+IAM_TOKEN_REFRESH_MARGIN = 300
+# Размер пула keep-alive соединений к DataLens
+DATALENS_POOL_SIZE = 10
+
+# Максимальный возраст индекса таблицы лидеров в процессе (секунды)
+LEADERBOARD_MAX_AGE = 30
+# Длина сезона таблицы лидеров в месяцах (gamification/seasons.py); 3 — квартал
+SEASON_MONTHS = int(os.getenv('SEASON_MONTHS', '3'))
+
+# Кеш общий для всех процессов: версии в нём сбрасывают справочники, уровни,
+# лидеров и блоки профиля во всех воркерах (команды manage.py тоже работают
+# через него). Версии живут в отдельном псевдониме versions: add и incr в нём
+# атомарны между процессами, а записи не вытесняются (gamification/caches.py,
+# проверка gamification.W001). С REDIS_URL оба псевдонима в Redis (нужен пакет
+# redis; политика вытеснения noeviction или volatile-* — у версий нет срока),
+# иначе файлы в CACHE_DIR на этой машине
+CACHE_DIR = os.getenv('CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'gamification-cache')
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'TIMEOUT': None,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(CACHE_DIR, 'data'),
+            # Запись просматривает каталог целиком, поэтому файлов держим немного;
+            # вытеснение данных безопасно — их ключи содержат версии
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        },
+        'versions': {
+            'BACKEND': 'gamification.caches.VersionFileCache',
+            'LOCATION': os.path.join(CACHE_DIR, 'versions'),
+            'TIMEOUT': None,
+        },
+    }
+# Сколько хранится версия справочника в общем кеше (gamification/catalog.py)
+CATALOG_CACHE_TIMEOUT = 3600
+
+# Живое табло батлов (gamification/live.py). Поток SSE включается только при
+# запуске под ASGI (mysite.asgi): под WSGI каждый зритель занимал бы воркер на
+# LIVE_STREAM_TIMEOUT секунд, поэтому там страница опрашивает JSON-снимок
+LIVE_STREAMING = os.getenv('LIVE_STREAMING', '') == '1'
+LIVE_CLIENT_POLL_INTERVAL = 10
+LIVE_COALESCE_INTERVAL = 0.5
+LIVE_POLL_INTERVAL = 2.0
+LIVE_STREAM_TIMEOUT = 300